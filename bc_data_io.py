@@ -14,6 +14,7 @@ import pytz
 import zipfile
 import pickle
 import json
+import copy
 import os
 
 # data source
@@ -34,10 +35,23 @@ from email.mime.application import MIMEApplication
 # self defined
 from quant import bc_util as util
 
+# parquet engine for the stock data cache (pyarrow or fastparquet), the cache is skipped when neither is available
+try:
+  import pyarrow
+  parquet_engine = 'pyarrow'
+except ImportError:
+  try:
+    import fastparquet
+    parquet_engine = 'fastparquet'
+  except ImportError:
+    parquet_engine = None
+
 # global variables
 est_tz = pytz.timezone('US/Eastern')
 utc_tz = pytz.timezone('UTC')
 default_eod_key = 'OeAFFmMliFG5orCUuwAKQ8l4WWFQ67YX'
+# parsed config files: (file_path, file_name) -> (mtime, config)
+cached_configs = {}
 headers = {
     'User-Agent':'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.164 Safari/537.36',
   }
@@ -1434,8 +1448,11 @@ def load_stock_data(file_path, file_name, file_format='.csv', time_col='Date', s
       print(f'{file_name} not exists')
 
     else:
-      # load file
-      df = pd.read_csv(file_name, encoding='utf8', engine='python')
+      # load file (with pyarrow engine if available, otherwise with c engine)
+      try:
+        df = pd.read_csv(file_name, encoding='utf8', engine='pyarrow')
+      except (ImportError, ValueError):
+        df = pd.read_csv(file_name, encoding='utf8', engine='c')
       
       # transform dataframe to timeseries
       df = util.df_2_timeseries(df=df, time_col=time_col)
@@ -1454,6 +1471,56 @@ def load_stock_data(file_path, file_name, file_format='.csv', time_col='Date', s
   return df
 
 
+def load_stock_data_cached(file_path, file_name, file_format='.csv', time_col='Date', standard_columns=False):
+  """
+  load stock data (dataframe) from a .parquet copy of the .csv file, the copy is written next to the .csv file (<file_path><file_name>.parquet) and (re)created when missing or older than the .csv file. Without a parquet engine (pyarrow or fastparquet) data is loaded from the .csv file directly
+
+  :param file_path: to where the file will be save to
+  :param file_name: name of the file to save
+  :param file_format: default is .csv
+  :param time_col: column name of the time col, default is Date
+  :param standard_columns: whether to return dataframe with standard columns (OHLCV, Adj Close, Dividend, Split)
+  :returns: dataframe with sorted index
+  :raises: none
+  """
+  # for chinese stocks
+  splited = file_name.split('.')
+  if len(splited) ==2 and splited[1] in ['SHG', 'SS', 'SHE', 'SZ']:
+    file_name = splited[0]
+
+  # load from source file directly when no parquet engine is available
+  if parquet_engine is None:
+    return load_stock_data(file_path=file_path, file_name=file_name, file_format=file_format, time_col=time_col, standard_columns=standard_columns, sort_index=True)
+
+  # contruct filenames
+  source_file = f'{file_path}{file_name}{file_format}'
+  cache_file = f'{file_path}{file_name}.parquet'
+
+  # read data from cache file if it is up to date
+  df = None
+  try:
+    if os.path.exists(source_file) and os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(source_file):
+      df = pd.read_parquet(cache_file, engine=parquet_engine)
+  except Exception as e:
+    df = None
+    print(e)
+
+  # otherwise read data from source file and refresh cache file
+  if df is None:
+    df = load_stock_data(file_path=file_path, file_name=file_name, file_format=file_format, time_col=time_col, standard_columns=False, sort_index=True)
+    if df is not None:
+      try:
+        df.to_parquet(cache_file, engine=parquet_engine, compression='zstd')
+      except Exception as e:
+        print(e)
+
+  # select standard columns
+  if df is not None and standard_columns:
+    df = df[['Open', 'High', 'Low', 'Close', 'Volume', 'Adj Close', 'Dividend', 'Split']].copy()
+
+  return df
+
+
 def remove_stock_data(symbol, file_path, file_format='.csv'):
   '''
   Remove stock data file from drive
@@ -1970,6 +2037,40 @@ def read_config(file_path, file_name):
   return config_dict
 
 
+def read_config_cached(file_path, file_name):
+  """
+  Read config from a specific file, reuse the parsed result until the file is modified (one cached config per file)
+
+  :param file_path: the path to save the file
+  :param file_name: the name of the file
+  :returns: a copy of config dict
+  :raises: None
+  """
+  try:
+    mtime = os.path.getmtime(file_path + file_name)
+  except OSError:
+    mtime = None
+
+  # re-read the file when it is not cached or modified since it was cached
+  cache_key = (file_path, file_name)
+  cached = cached_configs.get(cache_key)
+  if cached is None or cached[0] != mtime:
+    cached = (mtime, read_config(file_path=file_path, file_name=file_name))
+    cached_configs[cache_key] = cached
+
+  return copy.deepcopy(cached[1])
+
+
+def clear_config_cache():
+  """
+  Clear cached results of read_config_cached
+
+  :returns: None
+  :raises: None
+  """
+  cached_configs.clear()
+
+
 def add_config(config_key, config_value, file_path, file_name, print=False):
   """
   Add a new config in to the config file
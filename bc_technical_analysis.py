@@ -5,20 +5,42 @@ Technical Analysis Calculation and Visualization functions
 :author: Beichen Chen
 """
 import os
+import ast
 import math
 import sympy
 import datetime
+import itertools
 import ta
 import numpy as np
 import pandas as pd
 import mplfinance as mpf
+import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.ticker import FuncFormatter
 from scipy.stats import linregress
-from numpy.lib.stride_tricks import as_strided
+from scipy.signal import lfilter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from matplotlib import gridspec
 from matplotlib.lines import Line2D
 from matplotlib.patches import Rectangle
+from matplotlib.collections import PolyCollection, LineCollection
+
+# optional jit compilation
+try:
+  from numba import njit
+except ImportError:
+  # run jit kernels as plain python functions when numba is not installed
+  def njit(*args, **kwargs):
+    if len(args) == 1 and callable(args[0]) and len(kwargs) == 0:
+      return args[0]
+    return lambda func: func
+
+# optional native moving window reductions
+try:
+  import bottleneck as bn
+except ImportError:
+  bn = None
 
 # from mplfinance.original_flavor import candlestick_ohlc
 from quant import bc_util as util
@@ -32,6 +54,14 @@ plt.rcParams['axes.unicode_minus'] = False
 default_ohlcv_col = {'close':'Close', 'open':'Open', 'high':'High', 'low':'Low', 'volume':'Volume'}
 default_trend_val = {'pos_trend':'u', 'neg_trend':'d', 'none_trend':'', 'wave_trend':'n'}
 default_signal_val = {'pos_signal':'b', 'neg_signal':'s', 'none_signal':'', 'wave_signal': 'n'}
+default_trend_dtype = pd.CategoricalDtype(['', 'n', 'u', 'd'])
+default_signal_dtype = pd.CategoricalDtype(['', 'n', 'b', 's'])
+
+# description columns are arrow backed strings when pyarrow is available
+try:
+  default_description_dtype = pd.StringDtype('pyarrow')
+except ImportError:
+  default_description_dtype = pd.StringDtype()
 
 # default indicators and dynamic trend for calculation
 default_indicators = {'trend': ['ichimoku', 'kama', 'adx'], 'volume': [], 'volatility': ['bb'], 'other': []}
@@ -40,8 +70,17 @@ default_support_resistant_col = ['kama_fast', 'kama_slow', 'tankan', 'kijun', 'c
 
 # default arguments for visualization
 default_candlestick_color = {'color_up':'green', 'color_down':'red', 'shadow_color':'black', 'entity_edge_color':'black', 'alpha':0.8}
+
+# palette for color codes of bars/scatters (0: down, 1: up, 2: flat)
+default_color_palette = np.array(['red', 'green', 'orange'])
 default_plot_args = {'figsize':(30, 3), 'title_rotation':'vertical', 'xaxis_position': 'bottom', 'yaxis_position': 'right', 'title_x':-0.01, 'title_y':0.2, 'bbox_to_anchor':(1.02, 0.), 'loc':3, 'ncol':1, 'borderaxespad':0.0}
 
+# default arguments for subplots in plot_multiple_indicators (overridden by args of each subplot)
+default_subplot_args = {
+  'target_indicator':['price'], 'candlestick_color':default_candlestick_color, 'target_col':None, 'alpha':1, 'color_mode':None, 
+  'signal_list':None, 'signal_x':None, 'signal_y':None, 'trend_val':default_trend_val, 'signal_val':default_signal_val, 
+  'plot_price_in_twin_ax':False, 'benchmark':None, 'boundary':None, 'plot_in_date':True, 'max_points':None, 'minimal':False, 'plot_lines':False}
+
 # zorders
 default_zorders = {}
 counter = 1
@@ -53,7 +92,7 @@ for item in ['default', 'price', 'kama', 'ichimoku', 'renko', 'candle_pattern',
 # load configuration
 def load_config(root_paths):
   """ 
-  Load configuration from json file
+  Load configuration from json file, files are only re-read after they are modified (see io_util.clear_config_cache)
 
   :param root_paths: a dictionary that contains home_path and git_path (differ by platforms)
   :returns: dictionary of config arguments
@@ -80,19 +119,19 @@ def load_config(root_paths):
   config['result_path'] = config['quant_path']  +   'ta_model/'   # results of script execution
   
   # load self-defined pools (lists of stock symbols)
-  config['selected_sec_list'] = io_util.read_config(file_path=config['config_path'], file_name='selected_sec_list.json')
+  config['selected_sec_list'] = io_util.read_config_cached(file_path=config['config_path'], file_name='selected_sec_list.json')
 
   # load data api
-  config['api_key'] = io_util.read_config(file_path=config['api_path'], file_name='api_key.json')
+  config['api_key'] = io_util.read_config_cached(file_path=config['api_path'], file_name='api_key.json')
 
   # load calculation and visulization parameters
-  ta_config = io_util.read_config(file_path=config['config_path'], file_name='ta_config.json')
+  ta_config = io_util.read_config_cached(file_path=config['config_path'], file_name='ta_config.json')
   config.update(ta_config)
 
   return config
 
 # load locally saved data(sec_data, ta_data, results)
-def load_data(target_list, config, interval='day', load_empty_data=False, load_derived_data=False):
+def load_data(target_list, config, interval='day', load_empty_data=False, load_derived_data=False, max_workers=None):
   """ 
   Load locally saved data(sec_data, ta_data, results)
   
@@ -101,6 +140,7 @@ def load_data(target_list, config, interval='day', load_empty_data=False, load_d
   :param interval: data interval
   :param load_empty_data: whether to load empyt data dict
   :param load_derived_data: whether to load ta_data, result, final_result besides sec_data
+  :param max_workers: number of threads used to load sec data (None for default)
   :returns: dictionary of data load from local files
   :raises: None
   """
@@ -112,16 +152,23 @@ def load_data(target_list, config, interval='day', load_empty_data=False, load_d
     data['ta_data'][ti] = {}
     data['result'][ti] = {}
 
-  # load sec data (data_path/[symbol].csv)
+  # load sec data (data_path/[symbol].csv, through its .parquet copy), files are read in parallel since it is I/O bound
   if not load_empty_data:
     data_path = config['data_path']
-    for target in target_list:
-      ti = f'{target}_{interval}'
-      for symbol in target_list[target]:
-        if os.path.exists(data_path+f'{symbol.split(".")[0]}.csv'):
-          data['sec_data'][ti][f'{symbol}_day'] = io_util.load_stock_data(file_path=data_path, file_name=symbol, standard_columns=True)
-        else:
-          data['sec_data'][ti][f'{symbol}_day'] = None
+
+    def load_symbol(symbol):
+      if os.path.exists(data_path+f'{symbol.split(".")[0]}.csv'):
+        return io_util.load_stock_data_cached(file_path=data_path, file_name=symbol, standard_columns=True)
+      return None
+
+    if max_workers is None:
+      max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      for target in target_list:
+        ti = f'{target}_{interval}'
+        symbols = target_list[target]
+        for symbol, symbol_data in zip(symbols, executor.map(load_symbol, symbols)):
+          data['sec_data'][ti][f'{symbol}_day'] = symbol_data
 
     # load derived data (quant_path/[ta_data/result].pkl)
     if load_derived_data:
@@ -140,13 +187,14 @@ def load_data(target_list, config, interval='day', load_empty_data=False, load_d
 
 # ================================================ Core progress ==================================================== # 
 # preprocess stock data (OHLCV)
-def preprocess(df, symbol, print_error=True):
+def preprocess(df, symbol, print_error=True, copy=True):
   '''
   Preprocess stock data (OHLCV)
 
   :param df: downloaded stock data
   :param symbol: symbol of stock
   :param print_error: whether print error information or not
+  :param copy: whether to copy df, set to False only when the caller owns df (it will be modified in place)
   :returns: preprocessed dataframe
   :raises: None
   '''
@@ -156,44 +204,36 @@ def preprocess(df, symbol, print_error=True):
     return None
 
   # drop duplicated rows, keep the first
-  df = util.remove_duplicated_index(df=df, keep='first')
+  if copy or df.index.has_duplicates:
+    df = util.remove_duplicated_index(df=df, keep='first')
 
   # adjust close price manually (if split not updated)
-  adj_rate = 1
-  df['split_n1'] = df['Split'].shift(-1).fillna(1.0)
-  df['adj_close_p1'] = df['Adj Close'].shift(1)
-  df['adj_rate'] = df['adj_close_p1'] / df['Adj Close']
-  df = df.sort_index(ascending=False)
-  for idx, row in df.iterrows():
-    df.loc[idx, 'Adj Close'] *= adj_rate
-    if row['Split'] != 1.0:
-      if row['adj_rate'] >= 1.95 or row['adj_rate'] <= 0.45:
-        adj_rate = 1/row['Split']
-    elif row['split_n1'] != 1.0:
-      if row['adj_rate'] >= 1.95 or row['adj_rate'] <= 0.45:
-        adj_rate = 1/row['split_n1']
-  df = df.sort_index()
-  df.drop(['adj_rate', 'adj_close_p1', 'split_n1'], axis=1, inplace=True)
+  # a split event (on the row or the next row) with abnormal adj_rate sets the rate for all earlier rows, until an earlier event
+  if not df.index.is_monotonic_increasing:
+    df = df.sort_index()
+  split = df['Split'].values
+  split_n1 = df['Split'].shift(-1).fillna(1.0).values
+  adj_rate = df['Adj Close'].shift(1).values / df['Adj Close'].values
+  event_split = np.where(split != 1.0, split, split_n1)
+  is_event = (event_split != 1.0) & ((adj_rate >= 1.95) | (adj_rate <= 0.45))
+  event_rate = pd.Series(np.where(is_event, 1 / event_split, np.nan), index=df.index)
+  event_rate = event_rate.shift(-1).bfill().fillna(1.0).values
+  df['Adj Close'] = df['Adj Close'].values * event_rate
 
   # adjust open/high/low/close/volume values
-  adj_rate = df['Adj Close'] / df['Close']
-  for col in ['High', 'Low', 'Open', 'Close']:
-    df[col] = df[col] * adj_rate
+  adj_rate = df['Adj Close'].to_numpy(dtype=np.float64) / df['Close'].to_numpy(dtype=np.float64)
+  price_cols = ['High', 'Low', 'Open', 'Close']
+  df[price_cols] = df[price_cols].to_numpy(dtype=np.float64) * adj_rate[:, None]
 
   # process NA and 0 values
   max_idx = df.index.max()
-  na_cols = []
-  zero_cols = []
   error_info = ''
 
   # check whether 0 or NaN values exists in the latest record
   extra_cols = ['Split', 'Dividend']
-  cols = [x for x in df.columns if x not in extra_cols]
-  for col in cols:
-    if df.loc[max_idx, col] == 0:
-      zero_cols.append(col)
-    if np.isnan(df.loc[max_idx, col]):
-      na_cols.append(col)
+  last_row = df.loc[max_idx].drop(labels=extra_cols, errors='ignore')
+  zero_cols = last_row.index[last_row.values == 0].tolist()
+  na_cols = last_row.index[pd.isna(last_row.values)].tolist()
     
   # process NaN values
   if len(na_cols) > 0:
@@ -222,12 +262,14 @@ def preprocess(df, symbol, print_error=True):
   return df
 
 # calculate indicators according to definition
-def calculate_ta_basic(df, indicators=default_indicators):
+def calculate_ta_basic(df, indicators=default_indicators, max_workers=1, copy=True):
   '''
   Calculate indicators according to definition
 
   :param df: preprocessed stock data
   :param indicators: dictionary of different type of indicators to calculate
+  :param max_workers: number of threads used to calculate indicators, 1 (default) calculates them one by one, None for the default thread pool size
+  :param copy: whether to copy df, set to False only when the caller owns df (it will be modified in place)
   :returns: dataframe with technical indicator columns
   :raises: None
   '''
@@ -237,31 +279,55 @@ def calculate_ta_basic(df, indicators=default_indicators):
     return None  
 
   # copy dataframe
-  df = df.copy()
+  if copy:
+    df = df.copy()
 
   # indicator calculation
   indicator = None
   try:
     # calculate close change rate
     phase = 'calculate close rate' 
-    df = cal_change_rate(df=df, target_col=default_ohlcv_col['close'], add_accumulation=False)
+    df = cal_change_rate(df=df, target_col=default_ohlcv_col['close'], add_accumulation=False, copy=False)
     
     # calculate candlestick features
     phase = 'calculate candlestick' 
     df = add_candlestick_features(df=df)
 
-    # add indicator features
+    # collect indicators to calculate
     phase = 'calculate indicators' 
     indicator_calculated = []
     for i in indicators.keys():
       tmp_indicators = indicators[i]
       for indicator in tmp_indicators:
         if indicator not in indicator_calculated:
-          df = eval(f'add_{indicator}_features(df=df)')
           indicator_calculated.append(indicator)
         else:
           print(f'{indicator} already calculated!')
 
+    # add indicator features one by one (default)
+    if max_workers == 1:
+      for indicator in indicator_calculated:
+        feature_func = indicator_features.get(indicator)
+        if feature_func is None:
+          raise KeyError(f'no feature function for {indicator}')
+        df = feature_func(df=df)
+
+    # or calculate them in parallel, each on its own copy of the base dataframe (some feature functions modify df in place)
+    else:
+      base_columns = df.columns
+      with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for indicator in indicator_calculated:
+          feature_func = indicator_features.get(indicator)
+          if feature_func is None:
+            raise KeyError(f'no feature function for {indicator}')
+          futures.append((indicator, executor.submit(feature_func, df=df.copy())))
+        for indicator, future in futures:
+          tmp_df = future.result()
+          new_columns = [col for col in tmp_df.columns if col not in base_columns]
+          df[new_columns] = tmp_df[new_columns]
+          df.attrs.update(tmp_df.attrs)
+
   except Exception as e:
     print(f'[Exception]: @ {phase} - {indicator}, {e}')
 
@@ -282,6 +348,12 @@ def calculate_ta_static(df, indicators=default_indicators):
     print(f'No data for calculate_ta_static')
     return None
   
+  # indicators to calculate trend for, by type
+  trend_set = set(indicators.get('trend', []))
+  volume_set = set(indicators.get('volume', []))
+  volatility_set = set(indicators.get('volatility', []))
+  other_set = set(indicators.get('other', []))
+
   # trend calculation
   try:
     phase = 'calculate trend for trend_indicators'
@@ -292,7 +364,7 @@ def calculate_ta_static(df, indicators=default_indicators):
       'kama': {'fast': 'kama_fast', 'slow': 'kama_slow'}}
 
     for target_indicator in ['ichimoku', 'kama']:
-      if target_indicator in indicators['trend']:
+      if target_indicator in trend_set:
 
         # fast/slow line column names
         fl = lines[target_indicator]['fast']
@@ -306,31 +378,34 @@ def calculate_ta_static(df, indicators=default_indicators):
 
         # distance and distance change(normalized by slow_line)
         df[distance] = df[fl] - df[sl]
-        df[distance_change] = df[distance] - df[distance].shift(1)
+        df[distance_change] = prev_diff(df[distance].values)
         df[distance] = df[distance] / df[sl]
         df[distance_change] = df[distance_change] / df[sl]
 
         # fl/sl change rate and fl & Close, sl & Close crossover
         rate_threshold = 0.001
         for col in [fl, sl]:
-          df = cal_change_rate(df=df, target_col=col, periods=1, add_accumulation=False, add_prefix=col, drop_na=False)
+          df = cal_change_rate(df=df, target_col=col, periods=1, add_accumulation=False, add_prefix=col, drop_na=False, copy=False)
           df[f'{col}_day'] = cal_crossover_signal(df=df, fast_line='Close', slow_line=col, pos_signal=1, neg_signal=-1, none_signal=0)
           df[f'{col}_day'] = sda(series=df[f'{col}_day'], zero_as=1)
 
         # fl & sl crossover  
         fs_day = f'{target_indicator}_fs_day'
-        df[fs_day] = cal_crossover_signal(df, fast_line=fl, slow_line=sl, result_col=fs_day, pos_signal='u', neg_signal='d', none_signal='n')
-        df[fs_day] = df[fs_day].replace({'u':1, 'd':-1, 'n':0})
+        df[fs_day] = cal_crossover_signal(df, fast_line=fl, slow_line=sl, result_col=fs_day, pos_signal=1, neg_signal=-1, none_signal=0)
         df[fs_day] = sda(series=df[fs_day], zero_as=1)
 
         # distance signal
         distance_change_threshold = 0.001
         fl_rate_threshold = {'ichimoku': 0.01, 'kama': 0.001}[target_indicator]
         sl_rate_threshold = {'ichimoku': 0, 'kama': 0}[target_indicator]
+        distance_value = df[distance].values
+        distance_change_value = df[distance_change].values
+        fl_rate = df[f'{fl}_rate'].values
+        sl_rate = df[f'{sl}_rate'].values
         conditions = {
-          'up': f'({distance} != 0 and {distance_change} > {distance_change_threshold} and {fl}_rate > {fl_rate_threshold}) or ({fl}_rate > 0 and {sl}_rate > 0)',
-          'down': f'({distance} != 0 and {distance_change} < {-distance_change_threshold} and {fl}_rate < {fl_rate_threshold}) or ({fl}_rate < 0 and {sl}_rate < 0)',
-          'none': f'({-distance_change_threshold} <= {distance_change} <= {distance_change_threshold}) and ({sl}_rate < {sl_rate_threshold})',
+          'up': ((distance_value != 0) & (distance_change_value > distance_change_threshold) & (fl_rate > fl_rate_threshold)) | ((fl_rate > 0) & (sl_rate > 0)),
+          'down': ((distance_value != 0) & (distance_change_value < -distance_change_threshold) & (fl_rate < fl_rate_threshold)) | ((fl_rate < 0) & (sl_rate < 0)),
+          'none': ((-distance_change_threshold <= distance_change_value) & (distance_change_value <= distance_change_threshold)) & (sl_rate < sl_rate_threshold),
         }
         values = {
           'up': 1, 
@@ -343,8 +418,8 @@ def calculate_ta_static(df, indicators=default_indicators):
         # trend
         rate_threshold = 0.01
         conditions = {
-          'up':     f'({distance} > 0)',#f'({distance_day} > 0) and ({distance} > -0.15)', # f'Close > {fl} > {sl}', # f'({fs_day} > 0)', #  
-          'down':   f'({distance} < 0)', #f'({distance_day} < 0)', # f'Close < {fl} < {sl}', # f'({fs_day} < 0)' # 
+          'up':     distance_value > 0,#f'({distance_day} > 0) and ({distance} > -0.15)', # f'Close > {fl} > {sl}', # f'({fs_day} > 0)', #  
+          'down':   distance_value < 0, #f'({distance_day} < 0)', # f'Close < {fl} < {sl}', # f'({fs_day} < 0)' # 
         } 
         values = {
           'up': 'u', 
@@ -353,68 +428,72 @@ def calculate_ta_static(df, indicators=default_indicators):
         df = assign_condition_value(df=df, column=trend_col, condition_dict=conditions, value_dict=values, default_value='n')
 
     # ichimoku cloud top and bottom
-    if 'ichimoku' in indicators['trend']:
+    if 'ichimoku' in trend_set:
       # cloud top and bototm
-      green_idx = df.query('ichimoku_fs_day > 0').index
-      red_idx = df.query('ichimoku_fs_day < 0').index
-      df.loc[green_idx, 'cloud_top'] = df.loc[green_idx, 'tankan']
-      df.loc[green_idx, 'cloud_bottom'] = df.loc[green_idx, 'kijun']
-      df.loc[red_idx, 'cloud_top'] = df.loc[red_idx, 'kijun']
-      df.loc[red_idx, 'cloud_bottom'] = df.loc[red_idx, 'tankan']
+      fs_day = df['ichimoku_fs_day'].values
+      tankan = df['tankan'].values
+      kijun = df['kijun'].values
+      df['cloud_top'] = np.where(fs_day > 0, tankan, np.where(fs_day < 0, kijun, np.nan))
+      df['cloud_bottom'] = np.where(fs_day > 0, kijun, np.where(fs_day < 0, tankan, np.nan))
 
     # ================================ aroon trend ============================
     target_indicator = 'aroon'
-    if target_indicator in indicators['trend']:
+    if target_indicator in trend_set:
       aroon_col = ['aroon_up', 'aroon_down', 'aroon_gap']
       df[aroon_col] = df[aroon_col].round(1)
       for col in aroon_col:
-        df = cal_change(df=df, target_col=col, add_prefix=True, add_accumulation=True)
+        df = cal_change(df=df, target_col=col, add_prefix=True, add_accumulation=True, copy=False)
 
       # calculate aroon trend
-      df['aroon_trend'] = ''
+      aroon_up = df['aroon_up'].values
+      aroon_down = df['aroon_down'].values
+      aroon_gap = df['aroon_gap'].values
+      aroon_up_change = df['aroon_up_change'].values
+      aroon_down_change = df['aroon_down_change'].values
+      aroon_gap_change = df['aroon_gap_change'].values
 
       # it is going up when:
       # 1+. aroon_up is extramely positive(96+)
       # 2+. aroon_up is strongly positive [88,100], aroon_down is strongly negative[0,12]
-      up_idx = df.query('(aroon_up>=96) or (aroon_up>=88 and aroon_down<=12)').index
-      df.loc[up_idx, 'aroon_trend'] = 'u'
+      up_1 = (aroon_up >= 96) | ((aroon_up >= 88) & (aroon_down <= 12))
 
       # it is going down when
       # 1-. aroon_down is extremely positive(96+)
       # 2-. aroon_up is strongly negative[0,12], aroon_down is strongly positive[88,100]
-      down_idx = df.query('(aroon_down>=96) or (aroon_down>=88 and aroon_up<=12)').index
-      df.loc[down_idx, 'aroon_trend'] = 'd'
+      down_1 = (aroon_down >= 96) | ((aroon_down >= 88) & (aroon_up <= 12))
 
       # otherwise up trend
       # 3+. aroon_down is decreasing, and (aroon_up is increasing or aroon_down>aroon_up)
-      up_idx = df.query('(aroon_trend!="u" and aroon_trend!="d") and ((aroon_down_change<0) and (aroon_up_change>=0 or aroon_down>aroon_up))').index # and (aroon_up_acc_change_count <= -2 or aroon_down_acc_change_count <= -2)
-      df.loc[up_idx, 'aroon_trend'] = 'u'
+      up_2 = (aroon_down_change < 0) & ((aroon_up_change >= 0) | (aroon_down > aroon_up))
 
       # otherwise down trend
       # 3-. aroon_up is decreasing, and (aroon_down is increasing or aroon_up>aroon_down)
-      down_idx = df.query('(aroon_trend!="u" and aroon_trend!="d") and ((aroon_up_change<0) and (aroon_down_change>=0 or aroon_up>aroon_down))').index #and (aroon_up_acc_change_count <= -2 or aroon_down_acc_change_count <= -2)
-      df.loc[down_idx, 'aroon_trend'] = 'd'
+      down_2 = (aroon_up_change < 0) & ((aroon_down_change >= 0) | (aroon_up > aroon_down))
 
       # it is waving when
       # 1=. aroon_gap keep steady and aroon_up/aroon_down keep changing toward a same direction
-      wave_idx = df.query('-32<=aroon_gap<=32 and ((aroon_gap_change==0 and aroon_up_change==aroon_down_change<0) or ((aroon_up_change<0 and aroon_down<=4) or (aroon_down_change<0 and aroon_up<=4)))').index
-      df.loc[wave_idx, 'aroon_trend'] = 'n'
+      wave = ((-32 <= aroon_gap) & (aroon_gap <= 32)) & (((aroon_gap_change == 0) & (aroon_up_change == aroon_down_change) & (aroon_down_change < 0)) | ((aroon_up_change < 0) & (aroon_down <= 4)) | ((aroon_down_change < 0) & (aroon_up <= 4)))
+
+      # conditions listed by priority (the first matched condition decides the trend)
+      df['aroon_trend'] = np.select([wave, down_1, up_1, up_2, down_2], ['n', 'd', 'u', 'u', 'd'], default='')
 
       # drop intermediate columns
       df.drop(['aroon_up_change', 'aroon_up_acc_change', 'aroon_up_acc_change_count', 'aroon_down_change', 'aroon_down_acc_change', 'aroon_down_acc_change_count', 'aroon_gap_change', 'aroon_gap_acc_change', 'aroon_gap_acc_change_count'], axis=1, inplace=True)
 
     # ================================ adx trend ==============================
     target_indicator = 'adx'
-    if target_indicator in indicators['trend']:
+    if target_indicator in trend_set:
       
       # adx value and strength
       df['adx_value'] = df['adx_diff_ma']
       df['adx_strength'] = df['adx']
-      df = cal_change(df=df, target_col='adx_value', add_accumulation=False, add_prefix=True)
-      df = cal_change(df=df, target_col='adx_strength', add_accumulation=False, add_prefix=True)
+      df = cal_change(df=df, target_col='adx_value', add_accumulation=False, add_prefix=True, copy=False)
+      df = cal_change(df=df, target_col='adx_strength', add_accumulation=False, add_prefix=True, copy=False)
       df['adx_direction'] = df['adx_value_change'] # sda of adx_value_change
       df['adx_power'] = df['adx_strength_change']  # sda of adx_strength_change
-      wave_idx = df.query('-1 < adx_direction < 1 and -0.5 < adx_power < 0.5').index
+      adx_direction = df['adx_direction'].values
+      adx_power = df['adx_power'].values
+      wave_mask = (-1 < adx_direction) & (adx_direction < 1) & (-0.5 < adx_power) & (adx_power < 0.5)
 
       # adx_value_prediction
       df['adx_value_prediction'] = df['adx_value'] + em(series=df['adx_value_change'], periods=3).mean()
@@ -422,14 +501,15 @@ def calculate_ta_static(df, indicators=default_indicators):
 
       # direction(of value) and power(of strength)
       for col in ['adx_direction', 'adx_power']:
-        df.loc[wave_idx, col] = 0
+        df.loc[wave_mask, col] = 0
         df[col] = sda(series=df[col], zero_as=0)
 
         threshold = 0.5
+        col_value = df[col].values
         conditions = {
-          'up': f'{col} > {threshold}', 
-          'down': f'{col} < {-threshold}', 
-          'wave': f'{-threshold} <= {col} <= {threshold}'} 
+          'up': col_value > threshold, 
+          'down': col_value < -threshold, 
+          'wave': (-threshold <= col_value) & (col_value <= threshold)} 
         values = {
           'up': 1, 
           'down': -1,
@@ -439,9 +519,10 @@ def calculate_ta_static(df, indicators=default_indicators):
 
       # whether strength is strong or weak
       adx_strong_weak_threshold = 25
+      adx = df['adx'].values
       conditions = {
-        'up': f'adx >= {adx_strong_weak_threshold}', 
-        'down': f'adx < {adx_strong_weak_threshold}'} 
+        'up': adx >= adx_strong_weak_threshold, 
+        'down': adx < adx_strong_weak_threshold} 
       values = {
         'up': 1, 
         'down': -1}
@@ -450,9 +531,10 @@ def calculate_ta_static(df, indicators=default_indicators):
 
       # whether value is waving around 0
       adx_wave_threshold = 10
+      adx_value = df['adx_value'].values
       conditions = {
-        'wave': f'{-adx_wave_threshold} <= adx_value <= {adx_wave_threshold}', 
-        'none': f'{-adx_wave_threshold} > adx_value or adx_value > {adx_wave_threshold}'} 
+        'wave': (-adx_wave_threshold <= adx_value) & (adx_value <= adx_wave_threshold), 
+        'none': (-adx_wave_threshold > adx_value) | (adx_value > adx_wave_threshold)} 
       values = {
         'wave': 1, 
         'none': 0}
@@ -460,61 +542,62 @@ def calculate_ta_static(df, indicators=default_indicators):
       df['adx_wave_day'] = sda(series=df['adx_wave_day'], zero_as=None)
 
       # highest(lowest) value of adx_value of previous uptrend(downtrend)
-      df['prev_adx_value'] = df['adx_value'].shift(1)
-      extreme_idx = df.query('adx_direction_day == 1 or adx_direction_day == -1').index.tolist()
-      for i in range(len(extreme_idx)):
-        tmp_idx = extreme_idx[i]
-        if i == 0:
-          start = df.index.min()
-          end = extreme_idx[i]
-        else:
-          start = extreme_idx[i-1]
-          end = extreme_idx[i]
-        tmp_direction = df.loc[tmp_idx, 'adx_direction_day']
-        tmp_extreme = df[start:end]['adx_value'].max() if tmp_direction < 0 else df[start:end]['adx_value'].min()
-        tmp_direction_start = df.loc[end, 'prev_adx_value']
-        df.loc[tmp_idx, 'prev_adx_extreme'] = tmp_extreme
-        df.loc[tmp_idx, 'adx_direction_start'] = tmp_direction_start
-      df['prev_adx_extreme'] = df['prev_adx_extreme'].fillna(method='ffill')
-      df['adx_direction_start'] = df['adx_direction_start'].fillna(method='ffill')
+      df['prev_adx_value'] = np.concatenate([[np.nan], df['adx_value'].values[:-1]])
+      # each extreme(adx_direction_day in [1, -1]) closes a segment that starts from the previous extreme (both ends included)
+      adx_direction_day = df['adx_direction_day'].values
+      is_extreme = (adx_direction_day == 1) | (adx_direction_day == -1)
+      extreme_pos = np.flatnonzero(is_extreme)
+      segment_id = np.cumsum(is_extreme) - is_extreme
+      segment_value = df['adx_value'].groupby(segment_id)
+      segment_max = segment_value.max().values[:len(extreme_pos)]
+      segment_min = segment_value.min().values[:len(extreme_pos)]
+      previous_extreme_value = np.concatenate([[np.nan], df['adx_value'].values[extreme_pos[:-1]]])
+      segment_max = np.fmax(segment_max, previous_extreme_value)
+      segment_min = np.fmin(segment_min, previous_extreme_value)
+
+      prev_adx_extreme = np.full(len(df), np.nan)
+      prev_adx_extreme[extreme_pos] = np.where(adx_direction_day[extreme_pos] < 0, segment_max, segment_min)
+      df['prev_adx_extreme'] = prev_adx_extreme
+      df['prev_adx_extreme'] = df['prev_adx_extreme'].ffill()
+      df['adx_direction_start'] = df['prev_adx_value'].where(is_extreme).ffill()
 
       # overall adx trend
       threshold = 1
-      conditions = {
-        # adx_direction > 0 and (at least 1)
-        # 1. adx_direction > 5
-        # 2. adx_value < 0 and adx_power_day < 0
-        # 3. adx_value > 0 and adx_power_day > 0
-        # 'up': '((adx_direction > 0 and adx_strong_day > 0) and ((adx_direction > 5) or (adx_value < 0 and adx_power_day < 0) or (adx_value > 0 and adx_power_day > 0)))', 
-        'up1': '(candle_color == 1 or rate > 0) and (adx_direction > 10 and adx_direction_day > 2)',
-        'up2': '(candle_color == 1 or rate > 0) and ((adx_value < 0 and adx_power_day < 0) or (adx_value > 0 and adx_power_day > 0) or (-5 < adx_value < 5 and adx_direction > 0)) and ((adx_direction > 5))',
-        # 'up': f'adx_value_change > {threshold}',
-
-        # adx_direction < 0 and (at least 1)
-        # 1. adx_direction < -5
-        # 2. adx_value > 0 and adx_power_day < 0
-        # 3. adx_value < 0 and adx_power_day > 0
-        # 'down': '((adx_direction < 0 and adx_strong_day > 0) and ((adx_direction <-5) or (adx_value > 0 and adx_power_day < 0) or (adx_value < 0 and adx_power_day > 0)))',
-        'down1': '(adx_direction < -5 and adx_direction_day < -2)', 
-        'down2': '((adx_value > 0 and adx_power_day < 0) or (adx_value < 0 and adx_power_day > 0) or (-5 < adx_value < 5 and adx_direction < 0)) and ((adx_direction < -5))',
-        # 'down': f'adx_value_change < {-threshold}',
-
-        # at least 1 of following
-        # 1. adx_direction in (-5, 5) and (adx_strength_change in (-1, 1) or adx_value_change in (-1, 1) or (adx_power_day in [-1,1] and adx_direction_day in [-1,1]))
-        # 2. adx_direction_start in (5, -5) and adx_strong_day in [-1, 1]
-        # 'wave': '(((-1 < adx_strength_change < 1) or (-1 < adx_value_change < 1) or (-1 <= adx_power_day <= 1 and -1 <= adx_direction_day <= 1)) and (-5 < adx_direction < 5)) or ((adx_strong_day < 0) and (-5 < adx_direction_start < 5))'
-        'wave1': '(-5 <= adx_direction <= 5) and ((-1 <= adx_strength_change <= 1) or (-1 <= adx_value_change <= 1))',
-        'wave2': '(-5 <= adx_direction <= 5) and (-1<= adx_power_day <= 1) and (-1 <= adx_direction_day <= 1)',
-        'wave3': '(-5 <= adx_direction <= 5) and (-1 <= adx_strong_day <= 1)'
-        # 'wave': f'{-threshold} <= adx_value_change <= {threshold}'
-      } 
+      candle_color = df['candle_color'].values
+      rate = df['rate'].values
+      adx_direction = df['adx_direction'].values
+      adx_direction_day = df['adx_direction_day'].values
+      adx_power_day = df['adx_power_day'].values
+      adx_strong_day = df['adx_strong_day'].values
+      adx_value_change = df['adx_value_change'].values
+      adx_strength_change = df['adx_strength_change'].values
+      adx_value_around_0 = (-5 < adx_value) & (adx_value < 5)
+      adx_direction_wave = (-5 <= adx_direction) & (adx_direction <= 5)
+
+      # adx_direction > 0 and (at least 1)
+      # 1. adx_direction > 5
+      # 2. adx_value < 0 and adx_power_day < 0
+      # 3. adx_value > 0 and adx_power_day > 0
+      up_1 = ((candle_color == 1) | (rate > 0)) & (adx_direction > 10) & (adx_direction_day > 2)
+      up_2 = ((candle_color == 1) | (rate > 0)) & (((adx_value < 0) & (adx_power_day < 0)) | ((adx_value > 0) & (adx_power_day > 0)) | (adx_value_around_0 & (adx_direction > 0))) & (adx_direction > 5)
+
+      # adx_direction < 0 and (at least 1)
+      # 1. adx_direction < -5
+      # 2. adx_value > 0 and adx_power_day < 0
+      # 3. adx_value < 0 and adx_power_day > 0
+      down_1 = (adx_direction < -5) & (adx_direction_day < -2)
+      down_2 = (((adx_value > 0) & (adx_power_day < 0)) | ((adx_value < 0) & (adx_power_day > 0)) | (adx_value_around_0 & (adx_direction < 0))) & (adx_direction < -5)
+
+      # at least 1 of following
+      # 1. adx_direction in [-5, 5] and (adx_strength_change in [-1, 1] or adx_value_change in [-1, 1])
+      # 2. adx_direction in [-5, 5] and adx_power_day in [-1,1] and adx_direction_day in [-1,1]
+      # 3. adx_direction in [-5, 5] and adx_strong_day in [-1, 1]
+      wave_1 = adx_direction_wave & (((-1 <= adx_strength_change) & (adx_strength_change <= 1)) | ((-1 <= adx_value_change) & (adx_value_change <= 1)))
+      wave_2 = adx_direction_wave & (-1 <= adx_power_day) & (adx_power_day <= 1) & (-1 <= adx_direction_day) & (adx_direction_day <= 1)
+      wave_3 = adx_direction_wave & (-1 <= adx_strong_day) & (adx_strong_day <= 1)
       
-      # adx_trend
-      values = {
-        'up1': 'u', 'up2': 'u', 
-        'down1': 'd', 'down2': 'd',
-        'wave1': 'n', 'wave2': 'n', 'wave3': 'n'}
-      df = assign_condition_value(df=df, column='adx_trend', condition_dict=conditions, value_dict=values, default_value='n') 
+      # adx_trend, conditions listed by priority (wave over down over up)
+      df['adx_trend'] = np.select([wave_1, wave_2, wave_3, down_1, down_2, up_1, up_2], ['n', 'n', 'n', 'd', 'd', 'u', 'u'], default='n')
 
       # # conflicted conditions
       # conflicted_idx = df.query('(adx_trend == "u") and (adx_value_change < 0)').index
@@ -525,10 +608,10 @@ def calculate_ta_static(df, indicators=default_indicators):
   
     # ================================ kst trend ==============================
     target_indicator = 'kst'
-    if target_indicator in indicators['trend']:
+    if target_indicator in trend_set:
       conditions = {
-        'up': 'kst_diff > 0', 
-        'down': 'kst_diff <= 0'} 
+        'up': df['kst_diff'] > 0, 
+        'down': df['kst_diff'] <= 0} 
       values = {
         'up': 'u', 
         'down': 'd'}
@@ -536,10 +619,10 @@ def calculate_ta_static(df, indicators=default_indicators):
     
     # ================================ cci trend ==============================
     target_indicator = 'cci'
-    if target_indicator in indicators['trend']:
+    if target_indicator in trend_set:
       conditions = {
-        'up': 'cci_ma > 0', 
-        'down': 'cci_ma <= 0'} 
+        'up': df['cci_ma'] > 0, 
+        'down': df['cci_ma'] <= 0} 
       values = {
         'up': 'u', 
         'down': 'd'}
@@ -547,19 +630,20 @@ def calculate_ta_static(df, indicators=default_indicators):
 
     # ================================ trix trend =============================
     target_indicator = 'trix'
-    if target_indicator in indicators['trend']:
+    if target_indicator in trend_set:
       df['trix_trend'] = 'n'
-      up_mask = df['trix'] > df['trix'].shift(1)
-      down_mask = df['trix'] < df['trix'].shift(1)
+      trix_diff = prev_diff(df['trix'].values)
+      up_mask = trix_diff > 0
+      down_mask = trix_diff < 0
       df.loc[up_mask, 'trix_trend'] = 'u'
       df.loc[down_mask, 'trix_trend'] = 'd'
 
     # ================================ psar trend =============================
     target_indicator = 'psar'
-    if target_indicator in indicators['trend']:
+    if target_indicator in trend_set:
       conditions = {
-        'up': 'psar_up > 0', 
-        'down': 'psar_down > 0'} 
+        'up': df['psar_up'] > 0, 
+        'down': df['psar_down'] > 0} 
       values = {
         'up': 'u', 
         'down': 'd'}
@@ -567,10 +651,10 @@ def calculate_ta_static(df, indicators=default_indicators):
 
     # ================================ stoch trend =============================
     target_indicator = 'stoch'
-    if target_indicator in indicators['trend']:
+    if target_indicator in trend_set:
       conditions = {
-        'up': 'stoch_diff > 1 or stoch_k > 80', 
-        'down': 'stoch_diff < -1 or stoch_k < 20'} 
+        'up': (df['stoch_diff'] > 1) | (df['stoch_k'] > 80), 
+        'down': (df['stoch_diff'] < -1) | (df['stoch_k'] < 20)} 
       values = {
         'up': 'u', 
         'down': 'd'}
@@ -582,10 +666,10 @@ def calculate_ta_static(df, indicators=default_indicators):
 
     # ================================ eom trend ==============================
     target_indicator = 'eom'
-    if target_indicator in indicators['volume']:
+    if target_indicator in volume_set:
       conditions = {
-        'up': 'eom_diff > 0', 
-        'down': 'eom_diff <= 0'} 
+        'up': df['eom_diff'] > 0, 
+        'down': df['eom_diff'] <= 0} 
       values = {
         'up': 'u', 
         'down': 'd'}
@@ -593,10 +677,10 @@ def calculate_ta_static(df, indicators=default_indicators):
 
     # ================================ fi trend ===============================
     target_indicator = 'fi'
-    if target_indicator in indicators['volume']:
+    if target_indicator in volume_set:
       conditions = {
-        'up': 'fi_ema > 0', 
-        'down': 'fi_ema <= 0'} 
+        'up': df['fi_ema'] > 0, 
+        'down': df['fi_ema'] <= 0} 
       values = {
         'up': 'u', 
         'down': 'd'}
@@ -608,10 +692,10 @@ def calculate_ta_static(df, indicators=default_indicators):
 
     # ================================ bb trend ===============================
     target_indicator = 'bb'
-    if target_indicator in indicators['volatility']:
+    if target_indicator in volatility_set:
       conditions = {
-        'up': 'Close < bb_low_band', 
-        'down': 'Close > bb_high_band'} 
+        'up': df['Close'] < df['bb_low_band'], 
+        'down': df['Close'] > df['bb_high_band']} 
       values = {
         'up': 'u', 
         'down': 'd'}
@@ -623,10 +707,11 @@ def calculate_ta_static(df, indicators=default_indicators):
 
     # ================================ ao trend ===============================
     target_indicator = 'ao'
-    if target_indicator in indicators['other']:
+    if target_indicator in other_set:
       df['ao_trend'] = 'n'
-      up_mask = df['ao'] > df['ao'].shift(1)
-      down_mask = df['ao'] < df['ao'].shift(1)
+      ao_diff = prev_diff(df['ao'].values)
+      up_mask = ao_diff > 0
+      down_mask = ao_diff < 0
       df.loc[up_mask, 'ao_trend'] = 'u'
       df.loc[down_mask, 'ao_trend'] = 'd'
     
@@ -643,50 +728,94 @@ def calculate_ta_static(df, indicators=default_indicators):
       df['trend_idx'] = 0
       
       # specify all indicators and specify the exclusives
-      all_indicators = []
-      for i in indicators.keys():
-        all_indicators += [x for x in indicators[i] if x not in all_indicators]
+      all_indicators = list(dict.fromkeys(itertools.chain.from_iterable(indicators.values())))
 
       include_indicators = [x for x in all_indicators if x != 'bb'] # ['ichimoku', 'aroon', 'adx', 'psar']
+      include_trend_codes = []
+
+      # add missing trend/signal/day columns at once, signal of individual indicators are set to 'n'
+      existing_cols = set(df.columns)
+      missing_cols = {}
+      for indicator in all_indicators:
+        for col, default_value in ((f'{indicator}_trend', 'n'), (f'{indicator}_signal', 'n'), (f'{indicator}_day', 0)):
+          if col not in existing_cols:
+            missing_cols[col] = default_value
+      if len(missing_cols) > 0:
+        df = df.assign(**missing_cols)
+
       for indicator in all_indicators:
         trend_col = f'{indicator}_trend'
-        signal_col = f'{indicator}_signal'
         day_col = f'{indicator}_day'
 
-        if trend_col not in df.columns:
-          df[trend_col] = 'n'
-        if signal_col not in df.columns:
-          df[signal_col] = 'n'
-        if day_col not in df.columns:
-          df[day_col] = 0
-
         # calculate number of days since trend shifted
+        trend_code = trend_to_int(df[trend_col])
         if indicator in ['bb']:
-          df[day_col] = sda(series=df[trend_col].replace({'': 0, 'n':0, 'u':1, 'd':-1}).fillna(0), zero_as=1, one_restart=True) 
+          df[day_col] = sda(series=trend_code, zero_as=1, one_restart=True) 
         else:
-          df[day_col] = sda(series=df[trend_col].replace({'': 0, 'n':0, 'u':1, 'd':-1}).fillna(0), zero_as=1) 
-        
-        # signal of individual indicators are set to 'n'
-        if signal_col not in df.columns:
-          df[signal_col] = 'n'
+          df[day_col] = sda(series=trend_code, zero_as=1) 
 
-        # calculate overall indicator index according to certain important indicators
+        # collect trend of certain important indicators for overall indicator index
         if indicator in include_indicators:
+          include_trend_codes.append(trend_code.values)
 
-          # calculate the overall trend value
-          up_idx = df.query(f'{trend_col} == "u"').index
-          down_idx = df.query(f'{trend_col} == "d"').index
-          df.loc[up_idx, 'up_trend_idx'] += 1
-          df.loc[down_idx, 'down_trend_idx'] -= 1
-
-      # calculate overall trend index 
+      # calculate overall trend index (count of up/down trends among included indicators)
+      if len(include_trend_codes) > 0:
+        trend_codes = np.stack(include_trend_codes, axis=1)
+        df['up_trend_idx'] = (trend_codes == 1).sum(axis=1, dtype=np.int8)
+        df['down_trend_idx'] = -(trend_codes == -1).sum(axis=1, dtype=np.int8)
       df['trend_idx'] = df['up_trend_idx'] + df['down_trend_idx']      
 
+    # downcast day columns to int16, trend/signal columns to categorical
+    phase = 'downcast'
+    df = downcast(df=df)
+    df = categorize(df=df)
+
   except Exception as e:
     print(f'[Exception]: @ {phase} - {target_indicator}, {e}')
     
   return df
 
+# update indicators and static trend with newly arrived rows
+def calculate_ta_incremental(prev_df, new_df, indicators=default_indicators, lookback=260):
+  """
+  Update indicators and static trend with newly arrived rows, only the new rows (warmed up by the last "lookback" previous rows) are recalculated
+
+  :param prev_df: previous result of calculate_ta_basic + calculate_ta_static
+  :param new_df: new preprocessed rows, previous rows with index not earlier than new rows are replaced
+  :param indicators: dictionary of different type of indicators to calculate
+  :param lookback: number of previous rows used to warm up the recalculation, values with long memory (ema/kama/adx, *_day, gap thresholds) are approximated within this window, bounds of gaps opened before the window are carried over from prev_df
+  :returns: dataframe with static trend columns, previous rows followed by new rows
+  :raises: None
+  """
+  # check whether new data is empty or None
+  if new_df is None or len(new_df) == 0:
+    return prev_df
+
+  # calculate from scratch when there is no previous result
+  if prev_df is None or len(prev_df) == 0:
+    df = calculate_ta_basic(df=new_df, indicators=indicators)
+    return calculate_ta_static(df=df, indicators=indicators)
+
+  # recalculate warm-up rows and new rows with the columns of new data
+  prev_df = prev_df[prev_df.index < new_df.index.min()]
+  base_cols = [col for col in new_df.columns if col in prev_df.columns]
+  recalc_df = pd.concat([prev_df[base_cols].tail(lookback), new_df[base_cols]])
+  recalc_df = calculate_ta_basic(df=recalc_df, indicators=indicators, copy=False)
+
+  # gap top/bottom are forward filled until the next gap, carry the bounds of gaps opened before the warm-up window over from prev_df
+  if recalc_df is not None and lookback > 0:
+    window_start = recalc_df.index[0]
+    for col in ['candle_gap_top', 'candle_gap_bottom']:
+      if col in recalc_df.columns and col in prev_df.columns and window_start in prev_df.index:
+        recalc_df[col] = recalc_df[col].fillna(prev_df.loc[window_start, col])
+
+  recalc_df = calculate_ta_static(df=recalc_df, indicators=indicators)
+
+  # keep previous rows untouched, append recalculated new rows
+  df = pd.concat([prev_df, recalc_df.loc[new_df.index]])
+
+  return df
+
 # calculate dynamic trend according to indicators and static trend
 def calculate_ta_dynamic(df, perspective=default_perspectives):
   """
@@ -728,7 +857,7 @@ def calculate_ta_dynamic(df, perspective=default_perspectives):
 
       # calculate renko signal
       df['renko_signal'] = 'n'
-      df['renko_day'] = sda(series=df['renko_trend'].replace({'': 0, 'n':0, 'u':1, 'd':-1}).fillna(0), zero_as=1)
+      df['renko_day'] = sda(series=trend_to_int(df['renko_trend']), zero_as=1)
       
     # ================================ candle analysis ===========================
     phase = 'candle analysis'
@@ -766,9 +895,11 @@ def calculate_ta_dynamic(df, perspective=default_perspectives):
         'up': 'u', 
         'down': 'd',
         'wave': 'n'}
-      df = assign_condition_value(df=df, column='linear_bounce_trend', condition_dict=conditions, value_dict=values)
-      df['linear_bounce_trend'] = df['linear_bounce_trend'].fillna(method='ffill').fillna('')
-      df['linear_bounce_day'] = sda(series=df['linear_bounce_trend'].replace({'': 0, 'n':0, 'u':1, 'd':-1}).fillna(0), zero_as=1)
+      masks = eval_conditions(df=df, condition_dict=conditions)
+      trend_codes = np.select([masks['wave'], masks['down'], masks['up']], [0, -1, 1], default=0).astype(np.int8)
+      trend_codes, trend_filled = ffill_codes(codes=trend_codes, valid=(masks['up'] | masks['down'] | masks['wave']))
+      df['linear_bounce_trend'] = np.select([trend_codes == 1, trend_codes == -1, trend_filled], [values['up'], values['down'], values['wave']], default='')
+      df['linear_bounce_day'] = sda(series=pd.Series(trend_codes, index=df.index), zero_as=1)
       
       # break through up or down
       conditions = {
@@ -777,9 +908,11 @@ def calculate_ta_dynamic(df, perspective=default_perspectives):
       values = {
         'up': 'u', 
         'down': 'd'}
-      df = assign_condition_value(df=df, column='linear_break_trend', condition_dict=conditions, value_dict=values)
-      df['linear_break_trend'] = df['linear_break_trend'].fillna(method='ffill').fillna('')
-      df['linear_break_day'] = sda(series=df['linear_break_trend'].replace({'': 0, 'n':0, 'u':1, 'd':-1}).fillna(0), zero_as=1)
+      masks = eval_conditions(df=df, condition_dict=conditions)
+      trend_codes = np.select([masks['down'], masks['up']], [-1, 1], default=0).astype(np.int8)
+      trend_codes, trend_filled = ffill_codes(codes=trend_codes, valid=(masks['up'] | masks['down']))
+      df['linear_break_trend'] = np.select([trend_codes == 1, trend_codes == -1], [values['up'], values['down']], default='')
+      df['linear_break_day'] = sda(series=pd.Series(trend_codes, index=df.index), zero_as=1)
 
       # focus on the last row only
       max_idx = df.index.max()
@@ -790,6 +923,10 @@ def calculate_ta_dynamic(df, perspective=default_perspectives):
     if 'support_resistant' in perspective:
       df = add_support_resistance(df)
 
+    # trend/signal columns to categorical
+    phase = 'categorize'
+    df = categorize(df=df)
+
   except Exception as e:
     print(phase, e)
 
@@ -815,12 +952,17 @@ def calculate_ta_feature(df, symbol, start_date=None, end_date=None, indicators=
   
   try:
     # # preprocess sec_data
+    # split adjustment only looks forward, so rows before start_date can be dropped before preprocess, rows after end_date only after it
     phase = 'preprocess'
-    df = preprocess(df=df, symbol=symbol)[start_date:end_date].copy()
+    if start_date is not None and df.index.is_monotonic_increasing:
+      df = df[start_date:]
+    df = preprocess(df=df, symbol=symbol)
+    if end_date is not None:
+      df = df[:end_date].copy()
     
     # calculate TA indicators
     phase = 'cal_ta_basic_features' 
-    df = calculate_ta_basic(df=df, indicators=indicators)
+    df = calculate_ta_basic(df=df, indicators=indicators, copy=False)
 
     # calculate TA trend
     phase = 'cal_ta_static_features'
@@ -836,30 +978,45 @@ def calculate_ta_feature(df, symbol, start_date=None, end_date=None, indicators=
 
   return df
 
+# calculate features for multiple symbols in parallel
+def calculate_ta_feature_batch(data, start_date=None, end_date=None, indicators=default_indicators, max_workers=None):
+  """
+  Calculate all features for multiple symbols, each symbol is calculated in a seperate process.
+
+  :param data: dictionary of original dataframes with hlocv features, keys are symbols
+  :param start_date: start date of calculation
+  :param end_date: end date of calculation
+  :param indicators: dictionary of different type of indicators to calculate
+  :param max_workers: number of worker processes (None for number of cpus)
+  :returns: dictionary of dataframes with ta indicators, static/dynamic trend, keys are symbols
+  :raises: none
+  """
+  result = {}
+
+  with ProcessPoolExecutor(max_workers=max_workers, initializer=compile_kernels) as executor:
+    futures = {symbol: executor.submit(calculate_ta_feature, df=data[symbol], symbol=symbol, start_date=start_date, end_date=end_date, indicators=indicators) for symbol in data.keys()}
+    for symbol in futures.keys():
+      result[symbol] = futures[symbol].result()
+
+  return result
+
 # generate description for ta features
-def calculate_ta_score(df):
+def calculate_ta_score(df, tail_only=None):
   """
   Generate description for latest ta_data of symbols(aka. result).
 
   :param df: dataframe which contains latest ta_data of symbols, each row for a symbol
+  :param tail_only: only calculate (and return) the last tail_only rows, previous rows are only used for values that depend on history
   :raturns: dataframe with description
   :raises: None
   """
 
   # initialization
-  df['trend_score'] = 0
-  df['major_score'] = 0
-  
-  df['trigger_score'] = 0
-  df['trigger_score_description'] = ''
-
-  df['position_score'] = 0
-  df['position_score_description'] = ''
-
-  df['inday_trend_score'] = 0
-  df['inday_trend_score_description'] = ''
-
-  col_to_drop = []
+  history = df
+  if tail_only is not None:
+    df = df.iloc[-tail_only:]
+  n = len(df)
+  start = len(history) - n
 
   # ================================ calculate s/m/l trend/score/day ========
   # calculate short/middle/long trend score/day
@@ -913,6 +1070,9 @@ def calculate_ta_score(df):
     'long': 'kama_distance_change'
   }
   term_weight = {'short':1.0, 'middle':0.9, 'long':0.8}
+  term_scores = {}
+  term_descriptions = {}
+  major_score = np.zeros(n)
   for term in ['short', 'middle', 'long']:
 
     # column names
@@ -921,24 +1081,31 @@ def calculate_ta_score(df):
 
     # term trend score
     trend_condition = trend_conditions[term]
-    df = cal_score(df=df, condition_dict=trend_condition, up_score_col=score_col, down_score_col=score_col)
-    wave_condition = wave_conditions[term]
-    for c in wave_condition:
-      tmp_idx = df.query(c).index
-      df.loc[tmp_idx, score_col] *= 0.8
+    score_values, score_descriptions = eval_score(df=df, condition_dict=trend_condition, up_score_col=score_col, down_score_col=score_col)
+    term_score = score_values[score_col]
+    # each wave condition met scales the score by 0.8
+    wave_masks = eval_conditions(df=df, condition_dict=dict(enumerate(wave_conditions[term])))
+    wave_count = np.stack(list(wave_masks.values())).sum(axis=0)
+    term_score *= 0.8 ** wave_count
 
     # term trend score += normalized key column score
-    df[score_col] += min_max_normalize(df[key_col])
+    term_score = term_score + min_max_normalize(history[key_col]).to_numpy(dtype=np.float64)[start:]
+    term_scores[term] = term_score
+    term_descriptions[term] = pd.array(score_descriptions[score_col], dtype=default_description_dtype)
 
     # major score
-    df['major_score'] += (df[score_col] > 0).replace({True: term_weight[term], False: 0})
+    major_score += np.where(term_score > 0, term_weight[term], 0)
 
 
   # ================================ calculate inday trend ==================
   # inday score and description
-  df['prev_candle_entity_top'] = df['candle_entity_top'].shift(1)
-  df['prev_candle_entity_bottom'] = df['candle_entity_bottom'].shift(1)
-  col_to_drop += ['prev_candle_entity_top', 'prev_candle_entity_bottom']
+  # entity top/bottom of the previous candle, shifted on numpy arrays (NaN for the first row of history)
+  entity_top = history['candle_entity_top'].to_numpy(dtype=np.float64)
+  entity_bottom = history['candle_entity_bottom'].to_numpy(dtype=np.float64)
+  candle_entity_top = entity_top[start:]
+  candle_entity_bottom = entity_bottom[start:]
+  prev_candle_entity_top = np.concatenate([[np.nan], entity_top[:-1]])[start:]
+  prev_candle_entity_bottom = np.concatenate([[np.nan], entity_bottom[:-1]])[start:]
 
   s = 0.5
   inday_conditions = {
@@ -955,8 +1122,8 @@ def calculate_ta_score(df):
     '+触底':        [s, '', '(突破_day == -1 and candle_color == 1)'],
     '-触顶':        [-s, '', '(突破_day == 1 and candle_color == -1)'],
 
-    '+跳升':        [s, '', '(candle_entity_bottom > prev_candle_entity_top)'],
-    '-跳降':        [-s, '', '(candle_entity_top < prev_candle_entity_bottom)'],
+    '+跳升':        [s, '', (candle_entity_bottom > prev_candle_entity_top)],
+    '-跳降':        [-s, '', (candle_entity_top < prev_candle_entity_bottom)],
 
     '-十字星':      [-s, '', '(十字星_day == -1 or 十字星_day == 1)'],
 
@@ -975,86 +1142,115 @@ def calculate_ta_score(df):
     '+启明黄昏':    [s, '', '(启明黄昏_day == 1)'],
     '-启明黄昏':    [-s, '', '(启明黄昏_day == -1)'],
   }
-  df = cal_score(df=df, condition_dict=inday_conditions, up_score_col='up_score', down_score_col='down_score')
-  df['inday_trend_score'] += df['up_score'] + df['down_score']
+  score_values, score_descriptions = eval_score(df=df, condition_dict=inday_conditions, up_score_col='up_score', down_score_col='down_score')
+  up_score = score_values['up_score']
+  down_score = score_values['down_score']
+  up_score_description = pd.Series(score_descriptions['up_score'], index=df.index, dtype=default_description_dtype)
+  down_score_description = pd.Series(score_descriptions['down_score'], index=df.index, dtype=default_description_dtype)
+  inday_trend_score = up_score + down_score
 
   names = {'support':'支撑', 'resistant': '阻挡', 'break_up': '突破', 'break_down': '跌落'}
   for col in ['support', 'resistant', 'break_up', 'break_down']:
-    df['inday_trend_score'] += df[f'{col}_score'] * s
+    inday_trend_score = inday_trend_score + df[f'{col}_score'].to_numpy(dtype=np.float64) * s
 
-    desc = df[f'{col}_description'].apply(lambda x: '' if len(x) == 0 else f'{names[col]}: ' + x + '; ')
+    description = df[f'{col}_description'].astype(default_description_dtype).fillna('')
+    desc = (f'{names[col]}: ' + description + '; ').where(description.str.len() > 0, '')
 
     if col in ['support', 'break_up']:
-      df['up_score_description'] += desc
+      up_score_description = up_score_description + desc
     else:
-      df['down_score_description'] += desc
+      down_score_description = down_score_description + desc
 
-  df['inday_trend_score_description'] += df['up_score_description'] + df['down_score_description']
+  inday_trend_score_description = up_score_description + down_score_description
 
   
   # ================================ calculate trigger/position score =======
   # trigger score and description, position score
-  for col in ['tankan_day', 'kama_fast_day', 'kijun_day', 'kama_slow_day']:
+  trigger_cols = ['tankan_day', 'kama_fast_day', 'kijun_day', 'kama_slow_day']
+  day_values = history[trigger_cols].to_numpy(dtype=np.float64).T
+
+  # trigger score: 1/day for days within [-3, 3] (nan and 0 excluded)
+  trigger_pos = (0 < day_values) & (day_values <= 3)
+  trigger_neg = (-3 <= day_values) & (day_values < 0)
+  trigger_values = np.divide(1.0, day_values, out=np.zeros_like(day_values), where=(trigger_pos | trigger_neg))
+  trigger_score = trigger_values.sum(axis=0)
+
+  # trigger day, accumulated over the whole history
+  trigger_day = sda(series=pd.Series(np.sign(trigger_score).astype(int), index=history.index), zero_as=1).to_numpy()[start:]
+
+  # the rest is calculated for target rows only
+  day_values = day_values[:, start:]
+  trigger_pos = trigger_pos[:, start:]
+  trigger_neg = trigger_neg[:, start:]
+  trigger_score = trigger_score[start:]
+
+  # position score: +1/-1 for each positive/negative day
+  position_pos = (0 < day_values)
+  position_neg = (day_values < 0)
+  position_score = position_pos.sum(axis=0) - position_neg.sum(axis=0)
+
+  # trigger/position score description
+  trigger_tokens = [[] for _ in range(n)]
+  position_tokens = [[] for _ in range(n)]
+  for i, col in enumerate(trigger_cols):
     col_desc = '_'.join(col.split('_')[0:-1])
-    
-    # trigger score
-    valid_pos_idx = df.query(f'0 < {col} <= 3').index
-    valid_neg_idx = df.query(f'-3 <= {col} < 0').index
-    df.loc[valid_pos_idx, 'trigger_score'] += df.loc[valid_pos_idx, col].apply(lambda x: 0 if (np.isnan(x) or x == 0) else 1/x)
-    df.loc[valid_neg_idx, 'trigger_score'] += df.loc[valid_neg_idx, col].apply(lambda x: 0 if (np.isnan(x) or x == 0) else 1/x)
-    df.loc[valid_pos_idx, 'trigger_score_description'] += f'+{col_desc}, '
-    df.loc[valid_neg_idx, 'trigger_score_description'] += f'-{col_desc}, '
-
-    # position score
-    valid_pos_idx = df.query(f'0 < {col}').index
-    valid_neg_idx = df.query(f'{col} < 0').index
-    df.loc[valid_pos_idx, 'position_score'] += 1
-    df.loc[valid_neg_idx, 'position_score'] += -1
-    df.loc[valid_pos_idx, 'position_score_description'] += f'+{col_desc}, '
-    df.loc[valid_neg_idx, 'position_score_description'] += f'-{col_desc}, '
-
-  df['trigger_score_description'] = df['trigger_score_description'].apply(lambda x: x[:-2])
-  df['position_score_description'] = df['position_score_description'].apply(lambda x: x[:-2])
-
-  position_conditions = {
-    'pos':    f'trigger_score > 0.0', 
-    'neg':    f'trigger_score < 0.0',
-  } 
-  position_values = {
-    'pos':    1, 
-    'neg':    -1,
-  }
-  df = assign_condition_value(df=df, column='trigger_day', condition_dict=position_conditions, value_dict=position_values, default_value=0)
-  df['trigger_day'] = sda(series=df['trigger_day'], zero_as=1)
+    for tokens, pos_mask, neg_mask in [(trigger_tokens, trigger_pos[i], trigger_neg[i]), (position_tokens, position_pos[i], position_neg[i])]:
+      for row in np.flatnonzero(pos_mask):
+        tokens[row].append(f'+{col_desc}')
+      for row in np.flatnonzero(neg_mask):
+        tokens[row].append(f'-{col_desc}')
+  trigger_description = pd.array([', '.join(x) for x in trigger_tokens], dtype=default_description_dtype)
+  position_description = pd.array([', '.join(x) for x in position_tokens], dtype=default_description_dtype)
+
   
   # trigger_score when at high(position_score == 4) or low(position_score == -4) position
-  none_trigger_high = df.query('position_score == 4 and trigger_score == 0 and candle_color == 1').index
-  df.loc[none_trigger_high, 'trigger_score'] = df.loc[none_trigger_high, 'candle_entity_pct']
-
-  none_trigger_low = df.query('position_score == -4 and trigger_score == 0 and  candle_color == -1').index
-  df.loc[none_trigger_low, 'trigger_score'] = df.loc[none_trigger_low, 'candle_entity_pct'] * -1
+  candle_color = df['candle_color'].to_numpy()
+  candle_entity_pct = df['candle_entity_pct'].to_numpy(dtype=np.float64)
+  none_trigger_high = (position_score == 4) & (trigger_score == 0) & (candle_color == 1)
+  none_trigger_low = (position_score == -4) & (trigger_score == 0) & (candle_color == -1)
+  trigger_score = np.select([none_trigger_high, none_trigger_low], [candle_entity_pct, candle_entity_pct * -1], default=trigger_score)
 
 
   # ================================ calculate trend score ==================
   # overall score
   weights = {'inday': 0.2, 'short': 0.4, 'middle': 0.2, 'long': 0.2}
+  term_scores['inday'] = inday_trend_score
+  trend_score = np.zeros(n)
   for term in ['inday', 'short', 'middle', 'long']:
-    score_col = f'{term}_trend_score'
-    df['trend_score'] += df[score_col] * weights[term]
-
-  # drop redundant columns
-  for col in col_to_drop:
-    if col in df.columns:
-      df.drop(col, axis=1, inplace=True)
+    trend_score += term_scores[term] * weights[term]
+
+  # assign all results back at once
+  result = {
+    'trend_score': trend_score,
+    'major_score': major_score,
+    'trigger_score': trigger_score,
+    'trigger_score_description': trigger_description,
+    'position_score': position_score,
+    'position_score_description': position_description,
+    'inday_trend_score': inday_trend_score,
+    'inday_trend_score_description': inday_trend_score_description,
+  }
+  for term in ['short', 'middle', 'long']:
+    result[f'{term}_trend_score'] = term_scores[term]
+    result[f'{term}_trend_score_description'] = term_descriptions[term]
+  result.update({
+    'up_score': up_score,
+    'down_score': down_score,
+    'up_score_description': up_score_description,
+    'down_score_description': down_score_description,
+    'trigger_day': trigger_day,
+  })
+  df = df.assign(**result)
 
   return df
 
 # calculate signal according to features
-def calculate_ta_signal(df):
+def calculate_ta_signal(df, tail_only=None):
   """
   Calculate signal according to features.
 
   :param df: dataframe with ta features and derived features for calculating signals
+  :param tail_only: only calculate potential/signal for (and return) the last tail_only rows, scores and trend days are still calculated on the whole history since trend days accumulate over it
   :raturns: dataframe with signal
   :raises: None
   """
@@ -1067,30 +1263,36 @@ def calculate_ta_signal(df):
   df = calculate_ta_score(df)
   
   # ================================ calculate trend ========================
-  for term in ['inday', 'short', 'middle', 'long', '']:
-    
-    trend_col = f'{term}_trend' if term != '' else 'trend'
-    score_col = f'{term}_trend_score' if term != '' else 'trend_score'
-    day_col = f'{term}_day' if term != '' else 'trend_day'
+  # all terms are calculated together, each column of the arrays for a term
+  terms = ['inday', 'short', 'middle', 'long', '']
+  trend_cols = [f'{term}_trend' if term != '' else 'trend' for term in terms]
+  score_cols = [f'{term}_trend_score' if term != '' else 'trend_score' for term in terms]
+  day_cols = [f'{term}_day' if term != '' else 'trend_day' for term in terms]
 
-    df[score_col] = df[score_col].round(2)
+  score_values = df[score_cols].to_numpy(dtype=np.float64).round(2)
 
-    # term trend
-    term_trend_conditions = {
-      'up':     f'{score_col} > 0.1', 
-      'down':   f'{score_col} < -0.1',
-    } 
-    term_trend_values = {
-      'up':     'u', 
-      'down':   'd',
-    }
-    df = assign_condition_value(df=df, column=trend_col, condition_dict=term_trend_conditions, value_dict=term_trend_values, default_value='n')
+  # term trend
+  trend_codes = np.select([score_values > 0.1, score_values < -0.1], [1, -1], default=0)
+  trend_values = np.select([trend_codes == 1, trend_codes == -1], ['u', 'd'], default='n')
+
+  # term trend day
+  trend_days = _sda_columns_kernel(trend_codes.astype(np.float64), 1.0, True, False).astype(np.int64)
 
-    # term trend day
-    df[day_col] = sda(df[trend_col].replace({"u":1, "d":-1, "n":0}), zero_as=1)
+  # term trend score change
+  score_changes = np.full(score_values.shape, np.nan)
+  score_changes[1:] = score_values[1:] - score_values[:-1]
 
-    # term trend score change
-    df = cal_change(df=df, target_col=score_col, periods=1, add_accumulation=False, add_prefix=True)
+  result = {}
+  for i in range(len(terms)):
+    result[score_cols[i]] = score_values[:, i]
+    result[trend_cols[i]] = trend_values[:, i]
+    result[day_cols[i]] = trend_days[:, i]
+    result[f'{score_cols[i]}_change'] = score_changes[:, i]
+  df = df.assign(**result)
+
+  # potential and signal only depend on the current row
+  if tail_only is not None:
+    df = df.iloc[-tail_only:].copy()
 
   # ================================ calculate potential ====================
   # label score
@@ -1101,15 +1303,17 @@ def calculate_ta_signal(df):
     '触发':         f'(((0 < trigger_day < 5 and trigger_score > 0.3) or (trigger_day == 1)) and (trend_score_change > 0 and (trend_score > 0 or (trend_score > -0.5 and short_day > 0)))) ',
     '超卖':         f'(0 < bb_day < 5 and candle_color == 1)'
     } 
-  for c in potential_conditions.keys():
-    tmp_condition = potential_conditions[c]
-    tmp_idx = df.query(tmp_condition).index
-    df.loc[tmp_idx, 'potential'] = 'potential'
-    df.loc[tmp_idx, 'potential_score'] += 1
-    df.loc[tmp_idx, 'potential_description'] += f'{c}, '
+  potential_masks = eval_conditions(df=df, condition_dict=potential_conditions)
+  potential_score = np.zeros(len(df), dtype=int)
+  potential_tokens = [[] for _ in range(len(df))]
+  for c in potential_masks.keys():
+    tmp_mask = potential_masks[c]
+    potential_score += tmp_mask
+    for row in np.flatnonzero(tmp_mask):
+      potential_tokens[row].append(c)
+  df['potential'] = np.where(np.logical_or.reduce(list(potential_masks.values())), 'potential', '')
 
   # remove false alarm
-  none_potential_idx = []
   none_potential_conditions = {
     '价格下跌':       f'potential == "potential" and ((rate < -0.05) or (shadow_trend == "u" and upper_shadow_trend == "u") or (candle_color == -1 and entity_trend == "u"))',
     '短暂反弹':       f'potential == "potential" and ((adx_diff_ma < 0 and (adx_direction_day == 1 or (adx_direction_day < 0 and adx_value_change > 0) or adx_value_change < 0)) and ((ichimoku_distance <= 0 or ichimoku_distance_day <= -3) and (kama_distance <= 0 or kama_distance_day <= -3)))',
@@ -1119,15 +1323,16 @@ def calculate_ta_signal(df):
   if 'linear_slope' in df.columns:
     none_potential_conditions['linear wave'] = f'potential == "potential" and (linear_fit_high_slope == 0 and linear_fit_low_slope == 0)'
 
-  for c in none_potential_conditions.keys():
-    tmp_condition = none_potential_conditions[c]
-    tmp_idx = df.query(tmp_condition).index
-    none_potential_idx += tmp_idx.tolist()
-    df.loc[tmp_idx, 'potential_score'] += -1
-    df.loc[tmp_idx, 'potential_description'] += f'{c}, '
-  none_potential_idx = list(set(none_potential_idx))
-  df.loc[none_potential_idx, 'potential'] = ''
-  df['potential_description'] = df['potential_description'].apply(lambda x: x[:-2])
+  none_potential_masks = eval_conditions(df=df, condition_dict=none_potential_conditions)
+  for c in none_potential_masks.keys():
+    tmp_mask = none_potential_masks[c]
+    potential_score -= tmp_mask
+    for row in np.flatnonzero(tmp_mask):
+      potential_tokens[row].append(c)
+  none_potential_mask = np.logical_or.reduce(list(none_potential_masks.values()))
+  df['potential'] = np.where(none_potential_mask, '', df['potential'])
+  df['potential_score'] = potential_score
+  df['potential_description'] = pd.array([', '.join(x) for x in potential_tokens], dtype=default_description_dtype)
 
   # ================================ calculate signal =======================
   # signal
@@ -1201,6 +1406,29 @@ def visualization(df, start=None, end=None, interval='day', title=None, save_pat
   except Exception as e:
     print(phase, e)
 
+# visualize features and signals for multiple symbols in parallel
+def visualization_batch(data, start=None, end=None, interval='day', save_path=None, visualization_args={}, max_workers=None):
+  """
+  Visualize features and signals for multiple symbols, each symbol is rendered with the non-interactive Agg backend in a seperate process.
+
+  :param data: dictionary of dataframes with ta indicators, keys are used as titles
+  :param start: start date to draw
+  :param end: end date to draw
+  :param interval: interval of the data
+  :param save_path: to where the plots will be saved
+  :param visualization_args: arguments for plotting (show_image is ignored, images can only be saved in worker processes)
+  :param max_workers: number of worker processes (None for number of cpus)
+  :returns: None
+  :raises: none
+  """
+  visualization_args = visualization_args.copy()
+  visualization_args['show_image'] = False
+
+  with ProcessPoolExecutor(max_workers=max_workers, initializer=matplotlib.use, initargs=('Agg',)) as executor:
+    futures = [executor.submit(visualization, df=data[title], start=start, end=end, interval=interval, title=title, save_path=save_path, visualization_args=visualization_args) for title in data.keys()]
+    for future in futures:
+      future.result()
+
 # postprocess
 def postprocess(df, keep_columns, drop_columns, sec_names, target_interval=''):
   """
@@ -1222,7 +1450,7 @@ def postprocess(df, keep_columns, drop_columns, sec_names, target_interval=''):
   df = df.reset_index().copy()
 
   # overbuy/oversell
-  df['obos'] = df['bb_trend'].replace({'d': '超买', 'u': '超卖', 'n': ''})
+  df['obos'] = df['bb_trend'].astype(object).replace({'d': '超买', 'u': '超卖', 'n': ''})
 
   # sort symbols
   df = df.sort_values(['adx_day', 'adx_value', 'adx_direction_day', 'prev_adx_extreme'], ascending=[True, True, True, True])
@@ -1271,6 +1499,60 @@ def fillna(series, fill_value=0):
   series.replace([np.inf, -np.inf], np.nan).fillna(fill_value)
   return series
 
+# backward fill na and inf values for series
+def bfillna(series):
+  """
+  Backward fill na and inf values for a series in a single pass
+
+  :param series: series (or dataframe) to backward fill
+  :returns: series with na/inf values replaced by the next valid value
+  :raises: none
+  """
+  return series.where(np.isfinite(series)).bfill()
+
+# downcast numeric columns for dataframe
+def downcast(df, day_suffix='_day'):
+  """
+  Downcast integer day-count columns to int16 (int32 for very long dataframes), float columns are kept in float64 as they are compared with prices and with 0 in conditions
+
+  :param df: original dataframe
+  :param day_suffix: suffix of day-count columns
+  :returns: dataframe with day-count columns downcasted
+  :raises: none
+  """
+  day_cols = [col for col in df.select_dtypes(include=[np.integer]).columns if str(col).endswith(day_suffix)]
+  if len(day_cols) > 0:
+    day_dtype = np.int16 if len(df) <= np.iinfo(np.int16).max else np.int32
+    df[day_cols] = df[day_cols].astype(day_dtype)
+
+  return df
+
+# categorical dtype of trend/signal columns
+def _category_dtype(column, trend_suffix='_trend', signal_suffix='_signal'):
+  if str(column).endswith(trend_suffix):
+    return default_trend_dtype
+  elif str(column).endswith(signal_suffix):
+    return default_signal_dtype
+  return None
+
+# convert trend/signal columns to categorical dtype
+def categorize(df, trend_suffix='_trend', signal_suffix='_signal'):
+  """
+  Convert object/string trend/signal columns to categorical dtype, values out of the categories become NaN
+
+  :param df: original dataframe
+  :param trend_suffix: suffix of trend columns (default_trend_dtype)
+  :param signal_suffix: suffix of signal columns (default_signal_dtype)
+  :returns: dataframe with trend/signal columns categorized
+  :raises: none
+  """
+  for col in df.select_dtypes(include=[object, 'str']).columns:
+    dtype = _category_dtype(col, trend_suffix=trend_suffix, signal_suffix=signal_suffix)
+    if dtype is not None:
+      df[col] = df[col].astype(dtype)
+
+  return df
+
 # get max/min in 2 values
 def get_min_max(x1, x2, f='min'):
   """
@@ -1292,31 +1574,123 @@ def get_min_max(x1, x2, f='min'):
   else:
     return np.nan    
     
+# filter rows that meet specific conditions
+def filter_mask(df, condition_dict):
+  """
+  # Filter rows that meet conditions
+
+  :param df: dataframe to search
+  :param condition_dict: dictionary of conditions, each condition is a query string, a boolean mask aligned with df or a callable that takes df and returns such a mask
+  :returns: dictionary of boolean arrays that mark rows meet corresponding conditions, rows that meet none of them are marked in 'other'
+  :raises: None
+  """
+  # target rows
+  result = eval_conditions(df=df, condition_dict=condition_dict)
+
+  # other rows
+  other_mask = np.ones(len(df), dtype=bool)
+  for i in result.keys():
+    other_mask &= ~result[i]
+  result['other'] = other_mask
+
+  return result
+
 # filter index that meet conditions
 def filter_idx(df, condition_dict):
   """
   # Filter index that meet conditions
 
   :param df: dataframe to search
-  :param condition_dict: dictionary of conditions
+  :param condition_dict: dictionary of conditions, each condition is a query string, a boolean mask aligned with df or a callable that takes df and returns such a mask
   :returns: dictionary of index that meet corresponding conditions
   :raises: None
   """
-  # target index
+  # index of target rows and other rows
   result = {}
-  for condition in condition_dict.keys():
-    result[condition] = df.query(condition_dict[condition]).index
+  masks = filter_mask(df=df, condition_dict=condition_dict)
+  for condition in masks.keys():
+    result[condition] = df.index[masks[condition]]
 
-  # other index
-  other_idx = df.index
-  for i in result.keys():
-    other_idx = [x for x in other_idx if x not in result[i]]
-  result['other'] = other_idx
+  return result
+
+# rewrite "and/or/not" and chained comparisons of a condition string into elementwise numpy operations
+class ConditionTransformer(ast.NodeTransformer):
+
+  def visit_BoolOp(self, node):
+    self.generic_visit(node)
+    op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+    result = node.values[0]
+    for value in node.values[1:]:
+      result = ast.BinOp(left=result, op=op, right=value)
+    return result
+
+  def visit_UnaryOp(self, node):
+    self.generic_visit(node)
+    if isinstance(node.op, ast.Not):
+      return ast.UnaryOp(op=ast.Invert(), operand=node.operand)
+    return node
+
+  def visit_Compare(self, node):
+    self.generic_visit(node)
+    left = node.left
+    result = None
+    for op, right in zip(node.ops, node.comparators):
+      if isinstance(op, (ast.In, ast.NotIn)):
+        tmp_compare = ast.Call(func=ast.Attribute(value=ast.Name(id='np', ctx=ast.Load()), attr='isin', ctx=ast.Load()), args=[left, right], keywords=[])
+        if isinstance(op, ast.NotIn):
+          tmp_compare = ast.UnaryOp(op=ast.Invert(), operand=tmp_compare)
+      else:
+        tmp_compare = ast.Compare(left=left, ops=[op], comparators=[right])
+      result = tmp_compare if result is None else ast.BinOp(left=result, op=ast.BitAnd(), right=tmp_compare)
+      left = right
+    return result
+
+# compiled conditions, keyed by condition string
+compiled_conditions = {}
+
+# compile condition string into code object
+def compile_condition(condition):
+  """
+  Compile a query-style condition string into a code object which works on numpy arrays, compiled conditions are cached
+
+  :param condition: condition string, e.g. '(0 < bb_day < 5 and candle_color == 1)', "x in [...]" is evaluated with np.isin
+  :returns: a tuple of (code object, column names used in the condition)
+  :raises: SyntaxError
+  """
+  if condition not in compiled_conditions.keys():
+    tree = ast.parse(condition.strip(), mode='eval')
+    tree = ast.fix_missing_locations(ConditionTransformer().visit(tree))
+    columns = sorted(set([node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and node.id != 'np']))
+    compiled_conditions[condition] = (compile(tree, '<condition>', 'eval'), columns)
+
+  return compiled_conditions[condition]
+
+# evaluate conditions into boolean masks
+def eval_conditions(df, condition_dict):
+  """
+  # Evaluate conditions into boolean masks
+
+  :param df: dataframe to search
+  :param condition_dict: dictionary of conditions, each condition is a query string, a boolean mask aligned with df or a callable that takes df and returns such a mask
+  :returns: dictionary of boolean arrays that mark rows meet corresponding conditions
+  :raises: None
+  """
+  result = {}
+  for condition in condition_dict.keys():
+    tmp_condition = condition_dict[condition]
+    if isinstance(tmp_condition, str):
+      code, columns = compile_condition(tmp_condition)
+      # categorical columns are passed as Categorical, so that they are compared by codes
+      values = {col: df[col].array if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].to_numpy() for col in columns}
+      tmp_condition = eval(code, {'__builtins__': {}, 'np': np}, values)
+    elif callable(tmp_condition):
+      tmp_condition = tmp_condition(df)
+    result[condition] = np.broadcast_to(np.asarray(tmp_condition, dtype=bool), (len(df), ))
 
   return result
 
 # set value to column of indeies that meet specific conditions
-def assign_condition_value(df, column, condition_dict, value_dict, default_value=None):
+def assign_condition_value(df, column, condition_dict, value_dict, default_value=None, copy=False):
   """
   # set value to column of index that meet conditions
 
@@ -1325,26 +1699,34 @@ def assign_condition_value(df, column, condition_dict, value_dict, default_value
   :param condition_dict: dictionary of conditions
   :param value_dict: corresponding value to assign to the column
   :param default_value: default value of the column
+  :param copy: whether to copy df, by default the column is set on df in place
   :returns: dataframe with the column set
   :raises: None
   """
   # copy dataframe
-  df = df.copy()
+  if copy:
+    df = df.copy()
   
-  # set default value of column
+  # set default value of column, trend/signal columns are created as categoricals (values out of the categories become NaN)
   if default_value is not None:
-    df[column] = default_value
+    dtype = _category_dtype(column)
+    if dtype is not None:
+      df[column] = pd.Series(default_value, index=df.index, dtype=dtype)
+    else:
+      df[column] = default_value
   
-  # set condition value to filterd index
-  filtered_idx = filter_idx(df=df, condition_dict=condition_dict)
+  # set condition value to filterd rows
+  filtered_mask = filter_mask(df=df, condition_dict=condition_dict)
   for k in value_dict.keys():
-    condition_idx = filtered_idx.get(k)
+    condition_mask = filtered_mask.get(k)
     condition_value = value_dict[k]
+    if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype) and condition_value not in df[column].cat.categories:
+      condition_value = np.nan
 
-    if condition_idx is None:
+    if condition_mask is None:
       print(f'{k} not found in filter')
     else:
-      df.loc[condition_idx, column] = condition_value
+      df.loc[condition_mask, column] = condition_value
   
   return df
 
@@ -1380,6 +1762,19 @@ def em(series, periods, fillna=False):
     return series.ewm(span=periods, min_periods=0)
   return series.ewm(span=periods, min_periods=periods)  
 
+# weighted moving average kernel: windows that contain NaN are left as NaN
+@njit(cache=True)
+def _wma_kernel(values, periods):
+  result = np.full(len(values), np.nan)
+  weight = np.arange(1, periods + 1) * 2.0 / (periods * (periods + 1))
+  for i in range(periods - 1, len(values)):
+    weighted_sum = 0.0
+    for k in range(periods):
+      weighted_sum += weight[k] * values[i - periods + 1 + k]
+    result[i] = weighted_sum
+
+  return result
+
 # weighted moving average
 def wma(series, periods, fillna=False):
   """
@@ -1391,74 +1786,184 @@ def wma(series, periods, fillna=False):
   :returns: a rolling weighted average of 'series' with window size 'periods'
   :raises: none
   """
-  weight = pd.Series([i * 2 / (periods * (periods + 1)) for i in range(1, periods + 1)])
-  weighted_average = sm(series=series, periods=periods).apply(lambda x: (weight * x).sum(), raw=True)
+  weighted_average = pd.Series(_wma_kernel(series.to_numpy(dtype=np.float64), periods), index=series.index, name=series.name)
   return weighted_average
 
+# same direction accumulation kernel
+@njit(cache=True)
+def _sda_kernel(values, zero_as, use_zero_as, one_restart):
+  result = values.copy()
+  for i in range(1, len(values)):
+    current_val = values[i]
+    previous_val = result[i-1]
+
+    if current_val * previous_val > 0:
+      if one_restart and (current_val == 1 or current_val == -1):
+        result[i] = current_val
+      else:
+        result[i] = current_val + previous_val
+
+    # current value is 0 and previous value is not 0
+    elif current_val == 0 and previous_val != 0:
+      if use_zero_as:
+        if previous_val > 0:
+          result[i] = previous_val + zero_as
+        else:
+          result[i] = previous_val - zero_as
+
+    # otherwise(different direction, previous(and current) value is 0)
+  
+  return result
+
+# same direction accumulation kernel for each column of a 2d array
+@njit(cache=True)
+def _sda_columns_kernel(values, zero_as, use_zero_as, one_restart):
+  result = np.empty_like(values)
+  for j in range(values.shape[1]):
+    result[:, j] = _sda_kernel(values[:, j].copy(), zero_as, use_zero_as, one_restart)
+  
+  return result
+
+# same direction accumulation without zero_as/one_restart: cumsum within runs of the same sign
+def _sda_runs(values):
+  sign = np.sign(values)
+  is_nan = np.isnan(values)
+
+  # a run starts at the first value, on sign change, and at every 0 or NaN
+  run_start = np.ones(len(values), dtype=bool)
+  run_start[1:] = (sign[1:] != sign[:-1]) | (sign[1:] == 0) | is_nan[1:] | is_nan[:-1]
+
+  # subtract the cumsum before the start of each run
+  filled = np.where(is_nan, 0.0, values)
+  cumsum = np.cumsum(filled)
+  start_idx = np.where(run_start, np.arange(len(values)), 0)
+  np.maximum.accumulate(start_idx, out=start_idx)
+  result = cumsum - (cumsum - filled)[start_idx]
+  result[is_nan] = np.nan
+
+  return result
+
 # same direction accumulation
 def sda(series, zero_as=None, one_restart=False):
   """
   Accumulate value with same symbol (+/-), once the symbol changed, start over again
 
   :param series: series to calculate
-  :param accumulate_by: if None, accumulate by its own value, other wise, add by specified value
-  :param zero_val: action when encounter 0: if None pass, else add(minus) spedicied value according to previous symbol 
+  :param zero_as: action when encounter 0: if None pass, else add(minus) spedicied value according to previous symbol 
+  :param one_restart: whether to restart accumulation when encounter 1(-1)
   :returns: series with same direction accumulation
   :raises: None
   """
-  # copy series
-  target_col = series.name
-  index_col = series.index.name
-  new_series = series.reset_index()
+  values = series.to_numpy(dtype=np.float64)
+  if zero_as is None and not one_restart:
+    result = _sda_runs(values)
+  else:
+    result = _sda_kernel(values, 0.0 if zero_as is None else float(zero_as), zero_as is not None, one_restart)
 
-  if index_col is None:
-    print('please assigan a name to index column')
+  # keep integer series integer (widened, accumulation may overflow small integer types)
+  if np.issubdtype(series.dtype, np.integer) and (zero_as is None or float(zero_as).is_integer()):
+    result = result.astype(np.int64)
 
-  previous_idx = None
-  current_idx = None
-  for index, row in new_series.iterrows():
-    
-    # record current index
-    current_idx = index
+  return pd.Series(result, index=series.index, name=series.name)
 
-    # for the first loop
-    if previous_idx is None:
-      pass
-    
-    # for the rest of loops
-    else:
-      current_val = new_series.loc[current_idx, target_col]
-      previous_val = new_series.loc[previous_idx, target_col]
+# convert trend values to int codes
+def trend_to_int(series, pos_trend='u', neg_trend='d'):
+  """
+  Convert trend values to int codes: pos_trend as 1, neg_trend as -1, others(including '', 'n' and NaN) as 0
 
-      if current_val * previous_val > 0:
-        if one_restart and current_val in [1, -1]:
-          new_series.loc[current_idx, target_col] = current_val
+  :param series: series of trend values
+  :param pos_trend: value of positive trend
+  :param neg_trend: value of negative trend
+  :returns: series of int8 trend codes
+  :raises: None
+  """
+  # categorical trends: look up category codes in a small table(the last slot is for NaN, whose code is -1)
+  if isinstance(series.dtype, pd.CategoricalDtype):
+    categories = series.cat.categories
+    lookup = np.zeros(len(categories) + 1, dtype=np.int8)
+    lookup[:-1][categories == pos_trend] = 1
+    lookup[:-1][categories == neg_trend] = -1
+    codes = lookup[series.cat.codes.to_numpy()]
 
-        else:
-          new_series.loc[current_idx, target_col] = current_val + previous_val
-      
-      # current value is 0 and previous value is not 0
-      elif current_val == 0 and previous_val != 0:
-        if zero_as is not None:
-          if previous_val > 0:
-            new_series.loc[current_idx, target_col] = previous_val + zero_as
-          else: 
-            new_series.loc[current_idx, target_col] = previous_val - zero_as
-
-      # otherwise(different direction, previous(and current) value is 0)
-      else:
-        pass
+  else:
+    values = series.to_numpy(dtype=object)
+    codes = np.zeros(len(values), dtype=np.int8)
+    codes[values == pos_trend] = 1
+    codes[values == neg_trend] = -1
 
-    # record previous index
-    previous_idx = index
+  return pd.Series(codes, index=series.index, name=series.name)
 
-  # reset index back
-  if index_col is not None:
-    new_series = new_series.set_index(index_col)[target_col].copy()
-  else:
-    new_series = new_series[target_col].copy()
+# forward fill int codes
+def ffill_codes(codes, valid):
+  """
+  Forward fill int codes: rows that are not valid take the code of the latest valid row
+
+  :param codes: array of int codes
+  :param valid: boolean array, marks rows that hold valid codes
+  :returns: a tuple of arrays: (filled codes, whether each row has a valid code after filling)
+  :raises: None
+  """
+  last_valid = np.where(valid, np.arange(len(codes)), 0)
+  np.maximum.accumulate(last_valid, out=last_valid)
+  filled = np.logical_or.accumulate(valid)
+  codes = np.where(filled, codes[last_valid], 0).astype(codes.dtype)
+
+  return codes, filled
 
-  return new_series
+# forward fill NaN values along rows
+def ffill_values(values):
+  """
+  Forward fill NaN values of a 1d array, or of each column of a 2d array: NaN rows take the value of the latest non-NaN row
+
+  :param values: float array
+  :returns: array with NaN values forward filled (leading NaN values are kept)
+  :raises: None
+  """
+  rows = np.arange(len(values)).reshape((-1, ) + (1, ) * (values.ndim - 1))
+  last_valid = np.where(np.isnan(values), 0, rows)
+  np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+
+  return np.take_along_axis(values, last_valid, axis=0)
+
+# moving slope kernel: closed-form least squares on x = 0..periods-1, with rolling sums of y and x*y
+@njit(cache=True)
+def _moving_slope_kernel(values, periods):
+  n = len(values)
+  slopes = np.full(n, np.nan)
+  intercepts = np.full(n, np.nan)
+
+  sx = periods * (periods - 1) / 2.0
+  sx2 = (periods - 1) * periods * (2 * periods - 1) / 6.0
+  denom = periods * sx2 - sx * sx
+
+  # rolling sums ignore NaNs, windows that contain NaN are left as NaN
+  sy = 0.0
+  sxy = 0.0
+  nan_count = 0
+  for i in range(n):
+
+    # remove the value that leaves the window and shift x of the remaining values by -1
+    if i >= periods:
+      out_val = values[i - periods]
+      if np.isnan(out_val):
+        nan_count -= 1
+        out_val = 0.0
+      sy -= out_val
+      sxy -= sy
+
+    # add the value that enters the window at x = periods-1
+    in_val = values[i]
+    if np.isnan(in_val):
+      nan_count += 1
+      in_val = 0.0
+    sxy += min(i, periods - 1) * in_val
+    sy += in_val
+
+    if i >= periods - 1 and nan_count == 0:
+      slopes[i] = (periods * sxy - sx * sy) / denom
+      intercepts[i] = (sy - slopes[i] * sx) / periods
+
+  return slopes, intercepts
 
 # moving slope
 def moving_slope(series, periods):
@@ -1470,18 +1975,199 @@ def moving_slope(series, periods):
   :returns: a tuple of series: (slope, intercepts)
   :raises: none
   """  
-  # convert series to numpy array
-  np_series = series.to_numpy()
-  stride = np_series.strides
-  slopes, intercepts = np.polyfit(np.arange(periods), as_strided(np_series, (len(series)-periods+1, periods), stride+stride).T, deg=1)
-
-  # padding NaNs on the top
-  padding_nan = np.full((periods-1, ), np.nan)
-  padded_slopes = np.concatenate([padding_nan, slopes])
-  padded_intercepts = np.concatenate([padding_nan, intercepts])
+  # slopes and intercepts with NaNs padded on the top
+  padded_slopes, padded_intercepts = _moving_slope_kernel(series.to_numpy(dtype=np.float64), periods)
   
   return (padded_slopes, padded_intercepts)
 
+# moving z-score kernel: (x - rolling mean) / rolling std(ddof=1), with the online(Welford) update that pandas rolling var uses
+@njit(cache=True)
+def _moving_zscore_kernel(values, periods):
+  n = len(values)
+  result = np.full(n, np.nan)
+
+  # windows that contain NaN are left as NaN, windows of the same value are reset to mean = value and std = 0
+  nobs = 0
+  nan_count = 0
+  mean = 0.0
+  ssqdm = 0.0
+  same_count = 0
+  prev_val = np.nan
+  for i in range(n):
+
+    # remove the value that leaves the window
+    if i >= periods:
+      out_val = values[i - periods]
+      if np.isnan(out_val):
+        nan_count -= 1
+      else:
+        nobs -= 1
+        if nobs > 0:
+          delta = out_val - mean
+          mean -= delta / nobs
+          ssqdm -= ((nobs + 1) * delta * delta) / nobs
+        else:
+          mean = 0.0
+          ssqdm = 0.0
+
+    # add the value that enters the window
+    in_val = values[i]
+    if np.isnan(in_val):
+      nan_count += 1
+    else:
+      nobs += 1
+      delta = in_val - mean
+      mean += delta / nobs
+      ssqdm += ((nobs - 1) * delta * delta) / nobs
+
+      same_count = same_count + 1 if in_val == prev_val else 1
+      prev_val = in_val
+      if same_count >= nobs:
+        mean = in_val
+        ssqdm = 0.0
+
+    if i >= periods - 1 and nan_count == 0 and periods > 1:
+      std = np.sqrt(max(ssqdm / (nobs - 1), 0.0))
+      diff = in_val - mean
+      if std > 0:
+        result[i] = diff / std
+      elif diff != 0:
+        result[i] = np.inf if diff > 0 else -np.inf
+
+  return result
+
+# moving z-score
+def moving_zscore(series, periods):
+  """
+  Calculate z-score of values in a moving window: (value - mean) / std (ddof=1), windows that contain NaN are left as NaN
+
+  :param series: series to calculate
+  :param periods: size of the moving window
+  :returns: float64 array of z-scores
+  :raises: none
+  """
+  return _moving_zscore_kernel(series.to_numpy(dtype=np.float64), periods)
+
+
+# candle gap kernel: gap(up 1/2, down -1/-2), gap color and forward filled gap top/bottom
+@njit(cache=True)
+def _candle_gap_kernel(high, low):
+  n = len(high)
+  gap = np.zeros(n, dtype=np.int64)
+  gap_color = np.zeros(n, dtype=np.int64)
+  gap_top = np.full(n, np.nan)
+  gap_bottom = np.full(n, np.nan)
+
+  # mean of gap up(low - previous high > 0) and gap down(previous low - high > 0)
+  up_sum = 0.0
+  up_count = 0
+  down_sum = 0.0
+  down_count = 0
+  for i in range(1, n):
+    up = low[i] - high[i-1]
+    down = low[i-1] - high[i]
+    if up > 0:
+      up_sum += up
+      up_count += 1
+    if down > 0:
+      down_sum += down
+      down_count += 1
+  up_mean = up_sum / up_count if up_count > 0 else 0.0
+  down_mean = down_sum / down_count if down_count > 0 else 0.0
+
+  # strict gaps(>= mean) are only marked when they are rare(< 5% of rows)
+  strict_up_count = 0
+  strict_down_count = 0
+  for i in range(1, n):
+    up = low[i] - high[i-1]
+    down = low[i-1] - high[i]
+    if up > 0 and up >= up_mean:
+      strict_up_count += 1
+    if down > 0 and down >= down_mean:
+      strict_down_count += 1
+  use_strict_up = strict_up_count / n < 0.05
+  use_strict_down = strict_down_count / n < 0.05
+
+  # mark gaps and forward fill gap top/bottom
+  top = np.nan
+  bottom = np.nan
+  for i in range(1, n):
+    up = low[i] - high[i-1]
+    down = low[i-1] - high[i]
+    strict_up = use_strict_up and up > 0 and up >= up_mean
+    strict_down = use_strict_down and down > 0 and down >= down_mean
+
+    if strict_up:
+      gap[i] = 2
+    elif up > 0:
+      gap[i] = 1
+    elif strict_down:
+      gap[i] = -2
+    elif down > 0:
+      gap[i] = -1
+
+    if strict_up:
+      gap_color[i] = 1
+      top = low[i]
+      bottom = high[i-1]
+    elif strict_down:
+      gap_color[i] = -1
+      top = low[i-1]
+      bottom = high[i]
+
+    gap_top[i] = top
+    gap_bottom[i] = bottom
+
+  return gap, gap_color, gap_top, gap_bottom
+
+
+# heikin-ashi kernel: H_Open from previous open/close, H_High/H_Low from previous high/low, H_Open and H_Close(NaN skipped)
+@njit(cache=True)
+def _ha_kernel(o, h, l, c):
+  n = len(o)
+  ho = np.full(n, np.nan)
+  hh = np.full(n, np.nan)
+  hl = np.full(n, np.nan)
+  hc = (o + h + l + c) / 4
+
+  for i in range(1, n):
+    ho[i] = (o[i-1] + c[i-1]) / 2
+
+  for i in range(n):
+    prev_h = h[i-1] if i > 0 else np.nan
+    prev_l = l[i-1] if i > 0 else np.nan
+    for v in (prev_h, ho[i], hc[i]):
+      if not np.isnan(v) and (np.isnan(hh[i]) or v > hh[i]):
+        hh[i] = v
+    for v in (prev_l, ho[i], hc[i]):
+      if not np.isnan(v) and (np.isnan(hl[i]) or v < hl[i]):
+        hl[i] = v
+
+  return hc, ho, hh, hl
+
+
+# compile jit kernels ahead of calculation
+
+def compile_kernels():
+  """
+  Compile jit kernels on small inputs (both writable and read-only arrays, as pandas may return either), so the first calculation does not wait for compilation. With cache=True compiled kernels are written to disk and loaded by later processes.
+
+  :returns: None
+  :raises: None
+  """
+  writable = np.zeros(3)
+  readonly = np.zeros(3)
+  readonly.setflags(write=False)
+
+  for values in [writable, readonly]:
+    _sda_kernel(values, 0.0, False, False)
+    _sda_columns_kernel(values.reshape(-1, 1), 0.0, False, False)
+    _wma_kernel(values, 2)
+    _moving_slope_kernel(values, 2)
+    _candle_gap_kernel(values, values)
+    _moving_zscore_kernel(values, 2)
+    _ha_kernel(values, values, values, values)
+
 # normilization
 def normalize(series, fillna=None):
   normalaized = series
@@ -1501,7 +2187,7 @@ def min_max_normalize(series, fillna=None):
 
 # ================================================ Change calculation =============================================== #
 # calculate change of a column in certain period
-def cal_change(df, target_col, periods=1, add_accumulation=True, add_prefix=False, drop_na=False):
+def cal_change(df, target_col, periods=1, add_accumulation=True, add_prefix=False, drop_na=False, copy=True):
   """
   Calculate change of a column with a sliding window
   
@@ -1511,11 +2197,13 @@ def cal_change(df, target_col, periods=1, add_accumulation=True, add_prefix=Fals
   :param add_accumulation: wether to add accumulative change in a same direction
   :param add_prefix: whether to add prefix for the result columns (when there are multiple target columns to calculate)
   :param drop_na: whether to drop na values from dataframe:
+  :param copy: whether to copy df, set to False only when the caller owns df (result columns will be added to it in place)
   :returns: dataframe with change columns
   :raises: none
   """
   # copy dateframe
-  df = df.copy()
+  if copy:
+    df = df.copy()
 
   # set prefix for result columns
   prefix = ''
@@ -1546,8 +2234,22 @@ def cal_change(df, target_col, periods=1, add_accumulation=True, add_prefix=Fals
 
   return df 
 
+# difference between values and their previous values
+def prev_diff(values):
+  """
+  Calculate difference between each value and its previous value (NaN for the first one)
+
+  :param values: numpy array to calculate
+  :returns: float64 array of differences
+  :raises: none
+  """
+  diff = np.empty(len(values), dtype=np.float64)
+  diff[:1] = np.nan
+  diff[1:] = values[1:] - values[:-1]
+  return diff
+
 # calculate change rate of a column in certain period
-def cal_change_rate(df, target_col, periods=1, add_accumulation=True, add_prefix=False, drop_na=False):
+def cal_change_rate(df, target_col, periods=1, add_accumulation=True, add_prefix=False, drop_na=False, copy=True):
   """
   Calculate change rate of a column with a sliding window
   
@@ -1557,11 +2259,13 @@ def cal_change_rate(df, target_col, periods=1, add_accumulation=True, add_prefix
   :param add_accumulation: wether to add accumulative change rate in a same direction
   :param add_prefix: whether to add prefix for the result columns (when there are multiple target columns to calculate)
   :param drop_na: whether to drop na values from dataframe:
+  :param copy: whether to copy df, set to False only when the caller owns df (result columns will be added to it in place)
   :returns: dataframe with change rate columns
   :raises: none
   """
   # copy dfframe
-  df = df.copy()
+  if copy:
+    df = df.copy()
   
   # set prefix for result columns
   prefix = ''
@@ -1574,7 +2278,11 @@ def cal_change_rate(df, target_col, periods=1, add_accumulation=True, add_prefix
   acc_day_col = f'{prefix}acc_day'
 
   # calculate change rate within the period
-  df[rate_col] = df[target_col].pct_change(periods=periods)
+  values = df[target_col].to_numpy(dtype=np.float64)
+  rate = np.full(len(values), np.nan)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    rate[periods:] = values[periods:] / values[:-periods] - 1.0
+  df[rate_col] = rate
   
   # calculate accumulative change rate in a same direction
   if add_accumulation:
@@ -1594,18 +2302,18 @@ def cal_change_rate(df, target_col, periods=1, add_accumulation=True, add_prefix
 
   return df
 
-# calculate score according to conditions
-def cal_score(df, condition_dict, up_score_col, down_score_col):
-
-  # initialization
-  if up_score_col not in df.columns:
-    df[up_score_col] = 0
-  if down_score_col not in df.columns:
-    df[down_score_col] = 0
-  
-  df[f'{up_score_col}_description'] = ''
-  df[f'{down_score_col}_description'] = ''
+# evaluate score according to conditions
+def eval_score(df, condition_dict, up_score_col, down_score_col):
+  """
+  Evaluate score and score description of conditions, without writing them to the dataframe
 
+  :param df: dataframe to search
+  :param condition_dict: dictionary of conditions, each value is [score, label, condition]
+  :param up_score_col: column to accumulate positive scores(keys start with +)
+  :param down_score_col: column to accumulate negative scores(keys start with -)
+  :returns: dictionary of score arrays and dictionary of description arrays, keyed by score column
+  :raises: None
+  """
   # extract score, label and condition from dict
   labels = {}
   scores = {}
@@ -1614,23 +2322,45 @@ def cal_score(df, condition_dict, up_score_col, down_score_col):
     scores[k] = condition_dict[k][0]
     labels[k] = condition_dict[k][1]
     conditions[k] = condition_dict[k][2]
+
+  # evaluate all conditions at once
+  masks = eval_conditions(df=df, condition_dict=conditions)
+
+  # accumulate score and score_description in arrays
+  score_values = {}
+  score_descriptions = {}
+  for col in [up_score_col, down_score_col]:
+    score_values[col] = df[col].to_numpy(dtype=np.float64, copy=True) if col in df.columns else np.zeros(len(df))
+    score_descriptions[col] = np.full(len(df), '', dtype=object)
   
   # calculate score and score_description
   for c in conditions.keys():
-    tmp_idx = df.query(conditions[c]).index
+    tmp_mask = masks[c]
     
     # scores
     if c[0] == '+':
-      df.loc[tmp_idx, up_score_col] += scores[c]
-      df.loc[tmp_idx, f'{up_score_col}_description'] += f'{c}, '
+      target_col = up_score_col
     elif c[0] == '-':
-      df.loc[tmp_idx, down_score_col] +=scores[c]
-      df.loc[tmp_idx, f'{down_score_col}_description'] += f'{c}, '
+      target_col = down_score_col
     else:
       print(f'{c} not recognized')
+      continue
+
+    score_values[target_col] = np.where(tmp_mask, score_values[target_col] + scores[c], score_values[target_col])
+    score_descriptions[target_col] = np.where(tmp_mask, score_descriptions[target_col] + f'{c}, ', score_descriptions[target_col])
+
+  for col in score_values.keys():
+    score_values[col] = score_values[col].round(2)
 
-  df[up_score_col] = df[up_score_col].round(2)
-  df[down_score_col] = df[down_score_col].round(2)
+  return score_values, score_descriptions
+
+# calculate score according to conditions
+def cal_score(df, condition_dict, up_score_col, down_score_col):
+
+  score_values, score_descriptions = eval_score(df=df, condition_dict=condition_dict, up_score_col=up_score_col, down_score_col=down_score_col)
+  for col in score_values.keys():
+    df[col] = score_values[col]
+    df[f'{col}_description'] = score_descriptions[col]
 
   return df
 
@@ -1653,22 +2383,16 @@ def cal_crossover_signal(df, fast_line, slow_line, result_col='signal', pos_sign
   :returns: series of the result column
   :raises: none
   """
-  df = df.copy()
-
   # calculate the distance between fast and slow line
-  df['diff'] = df[fast_line] - df[slow_line]
-  df['diff_prev'] = df['diff'].shift(1)
+  diff_sign = np.sign((df[fast_line] - df[slow_line]).to_numpy(dtype=np.float64))
+  diff_sign_prev = np.concatenate([[np.nan], diff_sign[:-1]])
 
-  # get signals from fast/slow lines cross over
-  conditions = {
-    'up': '(diff >= 0 and diff_prev < 0) or (diff > 0 and diff_prev <= 0)', 
-    'down': '(diff <= 0 and diff_prev > 0) or (diff < 0 and diff_prev >= 0)'} 
-  values = {
-    'up': pos_signal, 
-    'down': neg_signal}
-  df = assign_condition_value(df=df, column=result_col, condition_dict=conditions, value_dict=values, default_value=none_signal)
+  # get signals from fast/slow lines cross over: sign goes up(-1->0, -1->1, 0->1) or down(1->0, 1->-1, 0->-1)
+  up = diff_sign > diff_sign_prev
+  down = diff_sign < diff_sign_prev
+  result = pd.DataFrame({result_col: np.where(up, pos_signal, np.where(down, neg_signal, none_signal))}, index=df.index)
   
-  return df[[result_col]]
+  return result
 
 # calculate signal that generated from trigering boundaries
 def cal_boundary_signal(df, upper_col, lower_col, upper_boundary, lower_boundary, result_col='signal', pos_signal='b', neg_signal='s', none_signal='n'):
@@ -1689,19 +2413,16 @@ def cal_boundary_signal(df, upper_col, lower_col, upper_boundary, lower_boundary
   :returns: series of the result column
   :raises: none
   """
-  # copy dataframe
-  df = df.copy()
+  # boundaries could be either columns or numbers
+  upper_boundary = df[upper_boundary].to_numpy() if upper_boundary in df.columns else float(upper_boundary)
+  lower_boundary = df[lower_boundary].to_numpy() if lower_boundary in df.columns else float(lower_boundary)
 
   # calculate signals
-  conditions = {
-    'up': f'{upper_col} > {upper_boundary}', 
-    'down': f'{lower_col} < {lower_boundary}'} 
-  values = {
-    'up': pos_signal, 
-    'down': neg_signal}
-  df = assign_condition_value(df=df, column=result_col, condition_dict=conditions, value_dict=values, default_value=none_signal)
+  up = df[upper_col].to_numpy() > upper_boundary
+  down = df[lower_col].to_numpy() < lower_boundary
+  result = pd.DataFrame({result_col: np.select([down, up], [neg_signal, pos_signal], default=none_signal)}, index=df.index)
 
-  return df[[result_col]]
+  return result
 
 # replace signal values 
 def replace_signal(df, signal_col='signal', replacement={'b':1, 's':-1, 'n': 0}):
@@ -1716,9 +2437,10 @@ def replace_signal(df, signal_col='signal', replacement={'b':1, 's':-1, 'n': 0})
   # copy dataframe
   new_df = df.copy()
 
-  # find and replace
-  for i in replacement.keys():
-    new_df[signal_col].replace(to_replace=i, value=replacement[i], inplace=True)
+  # find and replace through a lookup table of unique values (the last slot is for NaN)
+  codes, uniques = pd.factorize(new_df[signal_col])
+  lookup = np.array([replacement.get(u, u) for u in uniques] + [np.nan], dtype=object)
+  new_df[signal_col] = pd.Series(lookup[codes], index=new_df.index).infer_objects()
 
   return new_df
 
@@ -1739,17 +2461,22 @@ def remove_redundant_signal(df, signal_col='signal', pos_signal='b', neg_signal=
   # copy dataframe
   df = df.copy()
   
-  # initialize
-  signals = df.query(f'{signal_col} != "{none_signal}"').copy()
+  # initialize: positions and values of signals
+  values = df[signal_col].to_numpy(dtype=object)
+  signal_pos = np.flatnonzero(values != none_signal)
+  signals = values[signal_pos]
   movement = {'first': 1, 'last': -1}.get(keep)
 
-  # find duplicated signals and set to none_signal
+  # find duplicated signals(same as the previous/next signal) and set to none_signal
   if len(signals) > 0 and movement is not None:
-    signals['is_dup'] = signals[signal_col] + signals[signal_col].shift(movement)
-    dup_idx = signals.query(f'is_dup == "{pos_signal}{pos_signal}" or is_dup == "{neg_signal}{neg_signal}"').index
+    if movement == 1:
+      neighbor = np.concatenate([[None], signals[:-1]])
+    else:
+      neighbor = np.concatenate([signals[1:], [None]])
+    is_dup = (signals == neighbor) & ((signals == pos_signal) | (signals == neg_signal))
 
-    if len(dup_idx) > 0:
-      df.loc[dup_idx, signal_col] = none_signal
+    if is_dup.any():
+      df.iloc[signal_pos[is_dup], df.columns.get_loc(signal_col)] = none_signal
 
   return df
 
@@ -1771,11 +2498,14 @@ def linear_fit(df, target_col, periods):
     return {'slope': 0, 'intecept': 0}
   
   else:
-    x = range(1, periods+1)
-    y = df[target_col].fillna(0).tail(periods).values.tolist()
-    lr = linregress(x, y)
+    # least squares on x = 1..periods in closed form
+    x = np.arange(1, periods+1, dtype=np.float64)
+    y = np.nan_to_num(df[target_col].to_numpy(dtype=np.float64)[-periods:])
+    x_diff = x - x.mean()
+    slope = (x_diff * (y - y.mean())).sum() / (x_diff * x_diff).sum()
+    intercept = y.mean() - slope * x.mean()
 
-    return {'slope': lr[0], 'intecept': lr[1]}
+    return {'slope': slope, 'intecept': intercept}
 
 # calculate moving average 
 def cal_moving_average(df, target_col, ma_windows=[50, 105], start=None, end=None, window_type='em'):
@@ -1802,10 +2532,14 @@ def cal_moving_average(df, target_col, ma_windows=[50, 105], start=None, end=Non
     print('Unknown moving window type')
     return df
 
-  # calculate moving averages
+  # calculate moving averages, simple moving averages are calculated by bottleneck when it is installed
+  values = df[target_col].to_numpy(dtype=np.float64)
   for mw in ma_windows:
     ma_col = f'{target_col}_ma_{mw}'
-    df[ma_col] = mw_func(series=df[target_col], periods=mw).mean()
+    if mw_func == sm and bn is not None:
+      df[ma_col] = bn.move_mean(values, window=mw, min_count=mw)
+    else:
+      df[ma_col] = mw_func(series=df[target_col], periods=mw).mean()
   
   return df
 
@@ -1819,9 +2553,6 @@ def add_candlestick_features(df, ohlcv_col=default_ohlcv_col):
   :returns: dataframe with candlestick columns
   :raises: none
   """
-  # copy dataframe
-  df = df.copy()
-
   # set column names
   open = ohlcv_col['open']
   high = ohlcv_col['high']
@@ -1829,86 +2560,53 @@ def add_candlestick_features(df, ohlcv_col=default_ohlcv_col):
   close = ohlcv_col['close']
   # volume = ohlcv_col['volume']
   
+  # raw values of OHLC
+  o = df[open].to_numpy()
+  h = df[high].to_numpy()
+  l = df[low].to_numpy()
+  c = df[close].to_numpy()
+  up = o < c
+  down = o >= c
+
+  # all candlestick columns are calculated on arrays, then added to a new dataframe at once
+  result = {}
+
   # candle color
-  df['candle_color'] = 0
-  up_idx = df[open] < df[close]
-  down_idx = df[open] >= df[close]
-  df.loc[up_idx, 'candle_color'] = 1
-  df.loc[down_idx, 'candle_color'] = -1
+  result['candle_color'] = np.select([up, down], [1, -1], default=0)
   
   # shadow
-  df['candle_shadow'] = (df[high] - df[low])
+  result['candle_shadow'] = h - l
   
   # entity
-  df['candle_entity'] = abs(df[close] - df[open])
+  result['candle_entity'] = np.abs(c - o)
   
   # ======================================= shadow/entity ============================================ #
-  df['candle_entity_top'] = 0
-  df['candle_entity_bottom'] = 0
-  df.loc[up_idx, 'candle_entity_top'] = df.loc[up_idx, close]
-  df.loc[up_idx, 'candle_entity_bottom'] = df.loc[up_idx, open]
-  df.loc[down_idx, 'candle_entity_top'] = df.loc[down_idx, open]  
-  df.loc[down_idx, 'candle_entity_bottom'] = df.loc[down_idx, close]
+  result['candle_entity_top'] = np.select([up, down], [c, o], default=0)
+  result['candle_entity_bottom'] = np.select([up, down], [o, c], default=0)
+
+  result['candle_upper_shadow'] = h - result['candle_entity_top']
+  result['candle_lower_shadow'] = result['candle_entity_bottom'] - l
 
-  df['candle_upper_shadow'] = df[high] - df['candle_entity_top']
-  df['candle_lower_shadow'] = df['candle_entity_bottom'] - df[low]
+  with np.errstate(divide='ignore', invalid='ignore'):
+    result['candle_upper_shadow_pct'] = result['candle_upper_shadow'] / result['candle_shadow']
+    result['candle_lower_shadow_pct'] = result['candle_lower_shadow'] / result['candle_shadow']
+    result['candle_entity_pct'] = result['candle_entity'] / result['candle_shadow']
 
-  df['candle_upper_shadow_pct'] = df['candle_upper_shadow'] / df['candle_shadow']
-  df['candle_lower_shadow_pct'] = df['candle_lower_shadow'] / df['candle_shadow']
-  df['candle_entity_pct'] = df['candle_entity'] / df['candle_shadow']
-  df['candle_entity_middle'] = (df['candle_entity_top'] + df['candle_entity_bottom']) * 0.5
+  # sizes and ratios are only compared with thresholds, so they are stored as float32(price levels keep their precision)
+  for col in ['candle_shadow', 'candle_entity', 'candle_upper_shadow', 'candle_lower_shadow', 'candle_upper_shadow_pct', 'candle_lower_shadow_pct', 'candle_entity_pct']:
+    result[col] = result[col].astype(np.float32)
+  result['candle_entity_middle'] = (result['candle_entity_top'] + result['candle_entity_bottom']) * 0.5
 
   # ======================================= gap ====================================================== #
-  # gap_up / gap_down
-  col_to_drop = [] 
-  for col in [open, close, high, low, 'candle_color', 'candle_entity']:
-    prev_col = f'prev_{col}' 
-    df[prev_col] = df[col].shift(1)
-    col_to_drop.append(prev_col)
-  
-  # initialization
-  df['candle_gap'] = 0
-  df['candle_gap_color'] = 0
-  df['candle_gap_top'] = np.NaN
-  df['candle_gap_bottom'] = np.NaN
-  
-  # gap up
-  df['low_prev_high'] = df[low] - df[f'prev_{high}']
-  gap_up_idx = df.query(f'low_prev_high > 0').index
-  df.loc[gap_up_idx, 'candle_gap'] = 1
-  gap_up_mean = df.loc[gap_up_idx, 'low_prev_high'].mean() # df['low_prev_high'].nlargest(10).values[-1] # 
-  gap_up_mean = 0 if np.isnan(gap_up_mean) else gap_up_mean
-  strict_gap_up_idx = df.query(f'low_prev_high >= {gap_up_mean} and low_prev_high > 0').index
-  if len(strict_gap_up_idx) / len(df) < 0.05:
-    df.loc[strict_gap_up_idx, 'candle_gap'] = 2
-    df.loc[strict_gap_up_idx, 'candle_gap_color'] = 1
-    df.loc[strict_gap_up_idx, 'candle_gap_top'] = df.loc[strict_gap_up_idx, f'{low}']
-    df.loc[strict_gap_up_idx, 'candle_gap_bottom'] = df.loc[strict_gap_up_idx, f'prev_{high}']
-  
-  # gap down
-  df['prev_low_high'] = df[f'prev_{low}'] - df[high]
-  gap_down_idx = df.query(f'prev_low_high > 0').index  
-  df.loc[gap_down_idx, 'candle_gap'] = -1
-  gap_down_mean = df.loc[gap_down_idx, 'prev_low_high'].mean() # df['prev_low_high'].nlargest(10).values[-1] # 
-  gap_down_mean = 0 if np.isnan(gap_down_mean) else gap_down_mean
-  strict_gap_down_idx = df.query(f'prev_low_high >= {gap_down_mean} and prev_low_high > 0').index  
-  if len(strict_gap_down_idx) / len(df) < 0.05:
-    df.loc[strict_gap_down_idx, 'candle_gap'] = -2
-    df.loc[strict_gap_down_idx, 'candle_gap_color'] = -1
-    df.loc[strict_gap_down_idx, 'candle_gap_top'] = df.loc[strict_gap_down_idx, f'prev_{low}']
-    df.loc[strict_gap_down_idx, 'candle_gap_bottom'] = df.loc[strict_gap_down_idx, f'{high}']
-  
-  # gap height, color, top and bottom
-  # df['candle_gap_height'] = df['candle_gap_top'] - df['candle_gap_bottom']
-  df['candle_gap_top'] = df['candle_gap_top'].fillna(method='ffill') 
-  df['candle_gap_bottom'] = df['candle_gap_bottom'].fillna(method='ffill') 
-  df['candle_gap_color'] = df['candle_gap_color'].fillna(method='ffill')
-  # df['candle_gap_height'] = df['candle_gap_height'].fillna(method='ffill')
-  
-  # drop intermidiate columns
-  for c in ['low_prev_high', 'prev_low_high']:
-    col_to_drop.append(c)
-  df = df.drop(col_to_drop, axis=1)
+  # gap_up / gap_down, compared with previous high/low
+  gap, gap_color, gap_top, gap_bottom = _candle_gap_kernel(h.astype(np.float64, copy=False), l.astype(np.float64, copy=False))
+  result['candle_gap'] = gap
+  result['candle_gap_color'] = gap_color
+  # result['candle_gap_height'] = gap_top - gap_bottom
+  result['candle_gap_top'] = gap_top
+  result['candle_gap_bottom'] = gap_bottom
+
+  df = df.assign(**result)
 
   return df
 
@@ -1925,8 +2623,7 @@ def add_candlestick_patterns(df, ohlcv_col=default_ohlcv_col):
       '底部': '(candle_entity_middle < kijun and candle_entity_middle < kama_slow and candle_entity_middle < tankan and candle_entity_middle < kama_fast)'}
     values = {'顶部': 'u', '底部': 'd'}
     df = assign_condition_value(df=df, column='位置_trend', condition_dict=conditions, value_dict=values, default_value='n')
-    df['位置_day'] = df['位置_trend'].replace({'u':1, 'd':-1, 'n':0}).fillna(0).astype(int)
-    df['位置_day'] = sda(series=df['位置_day'], zero_as=1)
+    df['位置_day'] = sda(series=trend_to_int(df['位置_trend']), zero_as=1)
     
     df['moving_max'] = sm(series=df['High'], periods=10).max()
     df['moving_min'] = sm(series=df['Low'], periods=10).min()
@@ -1946,9 +2643,7 @@ def add_candlestick_patterns(df, ohlcv_col=default_ohlcv_col):
     ma_period = 30
     std_factor = 0.7
     for col in ['entity', 'shadow']:
-      df[f'{col}_ma'] = sm(series=df[f'candle_{col}'], periods=ma_period).mean()
-      df[f'{col}_std'] = sm(series=df[f'candle_{col}'], periods=ma_period).std()
-      df[f'{col}_diff'] = (df[f'candle_{col}'] - df[f'{col}_ma'])/df[f'{col}_std']
+      df[f'{col}_diff'] = moving_zscore(series=df[f'candle_{col}'], periods=ma_period).astype(np.float32)
 
     # long/short shadow
     conditions = {
@@ -1975,14 +2670,6 @@ def add_candlestick_patterns(df, ohlcv_col=default_ohlcv_col):
   # gaps between candles
   if 'windows' > '':
 
-    # remove those which have too many gaps
-    up_gap_idxs = df.query('candle_gap == 2').index.tolist()
-    down_gap_idxs = df.query('candle_gap == -2').index.tolist()
-    if len(up_gap_idxs) > 10:
-      up_gap_idxs = []
-    if len(down_gap_idxs) > 10:
-      down_gap_idxs = []
-
     # window(gap)
     conditions = {
       '向上跳空': 'candle_gap > 1', 
@@ -1990,7 +2677,7 @@ def add_candlestick_patterns(df, ohlcv_col=default_ohlcv_col):
     values = {'向上跳空': 'u', '向下跳空': 'd'}
     df = assign_condition_value(df=df, column='窗口_trend', condition_dict=conditions, value_dict=values, default_value='n')
 
-    # window position status (beyond/below/among window)
+    # window position status (beyond/below/among window), encoded as int(later conditions take priority)
     conditions = {
       '上方': '(candle_entity_bottom >= candle_gap_top)',
       '中上': '((candle_entity_top > candle_gap_top) and (candle_gap_top > candle_entity_bottom >= candle_gap_bottom))',
@@ -1998,17 +2685,16 @@ def add_candlestick_patterns(df, ohlcv_col=default_ohlcv_col):
       '穿刺': '((candle_entity_top > candle_gap_top) and (candle_entity_bottom < candle_gap_bottom))',
       '中下': '((candle_entity_bottom < candle_gap_bottom) and (candle_gap_top >= candle_entity_top > candle_gap_bottom))',
       '下方': '(candle_entity_top <= candle_gap_bottom)'}
-    values = {
-      '上方': 'up', '中上': 'mid_up',
-      '中间': 'mid', '穿刺': 'out',
-      '中下': 'mid_down', '下方': 'down'}
-    df = assign_condition_value(df=df, column='相对窗口位置', condition_dict=conditions, value_dict=values, default_value='')
+    position_values = np.array(['', 'up', 'mid_up', 'mid', 'out', 'mid_down', 'down'], dtype=object)
+    position_masks = eval_conditions(df=df, condition_dict=conditions)
+    position = np.select([position_masks[k] for k in reversed(list(conditions.keys()))], [6, 5, 4, 3, 2, 1], default=0)
+    df['相对窗口位置'] = position_values[position]
 
-    # break through up or down
-    df['prev_相对窗口位置'] = df['相对窗口位置'].shift(1)
+    # break through up or down: from other positions(mid_up/mid/out/mid_down/down, up/mid_up/mid/out/mid_down) to up/down
+    prev_position = np.concatenate([[0], position[:-1]])
     conditions = {
-      '向上突破': f'(candle_gap != 2) and (相对窗口位置 == "up" and prev_相对窗口位置 in {["mid_up", "out", "mid", "mid_down", "down"]})',
-      '向下突破': f'(candle_gap != -2) and (相对窗口位置 == "down" and prev_相对窗口位置 in {["mid_down", "out", "mid", "mid_up", "up"]})'
+      '向上突破': (df['candle_gap'].to_numpy() != 2) & (position == 1) & (prev_position >= 2),
+      '向下突破': (df['candle_gap'].to_numpy() != -2) & (position == 6) & (prev_position >= 1) & (prev_position <= 5)
     }
     values = {'向上突破': 'u', '向下突破': 'd'}
     df = assign_condition_value(df=df, column='突破_trend', condition_dict=conditions, value_dict=values, default_value='n')
@@ -2081,14 +2767,13 @@ def add_candlestick_patterns(df, ohlcv_col=default_ohlcv_col):
   if 'multi_candle' > '':
 
     # initialize multi-candle pattern trend
-    idxs = df.index.tolist()
     for t in ['平头', '穿刺', '吞噬', '包孕', '启明黄昏']:
       df[f'{t}_trend'] = 'n'
 
     # flat top/bottom
-    df['high_diff'] = ((df['High'] - df['High'].shift(1)) / df['Close']).abs()
-    df['low_diff'] = ((df['Low'] - df['Low'].shift(1)) / df['Close']).abs()
-    df['candle_upper_shadow_pct_diff'] = df['candle_upper_shadow_pct'] - df['candle_upper_shadow_pct'].shift(1)
+    df['high_diff'] = np.abs(prev_diff(df['High'].values) / df['Close'].values)
+    df['low_diff'] = np.abs(prev_diff(df['Low'].values) / df['Close'].values)
+    df['candle_upper_shadow_pct_diff'] = prev_diff(df['candle_upper_shadow_pct'].values)
     conditions = {
       # 非十字星/高浪线, adx趋势向上(或高位), 高位, [1.近10日最高, 顶部差距<0.2%, 2.顶部差距<0.1%, 3.顶部差距<0.4%, 价格下跌, 上影线差距在5%内]
       'flat top': '(十字星 == "n") and (adx_day > 0 or adx_value > 15) and ((极限_trend == "u" and high_diff <= 0.002) or (位置_trend == "u" and ((high_diff <= 0.001) or (high_diff <= 0.004 and rate <= 0 and -0.05 <= candle_upper_shadow_pct_diff <= 0.05))))',
@@ -2097,121 +2782,59 @@ def add_candlestick_patterns(df, ohlcv_col=default_ohlcv_col):
     values = {'flat top': 'd', 'flat bottom': 'u'}
     df = assign_condition_value(df=df, column='平头_trend', condition_dict=conditions, value_dict=values, default_value='n')
 
-    # iterate through dataframe by window_size of 2 and 3
-    previous_row = None
-    previous_previous_row = None
-    for idx in idxs:
-      
-      # current row(0), previous row(-1) 
-      row = df.loc[idx]
-      previous_i = idxs.index(idx) - 1
-      if previous_i < 0:
-        continue
-      else:
-        previous_idx = idxs[previous_i]
-        previous_row = df.loc[previous_idx]
-
-      # previous previous row(-2)
-      previous_previous_i = previous_i - 1
-      if previous_previous_i < 0:
-        previous_previous_row = None
-      else:
-        previous_previous_idx = idxs[previous_previous_i]
-        previous_previous_row = df.loc[previous_previous_idx]
-
-      # 当前蜡烛非短实体, 实体占比 > 75%
-      if row['entity_trend'] == 'd' or row['candle_entity_pct'] < 0.75:
-        pass
-      else:
-        # =================================== 吞噬形态 ==================================== #
-        if (previous_row['candle_entity_top'] < row['candle_entity_top']) and (previous_row['candle_entity_bottom'] > row['candle_entity_bottom']):
-        
-          # 空头吞噬: 位于顶部, 1-绿, 2-红
-          if (row['极限_trend'] == "u"):
-            if (previous_row['candle_color'] == 1 and row['candle_color'] == -1):
-              df.loc[idx, '吞噬_trend'] = 'd'
-
-          # 多头吞噬: 位于底部, 1-红, 2-绿
-          elif (row['极限_trend'] == "d"):
-            if (previous_row['candle_color'] == -1 and row['candle_color'] == 1):
-              df.loc[idx, '吞噬_trend'] = 'u'
-
-      # 前一蜡烛非短实体, 实体占比 > 75%
-      if previous_row['entity_trend'] == 'd' or previous_row['candle_entity_pct'] < 0.75:
-        pass
-      else:
-        # =================================== 包孕形态 ==================================== #
-        if (previous_row['candle_entity_top'] > row['candle_entity_top']) and (previous_row['candle_entity_bottom'] < row['candle_entity_bottom']) and (previous_row['High'] > row['High']) and (previous_row['Low'] < row['Low']):
-          
-          # 空头包孕: 位于顶部, 1-绿, 2-红
-          if row['极限_trend'] == 'u':
-            if (previous_row['candle_color'] == 1 and row['candle_color'] == -1):
-              df.loc[idx, '包孕_trend'] = 'd'
-
-          # 多头包孕: 位于底部, 1-红, 2-绿
-          elif row['极限_trend'] == 'd':
-            if (previous_row['candle_color'] == -1 and row['candle_color'] == 1):
-              df.loc[idx, '包孕_trend'] = 'u'
-      
-      # 顶部:乌云盖顶, 黄昏星
-      if (previous_row['位置_trend'] == "u"):
-
-        # =================================== 乌云盖顶  =================================== #
-        # 1-必须为绿色, 2-必须为红色长实体
-        if (row['位置_trend'] != 'u' or row['entity_trend'] == 'd' or row['candle_color'] == 1 or previous_row['candle_color'] == -1 or previous_row['entity_trend'] == "d"):
-          pass
-        else:
-          # 顶部>前顶部, 底部>前底部, 底部穿过前中点
-          if (previous_row['candle_entity_top'] < row['candle_entity_top']) and (previous_row['candle_entity_middle'] > row['candle_entity_bottom']): # and (previous_row['candle_entity_middle'] > row['candle_entity_bottom'])
-            df.loc[idx, '穿刺_trend'] = 'd'
-
-        # =================================== 黄昏星  ===================================== #
-        if previous_previous_row is None:
-          pass
-        else:
-          # 1-绿色, 2-高位, 3-红色
-          if (previous_row['位置_trend'] == "u") and (previous_previous_row['candle_color'] == 1) and (row['candle_color'] == -1):
-            # 3-长实体 或 3-middle > 1-middle 
-            if row['entity_trend'] == 'u' or (row['candle_entity_middle'] < previous_previous_row['candle_entity_middle']):
-              # 2-小实体, 2-底部 > 1/3-顶部
-              if (previous_row['entity_trend'] == 'd') and (previous_row['candle_entity_bottom'] > previous_previous_row['candle_entity_top']) and (previous_row['candle_entity_bottom'] > row['candle_entity_top']): #(previous_row['High'] > previous_previous_row['High']) and (previous_row['High'] > row['High']):
-                df.loc[idx, '启明黄昏_trend'] = 'd'
-              # 2-非小实体, 2-底部 > 1/3-顶部
-              elif (previous_row['entity_trend'] == 'n') and (previous_row['candle_entity_bottom'] > previous_previous_row['candle_entity_top']) and (previous_row['candle_entity_bottom'] > row['candle_entity_top']):
-                  df.loc[idx, '启明黄昏_trend'] = 'd'
-
-      # 底部:穿刺形态, 启明星
-      elif (previous_row['位置_trend'] == "d"):
-
-        # =================================== 穿刺形态  =================================== #
-        # 1-必须为红色, 2-必须为绿色长实体
-        if (row['位置_trend'] != 'd' or row['entity_trend'] != 'u' or row['candle_color'] == -1 or previous_row['candle_color'] == 1):
-          pass
-        else:
-          # 顶部<=前顶部, 底部<前底部, 顶部穿过前中点
-          if (previous_row['candle_entity_top'] >= row['candle_entity_top']) and (previous_row['candle_entity_bottom'] > row['candle_entity_bottom']) and (previous_row['candle_entity_middle'] < row['candle_entity_top']):
-            df.loc[idx, '穿刺_trend'] = 'u'
-        
-        # =================================== 启明星  ===================================== #
-        if previous_previous_row is None:
-          pass
-        else:
-          # 1-红色非小实体, 2-高位, 3-绿色非小实体
-          if (previous_row['极限_trend'] == "d") and (previous_previous_row['entity_trend'] != 'd') and (row['candle_color'] == 1 and row['entity_trend'] != 'd'):
-            # 3-长实体 或 3-middle > 1-top 
-            if row['entity_trend'] == 'u' or (row['candle_entity_middle'] > previous_previous_row['candle_entity_top']):
-              # 2-小实体, 2-顶部 < 1/3-底部
-              if (previous_row['entity_trend'] == 'd') and (previous_row['candle_entity_top'] < previous_previous_row['candle_entity_bottom']) and (previous_row['candle_entity_top'] < row['candle_entity_bottom']): #(previous_row['Low'] < previous_previous_row['Low']) and (previous_row['Low'] < row['Low']):
-                df.loc[idx, '启明黄昏_trend'] = 'u'
-              # 2-非小实体, 2-顶部 < 1/3-底部
-              elif (previous_row['entity_trend'] == 'n') and (previous_row['candle_entity_top'] < previous_previous_row['candle_entity_bottom']) and (previous_row['candle_entity_top'] < row['candle_entity_bottom']):
-                  df.loc[idx, '启明黄昏_trend'] = 'u'
+    # values of current row(0), previous row(-1) and previous previous row(-2)
+    pattern_cols = ['candle_entity_top', 'candle_entity_bottom', 'candle_entity_middle', 'candle_entity_pct', 'candle_color', 'High', 'Low', 'entity_trend', '极限_trend', '位置_trend']
+    row = {col: df[col].to_numpy() for col in pattern_cols}
+    previous_row = {col: df[col].shift(1).to_numpy() for col in pattern_cols}
+    previous_previous_row = {col: df[col].shift(2).to_numpy() for col in ['candle_entity_top', 'candle_entity_bottom', 'candle_entity_middle', 'candle_color', 'entity_trend']}
+    has_previous = np.arange(len(df)) >= 1
+    has_previous_previous = np.arange(len(df)) >= 2
+
+    # =================================== 吞噬形态 ==================================== #
+    # 当前蜡烛非短实体, 实体占比 > 75%, 实体包含前一实体
+    engulf = has_previous & (row['entity_trend'] != 'd') & ~(row['candle_entity_pct'] < 0.75) & (previous_row['candle_entity_top'] < row['candle_entity_top']) & (previous_row['candle_entity_bottom'] > row['candle_entity_bottom'])
+    # 空头吞噬: 位于顶部, 1-绿, 2-红
+    bear_engulf = engulf & (row['极限_trend'] == 'u') & (previous_row['candle_color'] == 1) & (row['candle_color'] == -1)
+    # 多头吞噬: 位于底部, 1-红, 2-绿
+    bull_engulf = engulf & (row['极限_trend'] == 'd') & (previous_row['candle_color'] == -1) & (row['candle_color'] == 1)
+    df['吞噬_trend'] = np.select([bear_engulf, bull_engulf], ['d', 'u'], default='n')
+
+    # =================================== 包孕形态 ==================================== #
+    # 前一蜡烛非短实体, 实体占比 > 75%, 前一蜡烛实体与影线都包含当前蜡烛
+    harami = has_previous & (previous_row['entity_trend'] != 'd') & ~(previous_row['candle_entity_pct'] < 0.75) & (previous_row['candle_entity_top'] > row['candle_entity_top']) & (previous_row['candle_entity_bottom'] < row['candle_entity_bottom']) & (previous_row['High'] > row['High']) & (previous_row['Low'] < row['Low'])
+    # 空头包孕: 位于顶部, 1-绿, 2-红
+    bear_harami = harami & (row['极限_trend'] == 'u') & (previous_row['candle_color'] == 1) & (row['candle_color'] == -1)
+    # 多头包孕: 位于底部, 1-红, 2-绿
+    bull_harami = harami & (row['极限_trend'] == 'd') & (previous_row['candle_color'] == -1) & (row['candle_color'] == 1)
+    df['包孕_trend'] = np.select([bear_harami, bull_harami], ['d', 'u'], default='n')
+
+    # 顶部:乌云盖顶, 黄昏星; 底部:穿刺形态, 启明星
+    top = has_previous & (previous_row['位置_trend'] == 'u')
+    bottom = has_previous & (previous_row['位置_trend'] == 'd')
+    previous_small_entity = np.isin(previous_row['entity_trend'], ['d', 'n'])
+
+    # =================================== 乌云盖顶  =================================== #
+    # 1-必须为绿色, 2-必须为红色长实体, 顶部>前顶部, 底部穿过前中点
+    dark_cloud = top & (row['位置_trend'] == 'u') & (row['entity_trend'] != 'd') & (row['candle_color'] != 1) & (previous_row['candle_color'] != -1) & (previous_row['entity_trend'] != 'd') & (previous_row['candle_entity_top'] < row['candle_entity_top']) & (previous_row['candle_entity_middle'] > row['candle_entity_bottom'])
+
+    # =================================== 穿刺形态  =================================== #
+    # 1-必须为红色, 2-必须为绿色长实体, 顶部<=前顶部, 底部<前底部, 顶部穿过前中点
+    piercing = bottom & (row['位置_trend'] == 'd') & (row['entity_trend'] == 'u') & (row['candle_color'] != -1) & (previous_row['candle_color'] != 1) & (previous_row['candle_entity_top'] >= row['candle_entity_top']) & (previous_row['candle_entity_bottom'] > row['candle_entity_bottom']) & (previous_row['candle_entity_middle'] < row['candle_entity_top'])
+    df['穿刺_trend'] = np.select([dark_cloud, piercing], ['d', 'u'], default='n')
+
+    # =================================== 黄昏星  ===================================== #
+    # 1-绿色, 2-高位, 3-红色; 3-长实体 或 3-middle < 1-middle; 2-小(或非小)实体, 2-底部 > 1/3-顶部
+    evening_star = top & has_previous_previous & (previous_previous_row['candle_color'] == 1) & (row['candle_color'] == -1) & ((row['entity_trend'] == 'u') | (row['candle_entity_middle'] < previous_previous_row['candle_entity_middle'])) & previous_small_entity & (previous_row['candle_entity_bottom'] > previous_previous_row['candle_entity_top']) & (previous_row['candle_entity_bottom'] > row['candle_entity_top'])
+
+    # =================================== 启明星  ===================================== #
+    # 1-非小实体, 2-低位, 3-绿色非小实体; 3-长实体 或 3-middle > 1-top; 2-小(或非小)实体, 2-顶部 < 1/3-底部
+    morning_star = bottom & has_previous_previous & (previous_row['极限_trend'] == 'd') & (previous_previous_row['entity_trend'] != 'd') & (row['candle_color'] == 1) & (row['entity_trend'] != 'd') & ((row['entity_trend'] == 'u') | (row['candle_entity_middle'] > previous_previous_row['candle_entity_top'])) & previous_small_entity & (previous_row['candle_entity_top'] < previous_previous_row['candle_entity_bottom']) & (previous_row['candle_entity_top'] < row['candle_entity_bottom'])
+    df['启明黄昏_trend'] = np.select([evening_star, morning_star], ['d', 'u'], default='n')
 
   # days since signal triggered
   all_candle_patterns = ['窗口', '突破', '十字星', '流星', '锤子', '腰带', '平头', '穿刺', '包孕', '吞噬', '启明黄昏'] # '反弹', 
   for col in all_candle_patterns:
-    df[f'{col}_day'] = df[f'{col}_trend'].replace({'u':1, 'd':-1, 'n':0, '': 0}).fillna(0).astype(int)
-    df[f'{col}_day'] = sda(series=df[f'{col}_day'], zero_as=1, one_restart=True)
+    df[f'{col}_day'] = sda(series=trend_to_int(df[f'{col}_trend']), zero_as=1, one_restart=True)
 
     # # continuous same trend
     # u_mask = df.query(f'{col}_trend == "u"').index
@@ -2222,8 +2845,8 @@ def add_candlestick_patterns(df, ohlcv_col=default_ohlcv_col):
   # redundant intermediate columns
   for col in [
     'recent_high', 'recent_low',
-    'prev_相对窗口位置', 'high_diff', 'low_diff', 'candle_upper_shadow_pct_diff', 'candle_lower_shadow_pct_diff', 
-    'entity_ma', 'entity_std', 'shadow_ma', 'shadow_std', # 'shadow_diff', 'entity_diff',
+    'high_diff', 'low_diff', 'candle_upper_shadow_pct_diff', 'candle_lower_shadow_pct_diff', 
+    # 'shadow_diff', 'entity_diff',
     
     'moving_max', 'moving_min']:
     if col in df.columns:
@@ -2251,18 +2874,9 @@ def add_heikin_ashi_features(df, ohlcv_col=default_ohlcv_col, replace_ohlc=False
   close = ohlcv_col['close']
   # volume = ohlcv_col['volume']
 
-  # add previous stick
-  columns_to_drop = []
-  for col in [open, high, low, close]:
-    tmp_col = f'prev_{col}'
-    df[tmp_col] = df[col].shift(1)
-    columns_to_drop.append(tmp_col)
-
   # calculate heikin-ashi ohlc
-  df['H_Close'] = (df[open] + df[high] + df[low] + df[close])/4
-  df['H_Open'] = (df[f'prev_{open}'] + df[f'prev_{close}'])/2
-  df['H_High'] = df[[f'prev_{high}', 'H_Open', 'H_Close']].max(axis=1)
-  df['H_Low'] = df[[f'prev_{low}', 'H_Open', 'H_Close']].min(axis=1)
+  o, h, l, c = df[[open, high, low, close]].to_numpy(dtype=np.float64).T
+  df[['H_Close', 'H_Open', 'H_High', 'H_Low']] = np.column_stack(_ha_kernel(o, h, l, c))
     
   # replace original ohlc with heikin-ashi ohlc
   if replace_ohlc:
@@ -2270,13 +2884,10 @@ def add_heikin_ashi_features(df, ohlcv_col=default_ohlcv_col, replace_ohlc=False
       df.drop(f'{col}', axis=1, inplace=True)
     df.rename(columns={'H_Close': close, 'H_Open': open, 'H_High': high, 'H_Low': low}, inplace=True)
 
-  # dropna values
+  # dropna values(including rows whose previous high/low is NaN)
   if dropna:
-    df.dropna(inplace=True)
-
-  # drop redundant columns
-  for col in columns_to_drop:
-    df.drop(col, axis=1, inplace=True)
+    prev_hl_valid = np.concatenate([[False], ~(np.isnan(h[:-1]) | np.isnan(l[:-1]))])
+    df = df[prev_hl_valid].dropna()
   
   return df
 
@@ -2326,17 +2937,10 @@ def add_linear_features(df, max_period=60, min_period=5, is_print=False):
   tmp_data = df[start:end].copy()
   tmp_idxs = tmp_data.index.tolist()
   
-  # gathering high and low points for linear regression
-  high = {'x':[], 'y':[]}
-  low = {'x':[], 'y':[]}
-  for ti in tmp_idxs:
-    x = idxs.index(ti)
-    y_high = df.loc[ti, 'High']  
-    y_low = df.loc[ti, 'Low']  
-    high['x'].append(x)
-    high['y'].append(y_high)
-    low['x'].append(x)
-    low['y'].append(y_low)
+  # gathering high and low points for linear regression, x is the position of the row in df
+  tmp_x = df.index.get_indexer(tmp_idxs).tolist()
+  high = {'x': tmp_x, 'y': tmp_data['High'].tolist()}
+  low = {'x': tmp_x, 'y': tmp_data['Low'].tolist()}
 
   # linear regression for high/low values
   highest_high = df[start:latest_end]['High'].max()
@@ -2365,47 +2969,29 @@ def add_linear_features(df, max_period=60, min_period=5, is_print=False):
       low_linear = (0, lowest_low, 0, 0)
 
   # add high/low fit values
-  counter = 0
   idx_max = len(idxs)
   idx_min = min(min(high['x']), min(low['x']))
   std_ma = df[idx_min:idx_max]['Close'].std()
-  for x in range(idx_min, idx_max):
-    
-    idx = idxs[x]
-    counter += 1
-    df.loc[idx, 'linear_day_count'] = counter
-
-    # predicted high/low values    
-    linear_fit_high = high_linear[0] * x + high_linear[1] + 0.3 * std_ma
-    linear_fit_low = low_linear[0] * x + low_linear[1] - 0.3 * std_ma
-
-    # linear fit high
-    df.loc[idx, 'linear_fit_high_slope'] = high_linear[0]
-    if (linear_fit_high <= highest_high and linear_fit_high >= lowest_low): 
-      df.loc[idx, 'linear_fit_high'] = linear_fit_high
-    elif linear_fit_high > highest_high:
-      df.loc[idx, 'linear_fit_high'] = highest_high
-    elif linear_fit_high < lowest_low:
-      df.loc[idx, 'linear_fit_high'] = lowest_low
-    else:
-      df.loc[idx, 'linear_fit_high'] = np.NaN
-    
-    # if  high_linear[0] > 0 and idx > highest_high_idx and df.loc[idx, 'linear_fit_high'] <= highest_high:
-    #   df.loc[idx, 'linear_fit_high'] = highest_high
-
-    # linear fit low
-    df.loc[idx, 'linear_fit_low_slope'] = low_linear[0]
-    if (linear_fit_low <= highest_high and linear_fit_low >= lowest_low): 
-      df.loc[idx, 'linear_fit_low'] = linear_fit_low
-    elif linear_fit_low > highest_high:
-      df.loc[idx, 'linear_fit_low'] = highest_high
-    elif linear_fit_low < lowest_low:
-      df.loc[idx, 'linear_fit_low'] = lowest_low
-    else:
-      df.loc[idx, 'linear_fit_low'] = np.NaN
-
-    # if  low_linear[0] < 0 and idx > lowest_low_idx and df.loc[idx, 'linear_fit_low'] >= lowest_low:
-    #   df.loc[idx, 'linear_fit_low'] = lowest_low
+  x = np.arange(idx_min, idx_max, dtype=np.float64)
+
+  # predicted high/low values, limited within [lowest_low, highest_high]
+  linear_fit_high = np.clip(high_linear[0] * x + high_linear[1] + 0.3 * std_ma, lowest_low, highest_high)
+  linear_fit_low = np.clip(low_linear[0] * x + low_linear[1] - 0.3 * std_ma, lowest_low, highest_high)
+  # if  high_linear[0] > 0 and idx > highest_high_idx and df.loc[idx, 'linear_fit_high'] <= highest_high:
+  #   df.loc[idx, 'linear_fit_high'] = highest_high
+  # if  low_linear[0] < 0 and idx > lowest_low_idx and df.loc[idx, 'linear_fit_low'] >= lowest_low:
+  #   df.loc[idx, 'linear_fit_low'] = lowest_low
+
+  fit_values = {
+    'linear_day_count': np.arange(1, idx_max - idx_min + 1),
+    'linear_fit_high_slope': high_linear[0],
+    'linear_fit_high': linear_fit_high,
+    'linear_fit_low_slope': low_linear[0],
+    'linear_fit_low': linear_fit_low}
+  for col in fit_values.keys():
+    if col not in df.columns:
+      df[col] = np.nan
+    df.iloc[idx_min:idx_max, df.columns.get_loc(col)] = fit_values[col]
 
   # high/low fit stop
   df['linear_fit_high_stop'] = 0
@@ -2481,91 +3067,65 @@ def add_support_resistance(df, target_col=default_support_resistant_col, perspec
   """
   # copy dataframe
   df = df.copy()
-  col_to_drop = []
 
   # remove columns that not exists
   target_col = [x for x in target_col if x in df.columns]
 
-  # calculate middle price
-  df['mid_price'] = (df['High'] + df['Low']) / 2
-  col_to_drop.append('mid_price')
-
-  generated_cols = {'High': [], 'Low': []}
-  # calculate support and resistance
-  for col_1 in ['High', 'Low']:
-    for col_2 in target_col:
-      
-      # calculate mutual distnace
-      distance_col = f'{col_1}_to_{col_2}'
-      col_to_drop.append(distance_col)
-
-      tmp_distance = abs(df[col_1] - df[col_2]) / df[col_1]
-      df[distance_col] = tmp_distance
-      generated_cols[col_1].append(distance_col)
-      
-  # column_name = {'h_2_gt': 'candle_gap_top', 'h_2_gb': 'candle_gap_bottom', 'l_2_gt': 'candle_gap_top', 'l_2_gb': 'candle_gap_bottom'}
-  df['support_score'] = 0
-  df['support_description'] = ''
-  df['resistant_score'] = 0
-  df['resistant_description'] = ''
-  df['break_up_score'] = 0
-  df['break_up_description'] = ''
-  df['break_down_score'] = 0
-  df['break_down_description'] = ''
+  # get ohlc, middle price and candle features as arrays
+  open_np = df['Open'].to_numpy()
+  high_np = df['High'].to_numpy()
+  low_np = df['Low'].to_numpy()
+  close_np = df['Close'].to_numpy()
+  mid_price = (high_np + low_np) / 2
+  candle_color = df['candle_color'].to_numpy()
+  upper_shadow_pct = df['candle_upper_shadow_pct'].to_numpy()
+  lower_shadow_pct = df['candle_lower_shadow_pct'].to_numpy()
+  not_cross_star = ((df['十字星_day'] != 1) & (df['十字星_day'] != -1)).to_numpy()
+  target_values = {col: df[col].to_numpy() for col in target_col}
+
+  # descriptions are accumulated in object arrays ('col_1, col_2, ...')
+  descriptions = {}
+  for d in ['support', 'resistant', 'break_up', 'break_down']:
+    descriptions[d] = np.full(len(df), '', dtype=object)
 
   # ================================ intra-day support and resistant ===================
-  # calculate support
   distance_threshold = 0.005
   shadow_pct_threhold = 0.20
-  for col in generated_cols['Low']:
-    tmp_col = col.split('_to_')[-1]
-    support_idx = df.query(f'(十字星_day != 1 and 十字星_day != -1) and ((candle_color == 1 and mid_price > {tmp_col}) or (candle_color == -1 and Close > {tmp_col})) and (candle_lower_shadow_pct > {shadow_pct_threhold} or candle_lower_shadow_pct > candle_upper_shadow_pct) and ({col} < {distance_threshold})').index.tolist()
-    df.loc[support_idx, 'support_description'] += f'{tmp_col}, '
-
-  # calculate resistance
-  for col in generated_cols['High']:
-    tmp_col = col.split('_to_')[-1]
-    resistant_idx = df.query(f'(十字星_day != 1 and 十字星_day != -1) and ((candle_color == -1 and mid_price < {tmp_col}) or (candle_color == 1 and Close < {tmp_col})) and (candle_upper_shadow_pct > {shadow_pct_threhold} or candle_upper_shadow_pct > candle_lower_shadow_pct) and ({col} < {distance_threshold})').index.tolist()
-    df.loc[resistant_idx, 'resistant_description'] += f'{tmp_col}, '
-  
-  # ================================ in-day support and resistant ======================
-  df['prev_close'] = df['Close'].shift(1)
-  col_to_drop.append('prev_close')
-  for col in target_col:
-
-    support_idx = df.query(f'Open > {col} and Low < {col} and Close > {col}').index
-    df.loc[support_idx, 'support_description'] += f'{col}, '
-
-    resistant_idx = df.query(f'Open < {col} and High > {col} and Close < {col}').index
+  with np.errstate(divide='ignore', invalid='ignore'):
 
-    df.loc[resistant_idx, 'resistant_description'] += f'{col}, '
+    # calculate support
+    for col, cv in target_values.items():
+      support_mask = not_cross_star & (((candle_color == 1) & (mid_price > cv)) | ((candle_color == -1) & (close_np > cv))) & ((lower_shadow_pct > shadow_pct_threhold) | (lower_shadow_pct > upper_shadow_pct)) & (np.abs(low_np - cv) / low_np < distance_threshold)
+      descriptions['support'][support_mask] += f'{col}, '
 
-  df['support_description'] = df['support_description'].apply(lambda x: ', '.join(list(set(x[:-2].split(', ')))))
-  df['resistant_description'] = df['resistant_description'].apply(lambda x: ', '.join(list(set(x[:-2].split(', ')))))
+    # calculate resistance
+    for col, cv in target_values.items():
+      resistant_mask = not_cross_star & (((candle_color == -1) & (mid_price < cv)) | ((candle_color == 1) & (close_np < cv))) & ((upper_shadow_pct > shadow_pct_threhold) | (upper_shadow_pct > lower_shadow_pct)) & (np.abs(high_np - cv) / high_np < distance_threshold)
+      descriptions['resistant'][resistant_mask] += f'{col}, '
+  
+  # ================================ in-day support and resistant ======================
+  for col, cv in target_values.items():
+    support_mask = (open_np > cv) & (low_np < cv) & (close_np > cv)
+    descriptions['support'][support_mask] += f'{col}, '
 
-  df['support_score'] = df['support_description'].apply(lambda x: len(list(set([s for s in x.split(', ') if s != '']))))
-  df['resistant_score'] = df['resistant_description'].apply(lambda x: -1 * len(list(set([s for s in x.split(', ') if s != '']))))
+    resistant_mask = (open_np < cv) & (high_np > cv) & (close_np < cv)
+    descriptions['resistant'][resistant_mask] += f'{col}, '
 
   # ================================ breakthorough =====================================
-  for col in target_col:
+  for col, cv in target_values.items():
+    break_up_mask = (candle_color == 1) & (open_np < cv) & (close_np > cv) # entity_diff > -0.5 and 
+    descriptions['break_up'][break_up_mask] += f'{col}, '
 
-    break_up_idx = df.query(f'candle_color == 1 and Open < {col} and Close > {col}').index # entity_diff > -0.5 and 
-    df.loc[break_up_idx, 'break_up_description'] += f'{col}, '
+    break_down_mask = (candle_color == -1) & (open_np > cv) & (close_np < cv) # entity_diff > -0.5 and 
+    descriptions['break_down'][break_down_mask] += f'{col}, '
 
-    break_down_idx = df.query(f'candle_color == -1 and Open > {col} and Close < {col}').index # entity_diff > -0.5 and 
-    df.loc[break_down_idx, 'break_down_description'] += f'{col}, '
+  # remove duplicated items in descriptions, score = (-)number of items
+  for d in ['support', 'resistant', 'break_up', 'break_down']:
+    sign = -1 if d in ['resistant', 'break_down'] else 1
+    description = [', '.join(dict.fromkeys(x[:-2].split(', '))) for x in descriptions[d]]
+    df[f'{d}_score'] = [sign * len([s for s in x.split(', ') if s != '']) for x in description]
+    df[f'{d}_description'] = description
 
-  df['break_up_description'] = df['break_up_description'].apply(lambda x: ', '.join(list(set(x[:-2].split(', ')))))
-  df['break_down_description'] = df['break_down_description'].apply(lambda x: ', '.join(list(set(x[:-2].split(', ')))))
-
-  df['break_up_score'] = df['break_up_description'].apply(lambda x: len(list(set([s for s in x.split(', ') if s != '']))))
-  df['break_down_score'] = df['break_down_description'].apply(lambda x: -1 * len(list(set([s for s in x.split(', ') if s != '']))))
-
-  # drop unnecessary columns
-  for col in col_to_drop:
-    if col in df.columns:
-      df.drop(col, axis=1, inplace=True)
-  
   # ================================ supporter and resistanter =========================
   # add support/supporter, resistant/resistanter for the last row
   max_idx = df.index.max() 
@@ -2704,8 +3264,8 @@ def add_adx_features(df, n=14, ohlcv_col=default_ohlcv_col, fillna=False, adx_th
   df = add_atr_features(df=df, n=n, cal_signal=False)
 
   # difference of high/low between 2 continuouss days
-  df['high_diff'] = df[high] - df[high].shift(1)
-  df['low_diff'] = df[low].shift(1) - df[low]
+  df['high_diff'] = prev_diff(df[high].values)
+  df['low_diff'] = -prev_diff(df[low].values)
   
   # plus/minus directional movements
   df['zero'] = 0
@@ -3433,7 +3993,7 @@ def add_renko_features(df, brick_size_factor=0.05, dynamic_brick=True, merge_dup
   
   # renko brick start/end points
   renko_df['renko_start'] = renko_df.index.copy()
-  renko_df['renko_end'] = renko_df['renko_start'].shift(-1).fillna(df.index.max())
+  renko_df['renko_end'] = renko_df['renko_start'].shift(-1, fill_value=df.index.max())
   renko_df['renko_duration'] = renko_df['renko_end'] - renko_df['renko_start']
   renko_df['renko_duration'] = renko_df['renko_duration'].apply(lambda x: x.days+1).astype(float)
   renko_df['renko_duration_p1'] = renko_df['renko_duration'].shift(1)
@@ -3512,15 +4072,10 @@ def add_renko_features(df, brick_size_factor=0.05, dynamic_brick=True, merge_dup
 
   # calculate length(number of days to the end of current brick) 
   # calculate of each brick(or merged brick): renko_brick_length, renko_countdown_days(for ploting)
-  max_idx = df.index.max()
   if merge_duplicated:
-    df['s']  = df.index
-    if df['s'].max() == max_idx:
-      max_idx = max_idx + datetime.timedelta(days=1)
-    df['renko_countdown_days'] = df['renko_end'] - df['s'] 
-    df['renko_brick_length'] = df['s'] - df['renko_start']
-    df['renko_brick_length'] = df['renko_brick_length'].apply(lambda x: x.days+1).astype(float)
-    df.drop('s', axis=1, inplace=True)
+    dates = df.index.to_series()
+    df['renko_countdown_days'] = df['renko_end'] - dates
+    df['renko_brick_length'] = ((dates - df['renko_start']).dt.days + 1).astype(float)
   else:
     df['renko_countdown_days'] = 1
     df['renko_brick_length'] = 1
@@ -4248,8 +4803,9 @@ def add_uo_features(df, s=7, m=14, l=28, ws=4.0, wm=2.0, wl=1.0, ohlcv_col=defau
   # volume = ohlcv_col['volume']
 
   # calculate uo
-  min_l_or_pc = df[close].shift(1, fill_value=df[close].mean()).combine(df[low], min)
-  max_h_or_pc = df[close].shift(1, fill_value=df[close].mean()).combine(df[high], max)
+  prev_close = df[close].shift(1, fill_value=df[close].mean()).to_numpy()
+  min_l_or_pc = pd.Series(np.fmin(prev_close, df[low].to_numpy()), index=df.index)
+  max_h_or_pc = pd.Series(np.fmax(prev_close, df[high].to_numpy()), index=df.index)
 
   bp = df[close] - min_l_or_pc
   tr = max_h_or_pc - min_l_or_pc
@@ -4266,7 +4822,7 @@ def add_uo_features(df, s=7, m=14, l=28, ws=4.0, wm=2.0, wl=1.0, ohlcv_col=defau
 
   # assign uo to df
   df['uo'] = uo
-  df['uo_diff'] = df['uo'] - df['uo'].shift(1)
+  df['uo_diff'] = prev_diff(df['uo'].values)
 
   return df
 
@@ -4335,20 +4891,19 @@ def add_atr_features(df, n=14, ohlcv_col=default_ohlcv_col, fillna=False, cal_si
   close = ohlcv_col['close']
   # volume = ohlcv_col['volume']
 
-  # calculate true range
-  df['h_l'] = df[low] - df[low]
-  df['h_pc'] = abs(df[high] - df[close].shift(1))
-  df['l_pc'] = abs(df[low] - df[close].shift(1))
-  df['tr'] = df[['h_l', 'h_pc', 'l_pc']].max(axis=1)
+  # calculate true range (fmax ignores the missing previous close on the first row)
+  h = df[high].to_numpy()
+  l = df[low].to_numpy()
+  pc = df[close].shift(1).to_numpy()
+  df['tr'] = np.fmax.reduce([h - l, np.abs(h - pc), np.abs(l - pc)])
 
-  # calculate average true range
-  df['atr'] = sm(series=df['tr'], periods=n, fillna=True).mean()
-  
-  idx = df.index.tolist()
-  for i in range(n, len(df)):
-    current_idx = idx[i]
-    previous_idx = idx[i-1]
-    df.loc[current_idx, 'atr'] = (df.loc[previous_idx, 'atr'] * 13 + df.loc[current_idx, 'tr']) / 14
+  # calculate average true range: expanding mean for the first n rows, then Wilder smoothing atr[i] = (atr[i-1] * 13 + tr[i]) / 14
+  tr = df['tr'].to_numpy()
+  atr = df['tr'].iloc[:n].expanding().mean().to_numpy()
+  if len(df) > n:
+    smoothed, _ = lfilter([1 / 14], [1, -13 / 14], tr[n:], zi=[atr[-1] * 13 / 14])
+    atr = np.concatenate([atr, smoothed])
+  df['atr'] = atr
 
   # fill na value
   if fillna:
@@ -4358,8 +4913,6 @@ def add_atr_features(df, n=14, ohlcv_col=default_ohlcv_col, fillna=False, cal_si
   if cal_signal:
     df['atr_diff'] = df['tr'] - df['atr']
 
-  df.drop(['h_l', 'h_pc', 'l_pc'], axis=1, inplace=True)
-
   return df
 
 # Mean Reversion
@@ -4373,7 +4926,7 @@ def add_mean_reversion_features(df, n=100, ohlcv_col=default_ohlcv_col, fillna=F
   :param fillna: whether to fill na with 0
   :param cal_signal: whether to calculate signal
   :param mr_threshold: the threshold to triger signal
-  :returns: dataframe with new features generated
+  :returns: dataframe with new features generated, trigger prices in df.attrs['mr_price']
   """
   # copy dataframe
   df = df.copy()
@@ -4386,15 +4939,13 @@ def add_mean_reversion_features(df, n=100, ohlcv_col=default_ohlcv_col, fillna=F
   # volume = ohlcv_col['volume']
 
   # calculate change rate of close price
-  df = cal_change_rate(df=df, target_col=close, periods=1, add_accumulation=True)
+  df = cal_change_rate(df=df, target_col=close, periods=1, add_accumulation=True, copy=False)
   target_col = ['rate', 'acc_rate', 'acc_day']
 
-  # calculate the (current value - moving avg) / moving std
-  for col in target_col:
-    mw = sm(series=df[col], periods=n)
-    tmp_mean = mw.mean()
-    tmp_std = mw.std()
-    df[col+'_bias'] = (df[col] - tmp_mean) / (tmp_std)
+  # calculate the (current value - moving avg) / moving std, rolling all target columns in one window
+  mw = sm(series=df[target_col], periods=n)
+  bias = (df[target_col] - mw.mean()) / mw.std()
+  df[[f'{col}_bias' for col in target_col]] = bias.to_numpy()
 
   # calculate the expected change rate that will triger signal
   result = cal_mean_reversion_expected_rate(df=df, rate_col='acc_rate', n=n, mr_threshold=mr_threshold)
@@ -4413,15 +4964,22 @@ def add_mean_reversion_features(df, n=100, ohlcv_col=default_ohlcv_col, fillna=F
   down_price = round((1+down) * last_close, ndigits=2)
   up = round(up * 100, ndigits=0) 
   down = round(down * 100, ndigits=0) 
-  df['mr_price'] = f'{up_price}({up}%%),{down_price}({down}%%)'
+
+  # the trigger prices are the same for every row, keep them as a frame attribute
+  df.attrs['mr_price'] = f'{up_price}({up}%%),{down_price}({down}%%)'
 
   # calculate mr signal
   if cal_signal:
-    df['rate_signal'] = cal_boundary_signal(df=df, upper_col='rate_bias', lower_col='rate_bias', upper_boundary=mr_threshold, lower_boundary=-mr_threshold, pos_signal=1, neg_signal=-1, none_signal=0)
-    df['acc_rate_signal'] = cal_boundary_signal(df=df, upper_col='acc_rate_bias', lower_col='acc_rate_bias', upper_boundary=mr_threshold, lower_boundary=-mr_threshold, pos_signal=1, neg_signal=-1, none_signal=0)
-    df['mr_signal'] = df['rate_signal'].astype(int) + df['acc_rate_signal'].astype(int)
-    df = replace_signal(df=df, signal_col='mr_signal', replacement={0: 'n', 1: 'n', -1:'n', 2:'b', -2:'s'})
-    df.drop(['rate_signal', 'acc_rate_signal'], axis=1, inplace=True)   
+    # boundary signals as int8 codes: 1 above threshold, -1 below -threshold, 0 otherwise
+    rate_signal = np.zeros(len(df), dtype=np.int8)
+    acc_rate_signal = np.zeros(len(df), dtype=np.int8)
+    for signal, bias in [(rate_signal, df['rate_bias'].to_numpy()), (acc_rate_signal, df['acc_rate_bias'].to_numpy())]:
+      signal[bias > mr_threshold] = 1
+      signal[bias < -mr_threshold] = -1
+
+    # -2: 's', -1/0/1: 'n', 2: 'b'
+    labels = np.array(['s', 'n', 'n', 'n', 'b'], dtype=object)
+    df['mr_signal'] = labels[rate_signal + acc_rate_signal + 2]
 
   return df
 
@@ -4470,17 +5028,15 @@ def add_bb_features(df, n=20, ndev=2, ohlcv_col=default_ohlcv_col, fillna=False)
   # volume = ohlcv_col['volume']
 
   # calculate bollinger band 
-  mavg = sm(series=df[close], periods=n).mean()
-  mstd = sm(series=df[close], periods=n).std(ddof=0)
+  mw = sm(series=df[close], periods=n)
+  mavg = mw.mean()
+  mstd = mw.std(ddof=0)
   high_band = mavg + ndev*mstd
   low_band = mavg - ndev*mstd
 
   # fill na values
   if fillna:
-      mavg = mavg.replace([np.inf, -np.inf], np.nan).fillna(method='backfill')
-      mstd = mstd.replace([np.inf, -np.inf], np.nan).fillna(method='backfill')
-      high_band = high_band.replace([np.inf, -np.inf], np.nan).fillna(method='backfill')
-      low_band = low_band.replace([np.inf, -np.inf], np.nan).fillna(method='backfill')
+      mavg, mstd, high_band, low_band = (bfillna(x) for x in (mavg, mstd, high_band, low_band))
       
   # assign values to df
   df['mavg'] = mavg
@@ -4519,9 +5075,7 @@ def add_dc_features(df, n=20, ohlcv_col=default_ohlcv_col, fillna=False, cal_sig
 
   # fill na values
   if fillna:
-    high_band = high_band.replace([np.inf, -np.inf], np.nan).fillna(method='backfill')
-    low_band = low_band.replace([np.inf, -np.inf], np.nan).fillna(method='backfill')
-    middle_band = middle_band.replace([np.inf, -np.inf], np.nan).fillna(method='backfill')
+    high_band, low_band, middle_band = (bfillna(x) for x in (high_band, low_band, middle_band))
 
   # assign values to df
   df['dc_high_band'] = high_band
@@ -4573,17 +5127,17 @@ def add_kc_features(df, n=10, ohlcv_col=default_ohlcv_col, method='atr', fillna=
     low_band = middle_band - 2 * df['atr']
 
   else:
-    typical_price = ((4*df[high]) - (2*df[low]) + df[close]) / 3.0
-    high_band = typical_price.rolling(n, min_periods=0).mean()
-
-    typical_price = ((-2*df[high]) + (4*df[low]) + df[close]) / 3.0
-    low_band = typical_price.rolling(n, min_periods=0).mean()
+    # high/low typical prices as one 2-column block, smoothed by a single rolling mean
+    hlc = df[[high, low, close]].to_numpy()
+    weights = np.array([[4, -2], [-2, 4], [1, 1]]) / 3.0
+    typical_price = pd.DataFrame(hlc @ weights, index=df.index, columns=['high', 'low'])
+    bands = typical_price.rolling(n, min_periods=0).mean()
+    high_band = bands['high']
+    low_band = bands['low']
 
   # fill na values
   if fillna:
-    middle_band = middle_band.replace([np.inf, -np.inf], np.nan).fillna(method='backfill')
-    high_band = high_band.replace([np.inf, -np.inf], np.nan).fillna(method='backfill')
-    low_band = low_band.replace([np.inf, -np.inf], np.nan).fillna(method='backfill')
+    middle_band, high_band, low_band = (bfillna(x) for x in (middle_band, high_band, low_band))
 
   # assign values to df
   df['kc_high_band'] = high_band
@@ -4632,7 +5186,7 @@ def add_ui_features(df, n=14, ohlcv_col=default_ohlcv_col, fillna=False, cal_sig
 
   # fill na values
   if fillna:
-    ui = ui.replace([np.inf, -np.inf], np.nan).fillna(method='backfill')
+    ui = bfillna(ui)
 
   # assign values to df
   df['ui'] = ui
@@ -4643,12 +5197,93 @@ def add_ui_features(df, n=14, ohlcv_col=default_ohlcv_col, fillna=False, cal_sig
 # ================================================ Other indicators ================================================= #
 
 
+# ================================================ Indicator dispatch =============================================== #
+# feature functions for indicators in calculate_ta_basic
+indicator_features = {
+  'candlestick': add_candlestick_features,
+  'heikin_ashi': add_heikin_ashi_features,
+  'linear': add_linear_features,
+  'ma_linear': add_ma_linear_features,
+  'adx': add_adx_features,
+  'aroon': add_aroon_features,
+  'cci': add_cci_features,
+  'dpo': add_dpo_features,
+  'ichimoku': add_ichimoku_features,
+  'kst': add_kst_features,
+  'macd': add_macd_features,
+  'mi': add_mi_features,
+  'trix': add_trix_features,
+  'vortex': add_vortex_features,
+  'psar': add_psar_features,
+  'stc': add_stc_features,
+  'renko': add_renko_features,
+  'adi': add_adi_features,
+  'cmf': add_cmf_features,
+  'eom': add_eom_features,
+  'fi': add_fi_features,
+  'nvi': add_nvi_features,
+  'obv': add_obv_features,
+  'vpt': add_vpt_features,
+  'ao': add_ao_features,
+  'kama': add_kama_features,
+  'mfi': add_mfi_features,
+  'rsi': add_rsi_features,
+  'srsi': add_srsi_features,
+  'stoch': add_stoch_features,
+  'tsi': add_tsi_features,
+  'uo': add_uo_features,
+  'wr': add_wr_features,
+  'atr': add_atr_features,
+  'mean_reversion': add_mean_reversion_features,
+  'bb': add_bb_features,
+  'dc': add_dc_features,
+  'kc': add_kc_features,
+  'ui': add_ui_features,
+}
+
+
 # ================================================ Indicator visualization  ========================================= #
+# downsample a line with Largest-Triangle-Three-Buckets
+def lttb_downsample(x, y, n_out):
+  """
+  Downsample a line with Largest-Triangle-Three-Buckets, keeping the visual shape of the line
+
+  :param x: x values (numeric, ascending)
+  :param y: y values
+  :param n_out: number of points to keep
+  :returns: downsampled x and y values
+  :raises: none
+  """
+  x = np.asarray(x, dtype=float)
+  y = np.asarray(y, dtype=float)
+  n = len(x)
+  if n_out >= n or n_out < 3:
+    return x, y
+
+  # first and last points are always kept, the rest are split into n_out-2 buckets
+  edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+  selected = np.empty(n_out, dtype=int)
+  selected[0] = 0
+  selected[-1] = n - 1
+
+  # in each bucket keep the point which forms the largest triangle with the previous selected point and the average of the next bucket
+  a = 0
+  for i in range(n_out - 2):
+    lo, hi = edges[i], edges[i + 1]
+    next_hi = edges[i + 2] if i + 2 < len(edges) else n
+    avg_x = np.nanmean(x[hi:next_hi])
+    avg_y = np.nanmean(y[hi:next_hi])
+    area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+    a = lo + np.argmax(np.where(np.isnan(area), -1, area))
+    selected[i + 1] = a
+
+  return x[selected], y[selected]
+
 # plot bar
-def plot_bar(df, target_col, start=None, end=None, width=0.8, alpha=1, color_mode='up_down', edge_color=(0,0,0,0.1), benchmark=None, add_line=False, title=None, use_ax=None, plot_args=default_plot_args):
+def plot_bar(df, target_col, start=None, end=None, width=0.8, alpha=1, color_mode='up_down', edge_color=(0,0,0,0.1), benchmark=None, add_line=False, title=None, use_ax=None, plot_args=default_plot_args, max_points=None, minimal=False):
 
-  # copy dataframe within a specific period
-  df = df[start:end].copy()
+  # select the target column within a specific period (a new frame, not a view)
+  df = df.loc[start:end, [target_col]]
 
   # create figure
   ax = use_ax
@@ -4658,28 +5293,38 @@ def plot_bar(df, target_col, start=None, end=None, width=0.8, alpha=1, color_mod
 
   # plot bar
   current = target_col
-  previous = 'previous_' + target_col
+  color_codes = None
   if color_mode == 'up_down':  
-    df['color'] = 'red'  
-    df[previous] = df[current].shift(1)
-    df.loc[df[current] >= df[previous], 'color'] = 'green'
+    values = df[current].to_numpy()
+    color_codes = np.zeros(len(values), dtype=np.uint8)
+    color_codes[1:] = values[1:] >= values[:-1]
 
   # plot in benchmark mode
   elif color_mode == 'benchmark' and benchmark is not None:
-    df['color'] = 'red'
-    df.loc[df[current] > benchmark, 'color'] = 'green'
-
-  # plot indicator
-  if 'color' in df.columns:
-    ax.bar(df.index, height=df[target_col], color=df.color, width=width , alpha=alpha, label=target_col, edgecolor=edge_color)
+    color_codes = (df[current].to_numpy() > benchmark).astype(np.uint8)
+
+  # keep every n-th bar for long histories (after colors are calculated on the full data)
+  if max_points is not None and len(df) > max_points:
+    step = math.ceil(len(df) / max_points)
+    df = df.iloc[::step]
+    color_codes = color_codes[::step] if color_codes is not None else None
+
+  # plot indicator (dates and bar width as matplotlib date numbers)
+  ax.xaxis_date()
+  x = mdates.date2num(df.index)
+  if isinstance(width, datetime.timedelta):
+    width = width / datetime.timedelta(days=1)
+  if color_codes is not None:
+    ax.bar(x, height=df[target_col], color=default_color_palette[color_codes], width=width , alpha=alpha, label=target_col, edgecolor=edge_color)
 
   if add_line:
-    ax.plot(df[target_col], color=df.color, alpha=alpha, label=target_col)
+    ax.plot(x, df[target_col], color='black', alpha=alpha, label=target_col)
 
-  # title and legend
-  ax.legend(bbox_to_anchor=plot_args['bbox_to_anchor'], loc=plot_args['loc'], ncol=plot_args['ncol'], borderaxespad=plot_args['borderaxespad']) 
-  ax.set_title(title, rotation=plot_args['title_rotation'], x=plot_args['title_x'], y=plot_args['title_y'])
-  ax.grid(True, axis='both', linestyle='-', linewidth=0.5, alpha=0.3)
+  # title, legend and grid (skipped in minimal mode)
+  if not minimal:
+    ax.legend(bbox_to_anchor=plot_args['bbox_to_anchor'], loc=plot_args['loc'], ncol=plot_args['ncol'], borderaxespad=plot_args['borderaxespad']) 
+    ax.set_title(title, rotation=plot_args['title_rotation'], x=plot_args['title_x'], y=plot_args['title_y'])
+    ax.grid(True, axis='both', linestyle='-', linewidth=0.5, alpha=0.3)
 
   ax.yaxis.set_ticks_position(default_plot_args['yaxis_position'])
 
@@ -4690,8 +5335,8 @@ def plot_bar(df, target_col, start=None, end=None, width=0.8, alpha=1, color_mod
 # plot volume
 def plot_scatter(df, target_col, start=None, end=None, marker='.', alpha=1, color_mode='up_down', benchmark=None, add_line=False, title=None, use_ax=None, plot_args=default_plot_args):
 
-  # copy dataframe within a specific period
-  df = df[start:end].copy()
+  # select the target column within a specific period (a new frame, not a view)
+  df = df.loc[start:end, [target_col]]
 
   # create figure
   ax = use_ax
@@ -4701,26 +5346,25 @@ def plot_scatter(df, target_col, start=None, end=None, marker='.', alpha=1, colo
 
   # plot bar
   current = target_col
-  previous = 'previous_' + target_col
+  color_codes = None
   if color_mode == 'up_down':  
-    df['color'] = 'red'  
-    df[previous] = df[current].shift(1)
-    df.loc[df[current] >= df[previous], 'color'] = 'green'
+    values = df[current].to_numpy()
+    color_codes = np.zeros(len(values), dtype=np.uint8)
+    color_codes[1:] = values[1:] >= values[:-1]
 
   # plot in benchmark mode
   elif color_mode == 'benchmark' and benchmark is not None:
-    df['color'] = 'red'
-    df.loc[df[current] > benchmark, 'color'] = 'green'
+    color_codes = (df[current].to_numpy() > benchmark).astype(np.uint8)
 
   # plot indicator
-  if 'color' in df.columns:
+  if color_codes is not None:
     # df = cal_change_rate(df=df, target_col='Volume', add_accumulation=False, add_prefix=True)
     # threshold = 0.2
     # strong_trend_idx = df.query(f'Volume_rate >= {threshold} or Volume_rate <= {-threshold}').index
     # weak_trend_idx = df.query(f'{-threshold} < Volume_rate < {threshold}').index
     # ax.scatter(strong_trend_idx, df.loc[strong_trend_idx, 'Volume'], color=df.loc[strong_trend_idx, 'color'], label=target_col, alpha=0.4, marker='s')
     # ax.scatter(weak_trend_idx, df.loc[weak_trend_idx, 'adx'], color=df.loc[weak_trend_idx, 'color'], alpha=0.4, marker='_')
-    ax.scatter(df.index, df[target_col], marker=marker,color=df.color, alpha=alpha, label=target_col)
+    ax.scatter(df.index, df[target_col], marker=marker,color=default_color_palette[color_codes], alpha=alpha, label=target_col)
 
   if add_line:
     ax.plot(df.index, df[target_col], color='black', linestyle='--', marker='.', alpha=alpha)
@@ -4749,8 +5393,8 @@ def plot_up_down(df, col='trend_idx', start=None, end=None, use_ax=None, title=N
   :returns: figure with indicators and close price plotted
   :raises: none
   """
-  # select data
-  df = df[start:end].copy() 
+  # copy the columns needed within a specific period
+  df = df.loc[start:end, [col, f'up_{col}', f'down_{col}', 'ichimoku_distance_day']].copy()
   
   # calculate score moving average
   df[f'up_{col}_ma'] = em(series=df[f'up_{col}'], periods=3).mean()
@@ -4758,9 +5402,9 @@ def plot_up_down(df, col='trend_idx', start=None, end=None, use_ax=None, title=N
   df[f'{col}_ma'] = em(series=df[f'{col}'], periods=3).mean()
 
   # change of score ma
-  df[f'up_{col}_ma_change'] = df[f'up_{col}_ma'] - df[f'up_{col}_ma'].shift(1)
-  df[f'down_{col}_ma_change'] = df[f'down_{col}_ma'] - df[f'down_{col}_ma'].shift(1)
-  df[f'{col}_ma_change'] = df[f'{col}_ma'] - df[f'{col}_ma'].shift(1)
+  df[f'up_{col}_ma_change'] = prev_diff(df[f'up_{col}_ma'].values)
+  df[f'down_{col}_ma_change'] = prev_diff(df[f'down_{col}_ma'].values)
+  df[f'{col}_ma_change'] = prev_diff(df[f'{col}_ma'].values)
   # conditions = {
   #   'up': f'((up_{col}_ma_change > 0) and (down_{col}_ma_change > 0) and ({col} > 0))', 
   #   'down': f'((up_{col}_ma_change < 0) and (down_{col}_ma_change < 0)) or ({col}_ma_change < -0.5)'} 
@@ -4817,7 +5461,7 @@ def plot_up_down(df, col='trend_idx', start=None, end=None, use_ax=None, title=N
   y_signal = 0
   text_signal = int(df.loc[max_idx, 'ichimoku_distance_day'])
   text_color = 'red' if text_signal < 0 else 'green'
-  plt.annotate(f'ich: {text_signal}', xy=(x_signal, y_signal), xytext=(x_signal, y_signal), fontsize=12, xycoords='data', textcoords='data', color='black', va='center',  ha='left', bbox=dict(boxstyle="round", facecolor=text_color, alpha=0.05))
+  ax.annotate(f'ich: {text_signal}', xy=(x_signal, y_signal), xytext=(x_signal, y_signal), fontsize=12, xycoords='data', textcoords='data', color='black', va='center',  ha='left', bbox=dict(boxstyle="round", facecolor=text_color, alpha=0.05))
 
   # title and legend
   # ax.legend(bbox_to_anchor=plot_args['bbox_to_anchor'], loc=plot_args['loc'], ncol=plot_args['ncol'], borderaxespad=plot_args['borderaxespad']) 
@@ -4843,8 +5487,8 @@ def plot_score(df, start=None, end=None, width=0.8, use_ax=None, title=None, plo
   :raises: none
   """
 
-  # select data
-  df = df[start:end].copy() 
+  # copy the columns needed within a specific period
+  df = df.loc[start:end, ['score', 'trigger_score']].copy()
 
   # create figure
   ax = use_ax
@@ -4902,8 +5546,8 @@ def plot_signal(df, start=None, end=None, signal_x='signal', signal_y='Close', u
   :returns: a signal plotted price chart
   :raises: none
   """
-  # copy dataframe within the specific period
-  df = df[start:end].copy()
+  # slice dataframe within the specific period (read-only, no copy needed)
+  df = df[start:end]
   
   # use existed figure or create figure
   ax = use_ax
@@ -4962,7 +5606,7 @@ def plot_signal(df, start=None, end=None, signal_x='signal', signal_y='Close', u
     y_signal = ys[signal_x]
     text_day = int(df.loc[max_idx, day_col])
     text_color = 'red' if text_day < 0 else 'green'
-    plt.annotate(f'{signal_x.replace("_signal", "")}:{text_day} ', xy=(x_signal, y_signal), xytext=(x_signal, y_signal), fontsize=12, xycoords='data', textcoords='data', color='black', va='center',  ha='left', bbox=dict(boxstyle="round", facecolor=text_color, edgecolor='none', alpha=0.1))
+    ax.annotate(f'{signal_x.replace("_signal", "")}:{text_day} ', xy=(x_signal, y_signal), xytext=(x_signal, y_signal), fontsize=12, xycoords='data', textcoords='data', color='black', va='center',  ha='left', bbox=dict(boxstyle="round", facecolor=text_color, edgecolor='none', alpha=0.1))
 
   # overbuy and oversell
   if signal_x == 'os':
@@ -5063,8 +5707,8 @@ def plot_adx(df, start=None, end=None, use_ax=None, title=None, plot_args=defaul
   :returns: ichimoku plot
   :raises: none
   """
-  # copy dataframe within a specific period
-  df = df[start:end].copy()
+  # slice dataframe within a specific period (read-only, no copy needed)
+  df = df[start:end]
   
   # create figure
   ax = use_ax
@@ -5072,6 +5716,10 @@ def plot_adx(df, start=None, end=None, use_ax=None, title=None, plot_args=defaul
     fig = mpf.figure(figsize=plot_args['figsize'])
     ax = fig.add_subplot(1,1,1, style='yahoo')
 
+  # convert dates to matplotlib date numbers once
+  ax.xaxis_date()
+  x = mdates.date2num(df.index)
+
   # idxs = df.index.tolist()
   # min_idx = df.index.min()
   # max_idx = df.index.max()
@@ -5098,11 +5746,10 @@ def plot_adx(df, start=None, end=None, use_ax=None, title=None, plot_args=defaul
   #   plt.annotate(f'{df.loc[max_idx, "renko_series_short"]}: {text_signal}', xy=(x_signal, y_signal), xytext=(x_signal, y_signal), fontsize=12, xycoords='data', textcoords='data', color='black', va='center',  ha='left', bbox=dict(boxstyle="round", facecolor=text_color, alpha=0.25))
   # else:
   #   ax.fill_between(df.index, 10, -10, hatch=None, linewidth=1, edgecolor='black', facecolor='grey', alpha=0.1)
-  ax.fill_between(df.index, 10, -10, hatch=None, linewidth=1, facecolor='grey', edgecolor='black', alpha=0.1, zorder=0)
+  ax.fill_between(x, 10, -10, hatch=None, linewidth=1, facecolor='grey', edgecolor='black', alpha=0.1, zorder=0)
 
   # plot adx_diff_ma and adx_direction
-  df['zero'] = 0
-  ax.plot(df.index, df.zero, color='black', alpha=0.25, zorder=0)
+  ax.plot(x, np.zeros(len(df)), color='black', alpha=0.25, zorder=0)
 
   # df['adx_ma_diff'] = df['adx_value'] - df['adx_value_ma']
   # df['prev_adx_day'] = df['adx_day'].shift(1)
@@ -5138,17 +5785,15 @@ def plot_adx(df, start=None, end=None, use_ax=None, title=None, plot_args=defaul
   adx_threshold = 25
 
   # overlap_mask = green_mask & red_mask
-  df['adx_color'] = 'orange'
-  df.loc[df.adx_power_day > 0, 'adx_color'] = 'green'
-  df.loc[df.adx_power_day < 0, 'adx_color'] = 'red'
+  adx_color = np.where(df.adx_power_day > 0, 'green', np.where(df.adx_power_day < 0, 'red', 'orange'))
 
-  strong_trend_idx = df.query(f'adx >= {adx_threshold}').index
-  weak_trend_idx = df.query(f'adx < {adx_threshold}').index
-  ax.scatter(strong_trend_idx, df.loc[strong_trend_idx, 'adx'], color=df.loc[strong_trend_idx, 'adx_color'], label='adx strong', alpha=0.4, marker='s', zorder=3)
-  ax.scatter(weak_trend_idx, df.loc[weak_trend_idx, 'adx'], color=df.loc[weak_trend_idx, 'adx_color'], label='adx weak', alpha=0.4, marker='_', zorder=3)
+  strong_trend = (df['adx'] >= adx_threshold).to_numpy()
+  weak_trend = (df['adx'] < adx_threshold).to_numpy()
+  ax.scatter(x[strong_trend], df['adx'].to_numpy()[strong_trend], color=adx_color[strong_trend], label='adx strong', alpha=0.4, marker='s', zorder=3)
+  ax.scatter(x[weak_trend], df['adx'].to_numpy()[weak_trend], color=adx_color[weak_trend], label='adx weak', alpha=0.4, marker='_', zorder=3)
 
   # plot moving average value of adx_value
-  ax.plot(df.index, df.adx_value_prediction, color='black', linestyle='-', alpha=0.5, zorder=3)
+  ax.plot(x, df.adx_value_prediction, color='black', linestyle='-', alpha=0.5, zorder=3)
 
   # title and legend
   ax.legend(bbox_to_anchor=plot_args['bbox_to_anchor'], loc=plot_args['loc'], ncol=plot_args['ncol'], borderaxespad=plot_args['borderaxespad']) 
@@ -5178,8 +5823,8 @@ def plot_candlestick(df, start=None, end=None, date_col='Date', add_on=['split',
   :returns: a candlestick chart
   :raises: none
   """
-  # copy dataframe within a specific period
-  df = df[start:end].copy()
+  # slice dataframe within a specific period (read-only, no copy needed)
+  df = df[start:end]
 
   # create figure
   ax = use_ax
@@ -5211,18 +5856,19 @@ def plot_candlestick(df, start=None, end=None, date_col='Date', add_on=['split',
       x_text = all_idx[max(0, all_idx.index(s)-2)]
       y_text = y + df.High.max()*0.1
       sp = round(df.loc[s, 'Split'], 4)
-      plt.annotate(f'splited {sp}', xy=(x, y), xytext=(x_text,y_text), xycoords='data', textcoords='data', arrowprops=dict(arrowstyle='->', alpha=0.5), bbox=dict(boxstyle="round", fc="1.0", alpha=0.5))
+      ax.annotate(f'splited {sp}', xy=(x, y), xytext=(x_text,y_text), xycoords='data', textcoords='data', arrowprops=dict(arrowstyle='->', alpha=0.5), bbox=dict(boxstyle="round", fc="1.0", alpha=0.5))
   
   # annotate gaps
   if 'gap' in add_on:
 
-    # for gap which start before 'start_date'
+    # for gap which start before 'start_date' (only the candle_gap column is copied)
+    candle_gap = df['candle_gap'].copy()
     if df.loc[min_idx, 'candle_gap_top'] > df.loc[min_idx, 'candle_gap_bottom']:
-      df.loc[min_idx, 'candle_gap'] = df.loc[min_idx, 'candle_gap_color'] * 2
+      candle_gap[min_idx] = df.loc[min_idx, 'candle_gap_color'] * 2
 
     # invalidate all gaps if there are too many gaps in the data
-    up_gap_idxs = df.query('candle_gap == 2').index.tolist()
-    down_gap_idxs = df.query('candle_gap == -2').index.tolist()
+    up_gap_idxs = candle_gap[candle_gap == 2].index.tolist()
+    down_gap_idxs = candle_gap[candle_gap == -2].index.tolist()
     if len(up_gap_idxs) > 10:
       up_gap_idxs = []
     if len(down_gap_idxs) > 10:
@@ -5236,15 +5882,15 @@ def plot_candlestick(df, start=None, end=None, date_col='Date', add_on=['split',
       start = idx
       top_value = df.loc[start, 'candle_gap_top']
       bottom_value = df.loc[start, 'candle_gap_bottom']
-      gap_color = 'green' if df.loc[start, 'candle_gap'] > 0 else 'red' # 'lightyellow' if df.loc[start, 'candle_gap'] > 0 else 'grey' # 
+      gap_color = 'green' if candle_gap[start] > 0 else 'red' # 'lightyellow' if df.loc[start, 'candle_gap'] > 0 else 'grey' # 
       gap_hatch = '||||' # '////' if df.loc[start, 'candle_gap'] > 0 else '\\\\\\\\' # 'xxxx'# 
       gap_hatch_color = 'black' # 'darkgreen' if df.loc[start, 'candle_gap'] > 0 else 'darkred' 
       
       # gap end
       end = None
       tmp_data = df[start:]
-      for i, r in tmp_data.iterrows(): 
-        if (r['candle_gap_top'] != top_value) or (r['candle_gap_bottom'] != bottom_value):  
+      for i, gap_top, gap_bottom in tmp_data[['candle_gap_top', 'candle_gap_bottom']].itertuples(index=True, name=None): 
+        if (gap_top != top_value) or (gap_bottom != bottom_value):  
           break      
         end = i
 
@@ -5268,7 +5914,7 @@ def plot_candlestick(df, start=None, end=None, date_col='Date', add_on=['split',
     y_close_padding = padding*5
     y_close = df.loc[max_idx, 'Close'].round(2)
     y_text_close = y_close
-    plt.annotate(f'{y_close}', xy=(max_x, y_text_close), xytext=(max_x, y_text_close), fontsize=13, xycoords='data', textcoords='data', color='black', va='center',  ha='left', bbox=dict(boxstyle="round", alpha=0))
+    ax.annotate(f'{y_close}', xy=(max_x, y_text_close), xytext=(max_x, y_text_close), fontsize=13, xycoords='data', textcoords='data', color='black', va='center',  ha='left', bbox=dict(boxstyle="round", alpha=0))
 
     y_resistant = None
     y_text_resistant = None
@@ -5284,7 +5930,7 @@ def plot_candlestick(df, start=None, end=None, date_col='Date', add_on=['split',
       diff = y_text_resistant - y_text_close
       if diff < y_close_padding:
         y_text_resistant = y_text_close + y_close_padding
-      plt.annotate(f'{y_resistant}[{resistant_score}]', xy=(max_x, y_text_resistant), xytext=(max_x, y_text_resistant), fontsize=13, xycoords='data', textcoords='data', color='black', va='bottom',  ha='left', bbox=dict(boxstyle="round", facecolor='red', alpha=0.1*resistant_score))
+      ax.annotate(f'{y_resistant}[{resistant_score}]', xy=(max_x, y_text_resistant), xytext=(max_x, y_text_resistant), fontsize=13, xycoords='data', textcoords='data', color='black', va='bottom',  ha='left', bbox=dict(boxstyle="round", facecolor='red', alpha=0.1*resistant_score))
     
     # annotate support 
     if df.loc[max_idx, 'supporter'] > '':
@@ -5295,7 +5941,7 @@ def plot_candlestick(df, start=None, end=None, date_col='Date', add_on=['split',
       diff = y_text_close - y_text_support
       if diff < y_close_padding:
         y_text_support = y_text_close - y_close_padding
-      plt.annotate(f'{y_support}[{support_score}]', xy=(max_x, y_text_support), xytext=(max_x, y_text_support), fontsize=13, xycoords='data', textcoords='data', color='black', va='top',  ha='left', bbox=dict(boxstyle="round", facecolor='green', alpha=0.1*support_score))
+      ax.annotate(f'{y_support}[{support_score}]', xy=(max_x, y_text_support), xytext=(max_x, y_text_support), fontsize=13, xycoords='data', textcoords='data', color='black', va='top',  ha='left', bbox=dict(boxstyle="round", facecolor='green', alpha=0.1*support_score))
 
   # annotate candle patterns
   if 'pattern' in add_on:
@@ -5403,7 +6049,7 @@ def plot_candlestick(df, start=None, end=None, date_col='Date', add_on=['split',
         else:
           y_text = df.High.max() + y_text_padding[counter % 2]
           
-        plt.annotate(f'{text}', xy=(x, y), xytext=(x,y_text), fontsize=style['fontsize'], rotation=0, color=style['fontcolor'], va=style['va'],  ha=style['ha'], xycoords='data', textcoords='data', arrowprops=dict(arrowstyle=style['arrowstyle'], alpha=0.5, color='black'), bbox=dict(boxstyle="round", facecolor=style[a], edgecolor='none', alpha=style['alpha']))
+        ax.annotate(f'{text}', xy=(x, y), xytext=(x,y_text), fontsize=style['fontsize'], rotation=0, color=style['fontcolor'], va=style['va'],  ha=style['ha'], xycoords='data', textcoords='data', arrowprops=dict(arrowstyle=style['arrowstyle'], alpha=0.5, color='black'), bbox=dict(boxstyle="round", facecolor=style[a], edgecolor='none', alpha=style['alpha']))
         counter += 1
 
   # transform date to numbers, plot candlesticks
@@ -5435,17 +6081,17 @@ def plot_candlestick(df, start=None, end=None, date_col='Date', add_on=['split',
   ax.fill_between(df.index, df.loc[min_idx, 'High'], df.loc[min_idx, 'Low'], facecolor=None, interpolate=True, alpha=0, linewidth=1, zorder=default_zorders['candle_pattern'])
 
   # plot each candlestick
-  for idx, row in df.iterrows():
+  for idx, row_open, row_high, row_low, row_close in df[[open, high, low, close]].itertuples(index=True, name=None):
     
     # set entity_color
-    if row[close] >= row[open]:
+    if row_close >= row_open:
       entity_color = color['color_up']
-      lower = row[open]
-      height = row[close] - row[open]
+      lower = row_open
+      height = row_close - row_open
     else:
       entity_color = color['color_down']
-      lower = row[close]
-      height = row[open] - row[close]
+      lower = row_close
+      height = row_open - row_close
     
     # set shadow_color
     if shadow_color is not None:
@@ -5454,7 +6100,7 @@ def plot_candlestick(df, start=None, end=None, date_col='Date', add_on=['split',
       line_color = entity_color
     
     # plot shadow
-    vline = Line2D(xdata=(idx, idx), ydata=(row[low], row[high]), color=line_color, linewidth=1, antialiased=True, zorder=default_zorders['candle_shadow'])
+    vline = Line2D(xdata=(idx, idx), ydata=(row_low, row_high), color=line_color, linewidth=1, antialiased=True, zorder=default_zorders['candle_shadow'])
     
     # plot entity
     x = idx - OFFSET
@@ -5522,13 +6168,17 @@ def plot_main_indicators(df, start=None, end=None, date_col='Date', add_on=['spl
     fig = mpf.figure(figsize=plot_args['figsize'])
     ax = fig.add_subplot(1,1,1, style='yahoo')
 
+  # convert dates to matplotlib date numbers once
+  ax.xaxis_date()
+  x = mdates.date2num(df.index)
+
   # as we usually ploting data within a year, therefore log_y is not necessary
   # ax.set_yscale("log")
 
   # plot close price
   if 'price' in target_indicator:
     alpha = 0.2
-    ax.plot(df.index, df[default_ohlcv_col['close']], label='close', color='black', linestyle='--', alpha=alpha, zorder=default_zorders['price'])
+    ax.plot(x, df[default_ohlcv_col['close']], label='close', color='black', linestyle='--', alpha=alpha, zorder=default_zorders['price'])
   
   # plot renko bricks
   if 'renko' in target_indicator:
@@ -5537,17 +6187,17 @@ def plot_main_indicators(df, start=None, end=None, date_col='Date', add_on=['spl
   # plot senkou lines, clouds, tankan and kijun
   if 'ichimoku' in target_indicator:
     alpha = 0.8
-    ax.plot(df.index, df.tankan, label='tankan', color='green', linestyle='-', alpha=alpha, zorder=default_zorders['ichimoku']) # magenta
-    ax.plot(df.index, df.kijun, label='kijun', color='red', linestyle='-', alpha=alpha, zorder=default_zorders['ichimoku']) # blue
+    ax.plot(x, df.tankan, label='tankan', color='green', linestyle='-', alpha=alpha, zorder=default_zorders['ichimoku']) # magenta
+    ax.plot(x, df.kijun, label='kijun', color='red', linestyle='-', alpha=alpha, zorder=default_zorders['ichimoku']) # blue
     alpha = 0.25
-    ax.fill_between(df.index, df.tankan, df.kijun, where=df.tankan > df.kijun, facecolor='green', interpolate=True, alpha=alpha, zorder=default_zorders['ichimoku'])
-    ax.fill_between(df.index, df.tankan, df.kijun, where=df.tankan <= df.kijun, facecolor='red', interpolate=True, alpha=alpha, zorder=default_zorders['ichimoku'])
+    ax.fill_between(x, df.tankan, df.kijun, where=df.tankan > df.kijun, facecolor='green', interpolate=True, alpha=alpha, zorder=default_zorders['ichimoku'])
+    ax.fill_between(x, df.tankan, df.kijun, where=df.tankan <= df.kijun, facecolor='red', interpolate=True, alpha=alpha, zorder=default_zorders['ichimoku'])
   
   # plot kama_fast/slow lines 
   if 'kama' in target_indicator:
     alpha = 0.8
-    ax.plot(df.index, df.kama_fast, label='kama_fast', color='magenta', linestyle='-', alpha=alpha, zorder=default_zorders['kama']) # magenta
-    ax.plot(df.index, df.kama_slow, label='kama_slow', color='blue', linestyle='-', alpha=alpha, zorder=default_zorders['kama'])
+    ax.plot(x, df.kama_fast, label='kama_fast', color='magenta', linestyle='-', alpha=alpha, zorder=default_zorders['kama']) # magenta
+    ax.plot(x, df.kama_slow, label='kama_slow', color='blue', linestyle='-', alpha=alpha, zorder=default_zorders['kama'])
 
     # alpha = 0.1
     # ax.fill_between(df.index, df.kama_fast, df.kama_slow, where=df.kama_fast > df.kama_slow, facecolor='green', interpolate=True, alpha=alpha, zorder=-1)
@@ -5557,16 +6207,16 @@ def plot_main_indicators(df, start=None, end=None, date_col='Date', add_on=['spl
   if 'bb' in target_indicator:
     alpha = 0.2
     alpha_fill = 0.02
-    ax.plot(df.index, df.bb_high_band, label='bb_high_band', color='black', linestyle='-', alpha=alpha, zorder=default_zorders['default'])
-    ax.plot(df.index, df.bb_low_band, label='bb_low_band', color='black', linestyle='-', alpha=alpha, zorder=default_zorders['default'])
-    ax.plot(df.index, df.mavg, label='mavg', color='black', linestyle=':', alpha=alpha*3, zorder=default_zorders['default'])
-    ax.fill_between(df.index, df.mavg, df.bb_high_band, facecolor='green', interpolate=True, alpha=alpha_fill, zorder=default_zorders['default'])
-    ax.fill_between(df.index, df.mavg, df.bb_low_band, facecolor='red', interpolate=True, alpha=alpha_fill, zorder=default_zorders['default'])
+    ax.plot(x, df.bb_high_band, label='bb_high_band', color='black', linestyle='-', alpha=alpha, zorder=default_zorders['default'])
+    ax.plot(x, df.bb_low_band, label='bb_low_band', color='black', linestyle='-', alpha=alpha, zorder=default_zorders['default'])
+    ax.plot(x, df.mavg, label='mavg', color='black', linestyle=':', alpha=alpha*3, zorder=default_zorders['default'])
+    ax.fill_between(x, df.mavg, df.bb_high_band, facecolor='green', interpolate=True, alpha=alpha_fill, zorder=default_zorders['default'])
+    ax.fill_between(x, df.mavg, df.bb_low_band, facecolor='red', interpolate=True, alpha=alpha_fill, zorder=default_zorders['default'])
   
   # plot average true range
   if 'atr' in target_indicator:
     alpha = 0.6
-    ax.plot(df.index, df.atr, label='atr', color='green', alpha=alpha, zorder=default_zorders['default'])
+    ax.plot(x, df.atr, label='atr', color='green', alpha=alpha, zorder=default_zorders['default'])
     # ax.plot(df.index, df.bb_low_band, label='bb_low_band', color='red', alpha=alpha)
     # ax.plot(df.index, df.mavg, label='mavg', color='grey', alpha=alpha)
     # ax.fill_between(df.index, df.mavg, df.bb_high_band, facecolor='green', interpolate=True, alpha=0.1)
@@ -5576,8 +6226,8 @@ def plot_main_indicators(df, start=None, end=None, date_col='Date', add_on=['spl
   if 'psar' in target_indicator:
     alpha = 0.6
     s = 10
-    ax.scatter(df.index, df.psar_up, label='psar', color='green', alpha=alpha, s=s, marker='o', zorder=default_zorders['default'])
-    ax.scatter(df.index, df.psar_down, label='psar', color='red', alpha=alpha, s=s, marker='o', zorder=default_zorders['default'])
+    ax.scatter(x, df.psar_up, label='psar', color='green', alpha=alpha, s=s, marker='o', zorder=default_zorders['default'])
+    ax.scatter(x, df.psar_down, label='psar', color='red', alpha=alpha, s=s, marker='o', zorder=default_zorders['default'])
   
   # plot high/low trend
   if 'linear' in target_indicator:
@@ -5587,14 +6237,14 @@ def plot_main_indicators(df, start=None, end=None, date_col='Date', add_on=['spl
     line_alpha = 0.5
     linear_direction = df.loc[max_idx, 'linear_direction']
     linear_color = colors[linear_direction]
-    ax.plot(df.index, df.linear_fit_high, label='linear_fit_high', color=linear_color, linestyle='-.', alpha=line_alpha, zorder=default_zorders['default'])
-    ax.plot(df.index, df.linear_fit_low, label='linear_fit_low', color=linear_color, linestyle='-.', alpha=line_alpha, zorder=default_zorders['default'])
+    ax.plot(x, df.linear_fit_high, label='linear_fit_high', color=linear_color, linestyle='-.', alpha=line_alpha, zorder=default_zorders['default'])
+    ax.plot(x, df.linear_fit_low, label='linear_fit_low', color=linear_color, linestyle='-.', alpha=line_alpha, zorder=default_zorders['default'])
 
     # fill between linear_fit_high and linear_fit_low
     fill_alpha = 0.25
     linear_range = df.linear_direction != ''
     linear_hatch = '--' # hatches[linear_direction]
-    ax.fill_between(df.index, df.linear_fit_high, df.linear_fit_low, where=linear_range, facecolor='white', edgecolor=linear_color, hatch=linear_hatch, interpolate=True, alpha=fill_alpha, zorder=default_zorders['default'])    
+    ax.fill_between(x, df.linear_fit_high, df.linear_fit_low, where=linear_range, facecolor='white', edgecolor=linear_color, hatch=linear_hatch, interpolate=True, alpha=fill_alpha, zorder=default_zorders['default'])    
   
   # plot candlestick
   if 'candlestick' in target_indicator:
@@ -5631,8 +6281,8 @@ def plot_aroon(df, start=None, end=None, use_ax=None, title=None, plot_args=defa
   :returns: ichimoku plot
   :raises: none
   """
-  # copy dataframe within a specific period
-  df = df[start:end].copy()
+  # slice dataframe within a specific period (read-only, no copy needed)
+  df = df[start:end]
 
   # create figure
   ax = use_ax
@@ -5640,13 +6290,17 @@ def plot_aroon(df, start=None, end=None, use_ax=None, title=None, plot_args=defa
     fig = mpf.figure(figsize=plot_args['figsize'])
     ax = fig.add_subplot(1,1,1, style='yahoo')
 
+  # convert dates to matplotlib date numbers once
+  ax.xaxis_date()
+  x = mdates.date2num(df.index)
+
   # plot aroon_up/aroon_down lines 
-  ax.plot(df.index, df.aroon_up, label='aroon_up', color='green', marker='.', alpha=0.2)
-  ax.plot(df.index, df.aroon_down, label='aroon_down', color='red', marker='.', alpha=0.2)
+  ax.plot(x, df.aroon_up, label='aroon_up', color='green', marker='.', alpha=0.2)
+  ax.plot(x, df.aroon_down, label='aroon_down', color='red', marker='.', alpha=0.2)
 
   # fill between aroon_up/aroon_down
-  ax.fill_between(df.index, df.aroon_up, df.aroon_down, where=df.aroon_up > df.aroon_down, facecolor='green', interpolate=True, alpha=0.2)
-  ax.fill_between(df.index, df.aroon_up, df.aroon_down, where=df.aroon_up <= df.aroon_down, facecolor='red', interpolate=True, alpha=0.2)
+  ax.fill_between(x, df.aroon_up, df.aroon_down, where=df.aroon_up > df.aroon_down, facecolor='green', interpolate=True, alpha=0.2)
+  ax.fill_between(x, df.aroon_up, df.aroon_down, where=df.aroon_up <= df.aroon_down, facecolor='red', interpolate=True, alpha=0.2)
 
   # # plot waving areas
   # wave_idx = (df.aroon_gap_change==0)&(df.aroon_up_change==df.aroon_down_change)#&(df.aroon_up<96)&(df.aroon_down<96)
@@ -5668,10 +6322,10 @@ def plot_aroon(df, start=None, end=None, use_ax=None, title=None, plot_args=defa
     return ax
 
 # plot renko chart
-def plot_renko(df, start=None, end=None, use_ax=None, title=None, plot_in_date=True, close_alpha=0.5, save_path=None, save_image=False, show_image=False, plot_args=default_plot_args):
+def plot_renko(df, start=None, end=None, use_ax=None, title=None, plot_in_date=True, close_alpha=0.5, save_path=None, save_image=False, show_image=False, plot_args=default_plot_args, minimal=False):
   
-  # copy data frame
-  df = df[start:end].copy()
+  # copy the columns needed within a specific period
+  df = df.loc[start:end, ['Close', 'renko_o', 'renko_color', 'renko_real', 'renko_brick_height', 'renko_countdown_days']].copy()
 
   # create figure
   ax = use_ax
@@ -5689,40 +6343,43 @@ def plot_renko(df, start=None, end=None, use_ax=None, title=None, plot_in_date=T
     df.loc[min_idx, 'renko_real'] = df.loc[min_idx, 'renko_color'] 
     df.loc[min_idx, 'renko_countdown_days'] = df.loc[min_idx, 'renko_countdown_days'] 
   
+  real_mask = df['renko_real'].isin(['green', 'red']).to_numpy()
   if plot_in_date:
-    df = df.query('renko_real == "green" or renko_real =="red"').copy()
+    df = df[real_mask]
   else:
-    df = df.query('renko_real == "green" or renko_real =="red"').reset_index()
+    df = df[real_mask].reset_index()
   
-  # plot renko
-  legends = {'green': 'u', 'red': 'd', np.nan:' '}
-  for index, row in df.iterrows():
-    hatch = '----' # '/////' if row['renko_color'] == 'green' else '\\\\\\\\\\'
-    facecolor = 'white'
-    edgecolor = 'black'
-    renko = Rectangle((index, row['renko_o']), row['renko_countdown_days'], row['renko_brick_height'], facecolor=facecolor, edgecolor=edgecolor, hatch=hatch, linestyle='-', linewidth=0.1, fill=False, alpha=0.4, label=legends[row['renko_real']], zorder=default_zorders['renko']) #  edgecolor=row['renko_color'], linestyle='-', linewidth=5, 
-    legends[row['renko_real']] = "_nolegend_"
-    ax.add_patch(renko, )
+  # plot renko bricks as a single polygon collection (x in date numbers or row positions, width in days or 1 brick)
+  hatch = '----' # '/////' if row['renko_color'] == 'green' else '\\\\\\\\\\'
+  if plot_in_date:
+    x = mdates.date2num(df.index)
+    widths = pd.to_timedelta(df['renko_countdown_days'], unit='D').to_numpy() / np.timedelta64(1, 'D')
+  else:
+    x = df.index.to_numpy(dtype=float)
+    widths = np.ones(len(df))
+  y = df['renko_o'].to_numpy()
+  heights = df['renko_brick_height'].to_numpy()
+  x_right = x + widths
+  y_top = y + heights
+  verts = np.stack([np.column_stack([x, y]), np.column_stack([x_right, y]), np.column_stack([x_right, y_top]), np.column_stack([x, y_top])], axis=1)
+  ax.add_collection(PolyCollection(verts, facecolor='none', edgecolor='black', hatch=hatch, linestyle='-', linewidth=0.1, alpha=0.4, zorder=default_zorders['renko']))
+
+  # legend proxies (zero-sized rectangles do not change the data limits)
+  legends = {'green': 'u', 'red': 'd'}
+  for color in df['renko_real'].unique():
+    ax.add_patch(Rectangle((x[0], y[0]), 0, 0, facecolor='white', edgecolor='black', hatch=hatch, linestyle='-', linewidth=0.1, fill=False, alpha=0.4, label=legends.get(color, ' ')))
   
   # modify axes   
   if not plot_in_date:
-    ax.get_figure().canvas.draw()
-    xlabels = [item.get_text() for item in ax.get_xticklabels()]
-    for i in range(len(xlabels)):  
-      try:
-        idx = int(xlabels[i])
-        if idx in df.index:
-          xlabels[i] = f'{df.loc[idx, "Date"].date()}'
-        else:
-          xlabels[i] = f'{df.index.max().date()}'
-          continue
-      except Exception as e:
-        continue
-    ax.set_xticklabels(xlabels)
+    # label brick positions with their dates, positions out of range use the last date
+    dates = df['Date'].dt.strftime('%Y-%m-%d').to_numpy()
+    max_date = f'{max_idx.date()}'
+    ax.xaxis.set_major_formatter(FuncFormatter(lambda x, pos: dates[int(x)] if 0 <= int(x) < len(dates) else max_date))
   
-  # title and legend
-  ax.legend(bbox_to_anchor=plot_args['bbox_to_anchor'], loc=plot_args['loc'], ncol=plot_args['ncol'], borderaxespad=plot_args['borderaxespad']) 
-  ax.set_title(title, rotation=plot_args['title_rotation'], x=plot_args['title_x'], y=plot_args['title_y'])
+  # title and legend (skipped in minimal mode)
+  if not minimal:
+    ax.legend(bbox_to_anchor=plot_args['bbox_to_anchor'], loc=plot_args['loc'], ncol=plot_args['ncol'], borderaxespad=plot_args['borderaxespad']) 
+    ax.set_title(title, rotation=plot_args['title_rotation'], x=plot_args['title_x'], y=plot_args['title_y'])
   # ax.grid(True, axis='x', linestyle='--', linewidth=0.5)
 
   ax.yaxis.set_ticks_position(default_plot_args['yaxis_position'])
@@ -5733,7 +6390,7 @@ def plot_renko(df, start=None, end=None, use_ax=None, title=None, plot_in_date=T
   else:
     # save image
     if save_image and (save_path is not None):
-      plt.savefig(save_path + title + '.png')
+      ax.figure.savefig(save_path + title + '.png')
       
     # show image
     if show_image:
@@ -5786,13 +6443,13 @@ def plot_summary(data, width=20, unit_size=0.3, wspace=0, hspace=0.4, plot_args=
 
     # get ax
     if i == 0:
-      rate_ax = plt.subplot(gs[i*2], zorder=1) 
-      score_ax = plt.subplot(gs[i*2+1], zorder=0)
+      rate_ax = fig.add_subplot(gs[i*2], zorder=1) 
+      score_ax = fig.add_subplot(gs[i*2+1], zorder=0)
       axes['rate'] = rate_ax
       axes['score'] = score_ax
     else:
-      rate_ax = plt.subplot(gs[i*2], sharex=axes['rate'], zorder=1) 
-      score_ax = plt.subplot(gs[i*2+1], sharex=axes['score'], zorder=0)
+      rate_ax = fig.add_subplot(gs[i*2], sharex=axes['rate'], zorder=1) 
+      score_ax = fig.add_subplot(gs[i*2+1], sharex=axes['score'], zorder=0)
       
     # plot rate
     tmp_data['rate_color'] = 'green'
@@ -5832,12 +6489,12 @@ def plot_summary(data, width=20, unit_size=0.3, wspace=0, hspace=0.4, plot_args=
 
   # save image
   if save_path is not None:
-    plt.savefig(save_path, bbox_inches = 'tight')
+    fig.savefig(save_path, bbox_inches = 'tight')
 
   return score_ax
 
 # plot general ta indicators
-def plot_indicator(df, target_col, start=None, end=None, signal_x='signal', signal_y='Close', benchmark=None, boundary=None, color_mode=None, use_ax=None, title=None, plot_price_in_twin_ax=False, trend_val=default_trend_val, signal_val=default_signal_val, plot_args=default_plot_args):
+def plot_indicator(df, target_col, start=None, end=None, signal_x='signal', signal_y='Close', benchmark=None, boundary=None, color_mode=None, use_ax=None, title=None, plot_price_in_twin_ax=False, trend_val=default_trend_val, signal_val=default_signal_val, plot_args=default_plot_args, max_points=None, minimal=False, plot_lines=False):
   """
   Plot indicators around a benchmark
 
@@ -5856,11 +6513,14 @@ def plot_indicator(df, target_col, start=None, end=None, signal_x='signal', sign
   :param trend_val: value of different kind of trends (e.g. 'u'/'d'/'n')
   :param signal_val: values of different kind of signals
   :param plot_args: other plot arguments
+  :param max_points: if set, indicator lines longer than this are downsampled with LTTB
+  :param minimal: whether to skip the title and legend of the plot
+  :param plot_lines: whether to plot lines when there are multiple target columns (drawn in a single collection)
   :returns: figure with indicators and close price plotted
   :raises: none
   """
-  # select data
-  df = df[start:end].copy() 
+  # select data (read-only, bar colors are kept in a local array)
+  df = df[start:end]
   
   # create figure
   ax = use_ax
@@ -5868,53 +6528,70 @@ def plot_indicator(df, target_col, start=None, end=None, signal_x='signal', sign
     fig = mpf.figure(figsize=plot_args['figsize'])
     ax = fig.add_subplot(1,1,1, style='yahoo')
 
+  # convert dates to matplotlib date numbers once
+  ax.xaxis_date()
+  x = mdates.date2num(df.index)
+
   # plot benchmark
   if benchmark is not None:
-    df['benchmark'] = benchmark
-    ax.plot(df.index, df['benchmark'], color='black', linestyle='-', label='%s'%benchmark, alpha=0.3)
+    ax.axhline(benchmark, color='black', linestyle='-', label='%s'%benchmark, alpha=0.3)
 
   # plot boundary
   if boundary is not None:
     if len(boundary) > 0:
-      df['upper_boundary'] = max(boundary)
-      df['lower_boundary'] = min(boundary)
-      ax.plot(df.index, df['upper_boundary'], color='green', linestyle='--', label='%s'% max(boundary), alpha=0.5)
-      ax.plot(df.index, df['lower_boundary'], color='red', linestyle='--', label='%s'% min(boundary), alpha=0.5)
+      upper_boundary = max(boundary)
+      lower_boundary = min(boundary)
+      ax.axhline(upper_boundary, color='green', linestyle='--', label='%s'% upper_boundary, alpha=0.5)
+      ax.axhline(lower_boundary, color='red', linestyle='--', label='%s'% lower_boundary, alpha=0.5)
 
   # plot indicator(s)
   unexpected_col = [x for x in target_col if x not in df.columns]
   if len(unexpected_col) > 0:
     print('column not found: ', unexpected_col)
   target_col = [x for x in target_col if x in df.columns]
-  # for col in target_col:
-  #   ax.plot(df.index, df[col], label=col, alpha=0.5)
+
+  # plot lines if there are multiple indicators to plot (only when plot_lines is set), all lines are drawn in a single collection
+  if plot_lines and len(target_col) > 1:
+    if max_points is not None and len(df) > max_points:
+      lines = [np.column_stack(lttb_downsample(x, df[col].to_numpy(), max_points)) for col in target_col]
+    else:
+      lines = [np.column_stack([x, df[col].to_numpy()]) for col in target_col]
+    cycle_colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    line_colors = [cycle_colors[i % len(cycle_colors)] for i in range(len(target_col))]
+    ax.add_collection(LineCollection(lines, colors=line_colors, alpha=0.5))
+    ax.autoscale_view()
+
+    # legend proxies
+    for col, color in zip(target_col, line_colors):
+      ax.plot([], [], color=color, alpha=0.5, label=col)
 
   # plot color bars if there is only one indicator to plot
   if len(target_col) == 1:
     tar = target_col[0]
+    color_codes = None
 
     # plot in up_down mode
     if color_mode == 'up_down':  
-      df['color'] = 'red'
-      previous_target_col = 'previous_' + tar
-      df[previous_target_col] = df[tar].shift(1)
-      df.loc[df[tar] > df[previous_target_col], 'color'] = 'green'
-      df.loc[df[tar] == df[previous_target_col], 'color'] = 'orange'
+      values = df[tar].to_numpy()
+      is_flat = np.zeros(len(values), dtype=bool)
+      is_up = np.zeros(len(values), dtype=bool)
+      is_flat[1:] = values[1:] == values[:-1]
+      is_up[1:] = values[1:] > values[:-1]
 
       target_max = df[target_col].values.max()
       target_min = df[target_col].values.min()
 
-      df.loc[df[tar] >= target_max, 'color'] = 'green'
-      df.loc[df[tar] <= target_min, 'color'] = 'red'
+      # later conditions take priority: min > max > flat > up > default(red)
+      conditions = [values <= target_min, values >= target_max, is_flat, is_up]
+      color_codes = np.select(conditions, [0, 1, 2, 1], default=0).astype(np.uint8)
 
     # plot in benchmark mode
     elif color_mode == 'benchmark' and benchmark is not None:
-      df['color'] = 'red'
-      df.loc[df[tar] > benchmark, 'color'] = 'green'
+      color_codes = (df[tar].to_numpy() > benchmark).astype(np.uint8)
 
     # plot indicator
-    if 'color' in df.columns:
-      ax.bar(df.index, height=df[tar], color=df.color, alpha=0.3)
+    if color_codes is not None:
+      ax.bar(x, height=df[tar], color=default_color_palette[color_codes], alpha=0.3)
 
   # plot close price
   if signal_y in df.columns:
@@ -5925,9 +6602,10 @@ def plot_indicator(df, target_col, start=None, end=None, signal_x='signal', sign
     else:
       plot_signal(df, signal_x=signal_x, signal_y=signal_y, trend_val=trend_val, signal_val=signal_val, use_ax=ax)
 
-  # plot title and legend
-  ax.legend(bbox_to_anchor=plot_args['bbox_to_anchor'], loc=plot_args['loc'], ncol=plot_args['ncol'], borderaxespad=plot_args['borderaxespad']) 
-  ax.set_title(title, rotation=plot_args['title_rotation'], x=plot_args['title_x'], y=plot_args['title_y'])
+  # plot title and legend (skipped in minimal mode)
+  if not minimal:
+    ax.legend(bbox_to_anchor=plot_args['bbox_to_anchor'], loc=plot_args['loc'], ncol=plot_args['ncol'], borderaxespad=plot_args['borderaxespad']) 
+    ax.set_title(title, rotation=plot_args['title_rotation'], x=plot_args['title_x'], y=plot_args['title_y'])
 
   ax.yaxis.set_ticks_position(default_plot_args['yaxis_position'])
 
@@ -5935,6 +6613,111 @@ def plot_indicator(df, target_col, start=None, end=None, signal_x='signal', sign
   if use_ax is not None:
     return ax
 
+# plot main indicators(ichimoku, kama, candlesticks, etc.) in a subplot of plot_multiple_indicators
+def subplot_main_indicators(df, ax, title, args, interval, plot_args):
+  """
+  Plot main indicators in a subplot
+
+  :param df: dataframe to plot
+  :param ax: the already-created ax to draw on
+  :param title: title of the subplot
+  :param args: arguments of the subplot (merged with default_subplot_args)
+  :param interval: interval of the data
+  :param plot_args: other plot arguments
+  :returns: none
+  :raises: none
+  """
+  plot_main_indicators(
+    df=df, target_indicator=args['target_indicator'], interval=interval, candlestick_color=args['candlestick_color'],
+    use_ax=ax, title=title, plot_args=plot_args)
+
+# plot volume in a subplot of plot_multiple_indicators
+def subplot_volume(df, ax, title, args, interval, plot_args):
+  """
+  Plot volume bars in a subplot
+
+  :param df: dataframe to plot
+  :param ax: the already-created ax to draw on
+  :param title: title of the subplot
+  :param args: arguments of the subplot (merged with default_subplot_args)
+  :param interval: interval of the data, which decides the bar width
+  :param plot_args: other plot arguments
+  :returns: none
+  :raises: none
+  """
+  # set bar_width according to data interval
+  interval_days = {'day': 1, 'week': 7, 'month': 30, 'year': 365}
+  bar_width = datetime.timedelta(days=interval_days[interval]) if interval in interval_days else 0.8
+
+  plot_bar(df=df, target_col=args['target_col'], width=bar_width, alpha=args['alpha'], color_mode=args['color_mode'], benchmark=None, title=title, use_ax=ax, plot_args=default_plot_args, max_points=args['max_points'], minimal=args['minimal'])
+
+# plot ta signals or candle patterns in a subplot of plot_multiple_indicators
+def subplot_signals(df, ax, title, args, interval, plot_args):
+  """
+  Plot signals (each in a seperate row) in a subplot
+
+  :param df: dataframe to plot
+  :param ax: the already-created ax to draw on
+  :param title: title of the subplot
+  :param args: arguments of the subplot (merged with default_subplot_args)
+  :param interval: interval of the data
+  :param plot_args: other plot arguments
+  :returns: none
+  :raises: none
+  """
+  signals = args['signal_list']
+  signal_bases = []
+  signal_names = []
+  if signals is not None:
+    for i in range(len(signals)):
+      signal_name = signals[i]
+      signal_names.append(signal_name.split('_')[0])
+      df[f'signal_base_{signal_name}'] = i
+      signal_bases.append(i)
+      plot_signal(
+        df=df, signal_x=signal_name, signal_y=f'signal_base_{signal_name}', 
+        title=title, use_ax=ax, trend_val=args['trend_val'], signal_val=args['signal_val'], plot_args=plot_args)
+
+  # legend and title
+  ax.set_ylim(ymin=min(signal_bases)-1 , ymax=max(signal_bases)+1)
+  ax.set_yticks(signal_bases)
+  ax.set_yticklabels(signal_names)
+  ax.legend().set_visible(False)
+
+# plot other indicators in a subplot of plot_multiple_indicators
+def subplot_indicator(df, ax, title, args, interval, plot_args):
+  """
+  Plot indicator(s) around a benchmark in a subplot
+
+  :param df: dataframe to plot
+  :param ax: the already-created ax to draw on
+  :param title: title of the subplot
+  :param args: arguments of the subplot (merged with default_subplot_args)
+  :param interval: interval of the data
+  :param plot_args: other plot arguments
+  :returns: none
+  :raises: none
+  """
+  plot_indicator(
+    df=df, target_col=args['target_col'], 
+    signal_x=args['signal_x'], signal_y=args['signal_y'], signal_val=args['signal_val'], 
+    plot_price_in_twin_ax=args['plot_price_in_twin_ax'], 
+    benchmark=args['benchmark'], boundary=args['boundary'], color_mode=args['color_mode'],
+    title=title, use_ax=ax, plot_args=plot_args, max_points=args['max_points'], minimal=args['minimal'], plot_lines=args['plot_lines'])
+
+# subplot functions for indicators in plot_multiple_indicators
+indicator_plotters = {
+  'main_indicators': subplot_main_indicators,
+  'aroon': lambda df, ax, title, args, interval, plot_args: plot_aroon(df=df, use_ax=ax, title=title, plot_args=plot_args),
+  'adx': lambda df, ax, title, args, interval, plot_args: plot_adx(df=df, use_ax=ax, title=title, plot_args=plot_args),
+  'volume': subplot_volume,
+  'renko': lambda df, ax, title, args, interval, plot_args: plot_renko(df, use_ax=ax, title=title, plot_args=default_plot_args, plot_in_date=args['plot_in_date'], minimal=args['minimal']),
+  'signals': subplot_signals,
+  'candle': subplot_signals,
+  'trend_idx': lambda df, ax, title, args, interval, plot_args: plot_up_down(df=df, col='trend_idx', use_ax=ax, title=title),
+  'score': lambda df, ax, title, args, interval, plot_args: plot_score(df=df, use_ax=ax, title=title, plot_args=plot_args),
+}
+
 # plot multiple indicators on a same chart
 def plot_multiple_indicators(df, args={}, start=None, end=None, interval='day', save_path=None, save_image=False, show_image=False, title=None, width=35, unit_size=3, wspace=0, hspace=0.015, subplot_args=default_plot_args):
   """
@@ -5973,18 +6756,11 @@ def plot_multiple_indicators(df, args={}, start=None, end=None, interval='day',
   
   # create axes for each indicator
   fig = plt.figure(figsize=(width, num_indicators*unit_size))  
-  gs = gridspec.GridSpec(num_indicators, 1, height_ratios=ratios)
-  gs.update(wspace=wspace, hspace=hspace)
-  axes = {}
+  # all axes share x with one shared group
+  axes = dict(zip(indicators, fig.subplots(num_indicators, 1, sharex=True, squeeze=False, gridspec_kw={'height_ratios': ratios, 'wspace': wspace, 'hspace': hspace})[:, 0]))
   for i in range(num_indicators):
     tmp_indicator = indicators[i]
-    tmp_args = args.get(tmp_indicator)
-    
-    # put the main_indicators at the bottom, share_x
-    if i == 0:
-      axes[tmp_indicator] = plt.subplot(gs[i]) 
-    else:
-      axes[tmp_indicator] = plt.subplot(gs[i], sharex=axes[indicators[0]])
+    tmp_args = {**default_subplot_args, **(args.get(tmp_indicator) or {})}
       
     # shows the x_ticklabels on the top at the first ax
     if i != 0: #i%2 == 0: # 
@@ -6003,100 +6779,9 @@ def plot_multiple_indicators(df, args={}, start=None, end=None, interval='day',
       else:
         axes[tmp_indicator].spines[position].set_alpha(spine_alpha)
 
-    # get extra arguments
-    target_col = tmp_args.get('target_col')
-    signal_y = tmp_args.get('signal_y')
-    signal_x = tmp_args.get('signal_x')
-    trend_val = tmp_args.get('trend_val')
-    signal_val = tmp_args.get('signal_val')
-    benchmark = tmp_args.get('benchmark')
-    boundary = tmp_args.get('boundary')
-    color_mode = tmp_args.get('color_mode')
-    plot_price_in_twin_ax = tmp_args.get('plot_price_in_twin_ax')
-    trend_val = trend_val if trend_val is not None else default_trend_val
-    signal_val = signal_val if signal_val is not None else default_signal_val
-    plot_price_in_twin_ax = plot_price_in_twin_ax if plot_price_in_twin_ax is not None else False
-
-    # plot ichimoku with candlesticks
-    if tmp_indicator == 'main_indicators':
-      # get candlestick width and color
-      candlestick_color = tmp_args.get('candlestick_color') if tmp_args.get('candlestick_color') is not None else default_candlestick_color
-      width = tmp_args.get('candlestick_width') if tmp_args.get('candlestick_width') is not None else 1
-      target_indicator = tmp_args.get('target_indicator') if tmp_args.get('target_indicator') is not None else ['price']
-
-      plot_main_indicators(
-        df=plot_data, target_indicator=target_indicator, interval=interval, candlestick_color=candlestick_color,
-        use_ax=axes[tmp_indicator], title=tmp_indicator, plot_args=subplot_args)
-
-    # plot aroon
-    elif tmp_indicator == 'aroon':
-      plot_aroon(df=plot_data, use_ax=axes[tmp_indicator], title=tmp_indicator, plot_args=subplot_args)
-
-    # plot adx
-    elif tmp_indicator == 'adx':
-      plot_adx(df=plot_data, use_ax=axes[tmp_indicator], title=tmp_indicator, plot_args=subplot_args)
-
-    # plot volume  
-    elif tmp_indicator == 'volume':
-      
-      alpha = tmp_args.get('alpha') if tmp_args.get('alpha') is not None else 1
-      
-      # set bar_width according to data interval
-      bar_width = 0.8
-      if interval == 'day':
-        bar_width = datetime.timedelta(days=1)
-      elif interval == 'week':
-        bar_width = datetime.timedelta(days=7)
-      elif interval == 'month':
-        bar_width = datetime.timedelta(days=30)
-      elif interval == 'year':
-        bar_width = datetime.timedelta(days=365)
-      else:
-        pass
-
-      plot_bar(df=plot_data, target_col=target_col, width=bar_width, alpha=alpha, color_mode=color_mode, benchmark=None, title=tmp_indicator, use_ax=axes[tmp_indicator], plot_args=default_plot_args)
-
-    # plot renko
-    elif tmp_indicator == 'renko':
-      plot_in_date = tmp_args.get('plot_in_date') if tmp_args.get('plot_in_date') is not None else True
-      plot_renko(plot_data, use_ax=axes[tmp_indicator], title=tmp_indicator, plot_args=default_plot_args, plot_in_date=plot_in_date)
-
-    # plot ta signals or candle patterns
-    elif tmp_indicator == 'signals' or tmp_indicator == 'candle':
-      signals = tmp_args.get('signal_list')
-      signal_bases = []
-      signal_names = []
-      if signals is not None:
-        for i in range(len(signals)):
-          signal_name = signals[i]
-          signal_names.append(signal_name.split('_')[0])
-          plot_data[f'signal_base_{signal_name}'] = i
-          signal_bases.append(i)
-          plot_signal(
-            df=plot_data, signal_x=signal_name, signal_y=f'signal_base_{signal_name}', 
-            title=tmp_indicator, use_ax=axes[tmp_indicator], trend_val=trend_val, signal_val=signal_val, plot_args=subplot_args)
-
-      # legend and title
-      plt.ylim(ymin=min(signal_bases)-1 , ymax=max(signal_bases)+1)
-      plt.yticks(signal_bases, signal_names)
-      axes[tmp_indicator].legend().set_visible(False)
-
-    # plot trend idx
-    elif tmp_indicator == 'trend_idx':
-      plot_up_down(df=plot_data, col='trend_idx', use_ax=axes[tmp_indicator], title=tmp_indicator)
-      
-    # plot score and trigger score
-    elif tmp_indicator == 'score':
-      plot_score(df=plot_data, use_ax=axes[tmp_indicator], title=tmp_indicator, plot_args=subplot_args)
-
-    # plot other indicators
-    else:
-      plot_indicator(
-        df=plot_data, target_col=target_col, 
-        signal_x=signal_x, signal_y=signal_y, signal_val=signal_val, 
-        plot_price_in_twin_ax=plot_price_in_twin_ax, 
-        benchmark=benchmark, boundary=boundary, color_mode=color_mode,
-        title=tmp_indicator, use_ax=axes[tmp_indicator], plot_args=subplot_args)
+    # plot indicator with its plotter, indicators without a specific plotter are plotted by plot_indicator
+    plotter = indicator_plotters.get(tmp_indicator, subplot_indicator)
+    plotter(df=plot_data, ax=axes[tmp_indicator], title=tmp_indicator, args=tmp_args, interval=interval, plot_args=subplot_args)
 
   # adjust plot layout
   max_idx = df.index.max()
@@ -6146,16 +6831,14 @@ def plot_multiple_indicators(df, args={}, start=None, end=None, interval='day',
   # save image
   if save_image and (save_path is not None):
     plt_save_name = save_path + title + '.png'
-    plt.savefig(plt_save_name, bbox_inches = 'tight')
+    fig.savefig(plt_save_name, bbox_inches = 'tight')
 
   # show image
   if show_image:
     plt.show()
 
-  # close figures
-  plt.cla()
-  plt.clf()
-  plt.close()
+  # close figure
+  plt.close(fig)
 
 # calculate ta indicators, trend and derivatives for historical data
 def plot_historical_evolution(df, symbol, interval, config, his_start_date=None, his_end_date=None, indicators=default_indicators, is_print=False, create_gif=False, plot_final=False, remove_origin=True, plot_save_path=None):
@@ -6209,7 +6892,7 @@ def plot_historical_evolution(df, symbol, interval, config, his_start_date=None,
     
     # calculate TA indicators
     phase = 'cal_ta_basic_features' 
-    df = calculate_ta_basic(df=df, indicators=indicators)
+    df = calculate_ta_basic(df=df, indicators=indicators, copy=False)
     
     # calculate TA trend
     phase = 'cal_ta_static_features'